@@ -0,0 +1,202 @@
+""" Random playouts that can't run forever.
+
+Some games, like Sparks and Sploof, can shuffle pieces back and forth or
+build up stock without reaching the end of the game. A CappedPlayout stops
+a simulation that repeats a position or runs too long, and scores it as a
+draw or with another heuristic's estimate. Games choose their limits with
+ShibumiGameState.max_playout_moves and is_playout_repetition_checked.
+"""
+
+import typing
+from enum import Enum
+
+import numpy as np
+
+from shibumi.shibumi_game_state import ShibumiGameState
+from zero_play.game_state import GameState
+from zero_play.heuristic import Heuristic
+from zero_play.playout import Playout
+
+
+class PlayoutEnd(Enum):
+    """ Why a simulation stopped. """
+    ENDED = 0
+    CAPPED = 1
+    REPEATED = 2
+
+
+class PlayoutState(GameState):
+    """ Wraps a game state during a capped simulation.
+
+    It reports the game as ended when the simulation hits one of the limits,
+    so Playout.simulate() stops there. Everything else passes through to
+    the wrapped state.
+    """
+    def __init__(self,
+                 state: GameState,
+                 playout: 'CappedPlayout',
+                 ends: typing.List[PlayoutEnd],
+                 move_count: int = 0,
+                 seen_keys: typing.Set[int] | None = None):
+        """ Initialize.
+
+        :param state: the game state to wrap
+        :param playout: the playout with the limits
+        :param ends: shared by all the states in a simulation, and gets the
+            reason that it stopped
+        :param move_count: the number of moves since the simulation started
+        :param seen_keys: hashes of the earlier states in the simulation, or
+            None if repetitions aren't checked
+        """
+        self.state = state
+        self.playout = playout
+        self.ends = ends
+        self.move_count = move_count
+        self.seen_keys = seen_keys
+        self.is_repeated = False
+
+    @property
+    def game_name(self) -> str:
+        return self.state.game_name
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, PlayoutState):
+            other = other.state
+        return self.state == other
+
+    def find_end(self) -> PlayoutEnd | None:
+        """ Decide why the simulation stops here, or None if it doesn't. """
+        if self.state.is_ended():
+            return PlayoutEnd.ENDED
+        if self.is_repeated:
+            return PlayoutEnd.REPEATED
+        max_moves = self.playout.max_moves
+        if max_moves is not None and self.move_count >= max_moves:
+            return PlayoutEnd.CAPPED
+        return None
+
+    def is_ended(self) -> bool:
+        return self.find_end() is not None
+
+    def get_valid_moves(self) -> np.ndarray:
+        return self.state.get_valid_moves()
+
+    def display(self, show_coordinates: bool = False) -> str:
+        return self.state.display(show_coordinates)
+
+    def display_move(self, move: int) -> str:
+        return self.state.display_move(move)
+
+    def get_move_count(self) -> int:
+        return self.state.get_move_count()
+
+    def parse_move(self, text: str) -> int:
+        return self.state.parse_move(text)
+
+    def get_active_player(self) -> int:
+        return self.state.get_active_player()
+
+    def make_move(self, move: int) -> 'PlayoutState':
+        new_state = PlayoutState(self.state.make_move(move),
+                                 self.playout,
+                                 self.ends,
+                                 self.move_count + 1,
+                                 self.seen_keys)
+        if self.seen_keys is not None:
+            key = hash(new_state.state)
+            new_state.is_repeated = key in self.seen_keys
+            self.seen_keys.add(key)
+        return new_state
+
+    def get_winner(self) -> int:
+        return self.state.get_winner()
+
+    def is_win(self, player: int) -> bool:
+        return self.state.is_win(player)
+
+
+class CappedPlayout(Playout):
+    def __init__(self,
+                 max_moves: int | None = None,
+                 is_repetition_checked: bool = False,
+                 capped_heuristic: Heuristic | None = None):
+        """ Initialize.
+
+        :param max_moves: the most moves to simulate before stopping, or None
+            for no limit.
+        :param is_repetition_checked: True if a simulation should stop when
+            it repeats a position, using the states' hashes.
+        :param capped_heuristic: scores the position where a simulation
+            stopped early, or None to score it as a draw.
+        """
+        self.max_moves = max_moves
+        self.is_repetition_checked = is_repetition_checked
+        self.capped_heuristic = capped_heuristic
+
+    @classmethod
+    def from_state(cls, state: ShibumiGameState) -> typing.Optional[
+            'CappedPlayout']:
+        """ Create a playout with a game's limits, or None if it has none. """
+        if (state.max_playout_moves is None and
+                not state.is_playout_repetition_checked):
+            return None
+        return cls(state.max_playout_moves,
+                   state.is_playout_repetition_checked)
+
+    def get_summary(self) -> typing.Sequence[str]:
+        summary = ['capped playout']
+        if self.max_moves is not None:
+            summary.append(f'max moves {self.max_moves}')
+        if self.is_repetition_checked:
+            summary.append('stop on repetition')
+        if self.capped_heuristic is not None:
+            summary.extend(self.capped_heuristic.get_summary())
+        return summary
+
+    def simulate(self, start_state: GameState) -> float:
+        """ Simulate the rest of a game by choosing random moves.
+
+        :param start_state: the game state to start the simulation at
+        :return: 1 if the start_state's active player won the game, -1 for a
+            loss, and 0 for a draw, or the capped heuristic's value if the
+            simulation stopped early.
+        """
+        value, _ = self.simulate_with_end(start_state)
+        return value
+
+    def simulate_with_end(
+            self,
+            start_state: GameState) -> typing.Tuple[float, PlayoutEnd]:
+        """ Simulate the rest of a game, and report why it stopped.
+
+        The reason comes back with each result, so callers can count capped
+        and repeated simulations, even when they run in other processes.
+        :param start_state: the game state to start the simulation at
+        :return: (value, end), where value is the same as simulate() returns
+        """
+        ends: typing.List[PlayoutEnd] = []
+        seen_keys = {hash(start_state)} if self.is_repetition_checked else None
+        playout_state = PlayoutState(start_state, self, ends, seen_keys=seen_keys)
+        value = super().simulate(playout_state)
+        return value, ends[-1]
+
+    def analyse_end_game(self,
+                         board: GameState) -> typing.Tuple[float, np.ndarray]:
+        if not isinstance(board, PlayoutState):
+            return super().analyse_end_game(board)
+        end = board.find_end()
+        assert end is not None
+        board.ends.append(end)
+        if end == PlayoutEnd.ENDED:
+            return super().analyse_end_game(board.state)
+        return self.score_capped(board.state), self.create_even_policy(board)
+
+    def score_capped(self, state: GameState) -> float:
+        """ Score a simulation that stopped before the end of the game.
+
+        :return: the value for the state's active player
+        """
+        if self.capped_heuristic is None:
+            return 0
+        value, _ = self.capped_heuristic.analyse(state)
+        return value
@@ -2,6 +2,8 @@ from shibumi.spargo.game import SpargoState
 
 
 class MargoState(SpargoState):
+    __slots__ = ()
+
     def __init__(self,
                  text: str | None = None,
                  size: int = 6):
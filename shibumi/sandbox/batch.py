@@ -0,0 +1,72 @@
+import numpy as np
+
+from shibumi.sandbox.game import SandboxState
+from shibumi.shibumi_batch import ShibumiBatch
+
+
+class SandboxBatch(ShibumiBatch):
+    """ Batch of Sandbox boards, where anyone can add or remove any piece. """
+    state_class = SandboxState
+
+    def get_winners(self) -> np.ndarray:
+        return np.full(len(self), SandboxState.NO_PLAYER)
+
+    def get_valid_moves(self) -> np.ndarray:
+        volume = self.topology.volume
+        occupied = self.occupied
+        open_positions = self.find_open_positions()
+        valid_moves = np.zeros((len(self), volume * 4), bool)
+        for section in range(3):
+            valid_moves[:, section*volume:(section+1)*volume] = open_positions
+
+        # Removal section: pieces that aren't supporting more than one other.
+        supported_counts = self.pad(occupied)[:, self.topology.supported].sum(
+            axis=2)
+        valid_moves[:, volume*3:] = occupied & (supported_counts <= 1)
+        return valid_moves
+
+    def make_moves(self, moves: np.ndarray) -> 'SandboxBatch':
+        volume = self.topology.volume
+        pieces = self.pieces.copy()
+        board_indexes = np.flatnonzero(moves != self.NO_MOVE)
+        board_moves = moves[board_indexes]
+        sections = board_moves // volume
+        positions = board_moves % volume
+        is_added = sections < 3
+        pieces[board_indexes[is_added], :, positions[is_added]] = False
+        pieces[board_indexes[is_added],
+               sections[is_added],
+               positions[is_added]] = True
+        self.remove_pieces(pieces,
+                           board_indexes[~is_added],
+                           positions[~is_added])
+        return SandboxBatch(pieces, self.size)
+
+    def remove_pieces(self,
+                      pieces: np.ndarray,
+                      board_indexes: np.ndarray,
+                      positions: np.ndarray):
+        """ Remove a piece from each board, like ShibumiGameState.remove().
+
+        If a piece is above the removed one, it drops down into the space,
+        and so on up the pyramid.
+        :param pieces: the batch's pieces, changed in place
+        :param board_indexes: the boards to remove pieces from
+        :param positions: the position to remove on each board
+        """
+        supported = self.topology.supported
+        while board_indexes.size:
+            occupied = self.pad(pieces[board_indexes].any(axis=1))
+            above = supported[positions]
+            is_above_occupied = occupied[np.arange(len(board_indexes))[:, None],
+                                         above]
+            has_above = is_above_occupied.any(axis=1)
+            # Take the first piece above, in the same order as remove().
+            upper_positions = above[np.arange(len(board_indexes)),
+                                    is_above_occupied.argmax(axis=1)]
+            pieces[board_indexes, :, positions] = np.where(
+                has_above[:, None],
+                pieces[board_indexes, :, upper_positions % self.topology.volume],
+                False)
+            board_indexes = board_indexes[has_above]
+            positions = upper_positions[has_above]
@@ -2,11 +2,14 @@ from copy import copy
 
 import numpy as np
 
-from shibumi.shibumi_game_state import ShibumiGameState, MoveType
+from shibumi.shibumi_game_state import (ShibumiGameState, MoveType,
+                                         cached_result)
 
 
 class SandboxState(ShibumiGameState):
     game_name = 'Sandbox'
+    __slots__ = ()
+    move_section_count = 4
 
     def is_win(self, player: int) -> bool:
         return False
@@ -16,7 +19,6 @@ class SandboxState(ShibumiGameState):
 
     def make_move(self, move: int) -> 'ShibumiGameState':
         new_state = copy(self)
-        levels = new_state.levels
         volume = self.calculate_volume(self.size)
         player = [self.BLACK,
                   self.WHITE,
@@ -25,13 +27,12 @@ class SandboxState(ShibumiGameState):
         position_index = move % volume
         height, row, column = self.get_coordinates(position_index)
         if player != self.NO_PLAYER:
-            piece_type = self.piece_types.index(player)
-            levels[piece_type, height, row, column] = 1
-            new_state.levels = levels
+            new_state.set_piece(height, row, column, player)
         else:
             new_state.remove(height, row, column)
         return new_state
 
+    @cached_result
     def get_valid_moves(self) -> np.ndarray:
         valid_spaces = super().get_valid_moves()
         volume = self.calculate_volume(self.size)
@@ -39,18 +40,10 @@ class SandboxState(ShibumiGameState):
         for section in range(3):
             valid_moves[section*volume:(section+1)*volume] = valid_spaces
 
-        # Removal section
+        # Removal section: any piece that isn't pinned by the ones above it.
         section_start = volume*3
-        levels = self.levels
-        for move_index in range(volume):
-            height, row, column = self.get_coordinates(move_index)
-            existing_piece = levels[:, height, row, column]
-            if existing_piece.sum() == 0:
-                is_valid = False
-            else:
-                # Piece found, see if it's supporting any neighbours above.
-                is_valid = not self.is_pinned(height, row, column)
-            valid_moves[section_start+move_index] = is_valid
+        valid_moves[section_start:] = (self.get_occupancy()[:volume] &
+                                       ~self.get_pinned_mask())
         return valid_moves
 
     def get_index(self,
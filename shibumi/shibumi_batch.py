@@ -0,0 +1,168 @@
+""" Play many games of the same kind at once with numpy arrays.
+
+A batch holds N boards of the same game and size as one array, and checks
+moves or makes them for all the boards with a few array operations, instead
+of a Python call for each state. That's useful for running lots of random
+playouts or self-play games in one process. Only games with local rules are
+supported so far: see the batch module in each game's package.
+"""
+
+import typing
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from shibumi.shibumi_game_state import ShibumiGameState
+from shibumi.shibumi_topology import ShibumiTopology
+
+
+class ShibumiBatch(ABC):
+    """ A batch of boards for the same game and size.
+
+    Pieces are an array of flags, indexed by [board, piece_type, position],
+    where positions are numbered like ShibumiGameState.get_index(). Batches
+    are never changed after they're created, so make_moves() returns a new
+    batch.
+    """
+    state_class: typing.Type[ShibumiGameState]
+    piece_types: typing.Tuple[int, ...] = (ShibumiGameState.BLACK,
+                                          ShibumiGameState.WHITE,
+                                          ShibumiGameState.RED)
+    NO_MOVE = -1
+
+    def __init__(self, pieces: np.ndarray, size: int = 4):
+        """ Initialize a batch.
+
+        :param pieces: an array of flags with shape
+            (board_count, piece_type_count, volume)
+        :param size: the size of the bottom level on each board
+        """
+        self.size = size
+        self.topology = ShibumiTopology.get(size)
+        self.pieces = pieces
+
+    def __len__(self):
+        return len(self.pieces)
+
+    @classmethod
+    def create(cls, board_count: int, size: int = 4) -> 'ShibumiBatch':
+        """ Create a batch of empty boards. """
+        volume = ShibumiTopology.get(size).volume
+        pieces = np.zeros((board_count, len(cls.piece_types), volume), bool)
+        return cls(pieces, size)
+
+    @classmethod
+    def from_states(cls,
+                    states: typing.Sequence[ShibumiGameState]) -> 'ShibumiBatch':
+        """ Create a batch from game states with the same size. """
+        size = states[0].size
+        volume = ShibumiTopology.get(size).volume
+        pieces = np.array([[state.unpack_bitboard(bitboard, volume)
+                            for bitboard in state.bitboards]
+                           for state in states],
+                          bool).reshape(len(states),
+                                        len(cls.piece_types),
+                                        volume)
+        return cls(pieces, size)
+
+    def create_state(self, board_index: int) -> ShibumiGameState:
+        """ Create an empty game state with any extra details for a board. """
+        return self.state_class(size=self.size)  # type: ignore
+
+    def get_state(self, board_index: int) -> ShibumiGameState:
+        """ Convert one board in the batch to a game state. """
+        state = self.create_state(board_index)
+        flat_levels = np.zeros((len(self.piece_types), self.size ** 3),
+                               np.uint8)
+        flat_levels[:, self.topology.cube_indexes] = self.pieces[board_index]
+        state.levels = flat_levels.reshape(len(self.piece_types),
+                                           self.size,
+                                           self.size,
+                                           self.size)
+        return state
+
+    def to_states(self) -> typing.List[ShibumiGameState]:
+        return [self.get_state(i) for i in range(len(self))]
+
+    @property
+    def occupied(self) -> np.ndarray:
+        """ Flags for the spaces that hold any type of piece.
+
+        :return: an array indexed by [board, position]
+        """
+        return np.logical_or.reduce(self.pieces, axis=1)
+
+    def pad(self, flags: np.ndarray, padding: bool = False) -> np.ndarray:
+        """ Add an extra position to each board for the topology padding. """
+        return np.pad(flags, ((0, 0), (0, 1)), constant_values=padding)
+
+    def find_open_positions(self) -> np.ndarray:
+        """ Find the empty positions that are supported on each board.
+
+        :return: an array of flags indexed by [board, position]
+        """
+        occupied = self.occupied
+        # The bottom level has nothing but padding under it.
+        supports = self.pad(occupied, padding=True)[:, self.topology.supporting]
+        return supports.all(axis=2) & ~occupied
+
+    def find_piece_types(self, players: np.ndarray) -> np.ndarray:
+        """ Convert player codes to piece type indexes. """
+        piece_types = np.zeros(players.shape, int)
+        for piece_type, player in enumerate(self.piece_types):
+            piece_types[players == player] = piece_type
+        return piece_types
+
+    @abstractmethod
+    def get_valid_moves(self) -> np.ndarray:
+        """ Find the valid moves on each board.
+
+        :return: an array of flags indexed by [board, move], with moves
+            numbered the same way as the state class.
+        """
+
+    @abstractmethod
+    def make_moves(self, moves: np.ndarray) -> 'ShibumiBatch':
+        """ Make one move on each board.
+
+        :param moves: a move for each board, or NO_MOVE to leave it alone
+        :return: a new batch with the moves made
+        """
+
+    @abstractmethod
+    def get_winners(self) -> np.ndarray:
+        """ Find the player that won on each board, or NO_PLAYER. """
+
+    def is_ended(self) -> np.ndarray:
+        """ Find the boards where the game is over. """
+        return ((self.get_winners() != ShibumiGameState.NO_PLAYER) |
+                ~self.get_valid_moves().any(axis=1))
+
+    def choose_random_moves(self, random: np.random.Generator) -> np.ndarray:
+        """ Pick one of the valid moves on each board, or NO_MOVE if none. """
+        valid_moves = self.get_valid_moves()
+        scores = random.random(valid_moves.shape)
+        scores[~valid_moves] = -1
+        moves = scores.argmax(axis=1)
+        moves[~valid_moves.any(axis=1)] = self.NO_MOVE
+        return moves
+
+    def play_random_games(self,
+                          random: np.random.Generator,
+                          max_moves: int = 1000) -> 'ShibumiBatch':
+        """ Make random moves on every board until all the games are over.
+
+        :param random: source of random numbers
+        :param max_moves: limit on the moves for each board, in case the
+            game never ends.
+        :return: the final batch
+        """
+        batch = self
+        for _ in range(max_moves):
+            moves = batch.choose_random_moves(random)
+            moves[batch.get_winners() != ShibumiGameState.NO_PLAYER] = (
+                self.NO_MOVE)
+            if (moves == self.NO_MOVE).all():
+                break
+            batch = batch.make_moves(moves)
+        return batch
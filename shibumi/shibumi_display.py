@@ -9,10 +9,15 @@ from PySide6.QtGui import QImage, QPixmap, QFont, QResizeEvent, QPainter
 from PySide6.QtWidgets import (QGraphicsPixmapItem, QGraphicsSceneHoverEvent,
                                QGraphicsSceneMouseEvent, QGraphicsScene)
 
+from shibumi.capped_playout import CappedPlayout
 from shibumi.shibumi_display_ui import Ui_ShibumiDisplay
 from shibumi.shibumi_game_state import ShibumiGameState, MoveType, PlayerCode
+from shibumi.transposition_table import (TranspositionSearchManager,
+                                         TranspositionTable)
 from zero_play.game_display import GameDisplay, center_text_item
 from zero_play.game_state import GameState
+from zero_play.mcts_player import MctsPlayer
+from zero_play.playout import Playout
 from shibumi import shibumi_images_rc
 from shibumi import shibumi_rules_rc
 
@@ -111,6 +116,22 @@ class ShibumiDisplay(GameDisplay):
         self.show_counts = False
         self.show_move_types = False
         self.debug_message = ''
+        self.transposition_table = TranspositionTable()
+
+    @GameDisplay.mcts_players.setter  # type: ignore
+    def mcts_players(self, players: typing.Sequence[MctsPlayer]):
+        # Stop the old workers first, so they can't write to the table after
+        # it's cleared. The new workers don't search until a move is needed,
+        # but installing their search managers adds the start position.
+        GameDisplay.mcts_players.fset(self, players)  # type: ignore
+
+        # Both players search the same game, so they can share results.
+        self.transposition_table.clear()
+        capped_playout = CappedPlayout.from_state(self.start_state)
+        for player in players:
+            if capped_playout is not None and type(player.heuristic) is Playout:
+                player.heuristic = capped_playout
+            TranspositionSearchManager.install(player, self.transposition_table)
 
     @property
     def visible_counts(self) -> typing.Iterable[PlayerCode]:
@@ -301,16 +322,19 @@ class ShibumiDisplay(GameDisplay):
             move_type = self.selected_move_type
         else:
             move_type = MoveType.BLACK
+        # The first position's move shows where this move type's section
+        # starts, and the rest follow in the same order as the positions.
+        section_start = game_state.get_index(0, 0, 0, move_type)
+        move_indexes = (game_state.topology.position_indexes +
+                        section_start).tolist()
         state_levels = np.moveaxis(game_state.levels, 0, 3)
         for level, item_level in zip(state_levels,
                                      self.item_levels):
             for row_pieces, row_items in zip(level, item_level):
                 piece_item: GraphicsShibumiPieceItem
                 for piece_flags, piece_item in zip(row_pieces, row_items):
-                    move_index = game_state.get_index(piece_item.height,
-                                                      piece_item.row,
-                                                      piece_item.column,
-                                                      move_type)
+                    move_index = move_indexes[piece_item.height][
+                        piece_item.row][piece_item.column]
                     is_valid = valid_moves[move_index] and not is_ended
                     piece_item.setVisible(bool(piece_flags.sum() != 0 or
                                                is_valid))
@@ -1,13 +1,14 @@
+import functools
+import struct
 from copy import copy
 
-import math
 from abc import ABC
 from enum import IntEnum
-import functools
 
 import numpy as np
 import typing
 
+from shibumi.shibumi_topology import ShibumiTopology
 from zero_play.game_state import GameState
 
 
@@ -26,7 +27,65 @@ class MoveType(IntEnum):
     REMOVE = 3
 
 
+def mix_hash(value: int) -> int:
+    """ Scramble an integer into a well distributed 64-bit hash.
+
+    This is the finalizer from the SplitMix64 random number generator.
+    """
+    value = (value + 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+    return value ^ (value >> 31)
+
+
+def cached_result(method: typing.Callable) -> typing.Callable:
+    """ Remember a method's result on the state, the first time it's called.
+
+    States don't change after make_move() returns them, so the result never
+    has to be recalculated. Array results are shared, so they're marked read
+    only. Methods that do change a state are marked with changes_state().
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args):
+        results = self._results
+        if results is None:
+            results = self._results = {}
+        key = (wrapper, *args)
+        try:
+            return results[key]
+        except KeyError:
+            pass
+        result = method(self, *args)
+        if isinstance(result, np.ndarray):
+            result.flags.writeable = False
+        results[key] = result
+        return result
+    return wrapper
+
+
+def changes_state(method: typing.Callable) -> typing.Callable:
+    """ Mark a method that changes the state, and clear cached results.
+
+    These are for building a new state in make_move(), or setting up a
+    position, before anything asks for its results.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self._results = None
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
 class ShibumiGameState(GameState, ABC):
+    # Subclasses must declare all their attributes in __slots__, so __copy__()
+    # can find them.
+    __slots__ = ('size',
+                 'topology',
+                 'bitboards',
+                 'board_key',
+                 '_occupancy',
+                 '_open_positions',
+                 '_results')
     FIRST_COLUMN_ORD = ord('A')
     RED = int(PlayerCode.RED)
     WHITE = int(PlayerCode.WHITE)
@@ -40,16 +99,40 @@ class ShibumiGameState(GameState, ABC):
                           UNUSABLE: ' '}
     usable_positions_by_size: typing.Dict[int, np.ndarray] = {}
 
+    # Games with more than one type of move split their moves into sections,
+    # with one move for each position in each section. See get_index().
+    move_section_count = 1
+
+    # Change this whenever the layout of to_bytes() changes, so old data can't
+    # be loaded as the wrong state.
+    SERIAL_VERSION = 1
+    # Version, board size, and number of serial state values.
+    SERIAL_HEADER = struct.Struct('<BBB')
+
+    # Set this to recalculate the open positions from scratch and compare them
+    # with the ones that set_piece() keeps up to date.
+    check_open_positions = False
+
+    # Games that might not end in random play can limit how long a playout
+    # runs, or stop it when it repeats a position. See CappedPlayout.
+    max_playout_moves: int | None = None
+    is_playout_repetition_checked = False
+
     def __init__(self,
                  text: str | None = None,
                  levels: np.ndarray | None = None,
                  size: int = 4):
         self.size = size
+        self.topology = ShibumiTopology.get(size)
+        # One bitboard per piece type, with bits numbered like get_index().
+        self.bitboards: typing.Tuple[int, ...] = (0,) * len(self.piece_types)
+        # Zobrist key of the pieces on the board, updated with each change.
+        self.board_key = 0
+        self._occupancy: np.ndarray | None = None
+        self._open_positions: int | None = None
+        # Results from cached_result() methods, by method and arguments.
+        self._results: typing.Dict[tuple, typing.Any] | None = None
         if levels is None:
-            type_count = len(self.piece_types)
-            packed = np.zeros(math.ceil(size * size * size * type_count / 8),
-                              dtype=np.uint8)
-            self.packed = packed
             if text is None:
                 return
             levels = self.levels
@@ -57,20 +140,192 @@ class ShibumiGameState(GameState, ABC):
             self.load_text(text, levels)
         self.levels = levels
 
+    def __copy__(self):
+        """ Copy all the attributes into a new state.
+
+        The bitboards are an immutable tuple, so the copy shares them until
+        set_piece() replaces them in one state or the other. The copy is
+        about to change, so it doesn't share the cached results.
+        """
+        state_class = type(self)
+        new_state = state_class.__new__(state_class)
+        for name in self.find_slot_names(state_class):
+            setattr(new_state, name, getattr(self, name))
+        new_state._results = None
+        return new_state
+
+    def set_cached_result(self,
+                          method: typing.Callable,
+                          result: typing.Any,
+                          *args):
+        """ Fill in a cached_result() method's result that's already known.
+
+        :param method: the method from the class, like SplineState.is_win
+        :param result: the value the method would return
+        :param args: the arguments the method would be called with
+        """
+        results = self._results
+        if results is None:
+            results = self._results = {}
+        results[(method, *args)] = result
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def find_slot_names(state_class: type) -> typing.Tuple[str, ...]:
+        """ Find the attribute names declared by a class and its parents. """
+        return tuple(name
+                     for parent_class in state_class.__mro__
+                     for name in parent_class.__dict__.get('__slots__', ()))
+
     @property
     def piece_types(self):
         return self.BLACK, self.WHITE, self.RED
 
     @property
     def levels(self) -> np.ndarray:
-        type_count = len(self.piece_types)
-        trimmed_size = self.size * self.size * self.size * type_count
-        trimmed = np.unpackbits(self.packed)[:trimmed_size]
-        return trimmed.reshape(type_count, self.size, self.size, self.size)
+        """ Compatibility view of the bitboards as a 4-dimensional array.
+
+        The array is indexed by [piece_type, height, row, column]. It's a new
+        copy each time, so any changes must be assigned back to levels.
+        """
+        size = self.size
+        type_count = len(self.bitboards)
+        topology = self.topology
+        levels = np.zeros((type_count, size * size * size), np.uint8)
+        for piece_type, bitboard in enumerate(self.bitboards):
+            levels[piece_type, topology.cube_indexes] = self.unpack_bitboard(
+                bitboard,
+                topology.volume)
+        return levels.reshape(type_count, size, size, size)
 
     @levels.setter
-    def levels(self, levels):
-        self.packed = np.packbits(levels)
+    @changes_state
+    def levels(self, levels: np.ndarray):
+        size = self.size
+        cube_indexes = self.topology.cube_indexes
+        flat_levels = levels.reshape(len(levels), size * size * size)
+        self.bitboards = tuple(
+            self.pack_bitboard(flat_levels[piece_type, cube_indexes])
+            for piece_type in range(len(levels)))
+        self.board_key = self.topology.calculate_board_key(self.bitboards)
+        self._occupancy = None
+        self._open_positions = None
+
+    @staticmethod
+    def unpack_bitboard(bitboard: int, volume: int) -> np.ndarray:
+        """ Convert a bitboard to an array of flags, one for each position. """
+        byte_count = (volume + 7) // 8
+        packed = np.frombuffer(bitboard.to_bytes(byte_count, 'little'),
+                               np.uint8)
+        return np.unpackbits(packed, count=volume, bitorder='little')
+
+    @staticmethod
+    def pack_bitboard(flags: np.ndarray) -> int:
+        """ Convert an array of flags, one for each position, to a bitboard. """
+        packed = np.packbits(flags != 0, bitorder='little')
+        return int.from_bytes(packed.tobytes(), 'little')
+
+    def get_position_index(self, height: int, row: int, column: int) -> int:
+        """ Index of a position, also its bit number in the bitboards.
+
+        Always a Python int, even if the coordinates came from numpy, because
+        shifting a numpy integer would overflow the bitboards.
+        """
+        level_start = self.topology.level_starts[height]
+        return int(level_start + row * (self.size - height) + column)
+
+    @property
+    def occupied(self) -> int:
+        """ Bitboard of all the spaces that hold any type of piece. """
+        occupied = 0
+        for bitboard in self.bitboards:
+            occupied |= bitboard
+        return occupied
+
+    def get_occupancy(self) -> np.ndarray:
+        """ Get the occupancy vector for the topology tables.
+
+        :return: an array of flags, True for each position that holds a piece,
+            plus a False entry at the end. Don't change it, because it's
+            shared until the board changes.
+        """
+        if self._occupancy is None:
+            self._occupancy = self.topology.unpack_occupancy(self.occupied)
+        return self._occupancy
+
+    def is_occupied(self, height: int, row: int, column: int) -> bool:
+        bit = 1 << self.get_position_index(height, row, column)
+        return bool(self.occupied & bit)
+
+    def is_supported(self, height: int, row: int, column: int) -> bool:
+        position_index = self.get_position_index(height, row, column)
+        support_mask = self.topology.support_masks[position_index]
+        return self.occupied & support_mask == support_mask
+
+    def get_piece(self, height: int, row: int, column: int) -> int:
+        """ Find which piece is in a space.
+
+        :return: the piece's player code, or NO_PLAYER if the space is empty
+        """
+        bit = 1 << self.get_position_index(height, row, column)
+        for piece_type, bitboard in enumerate(self.bitboards):
+            if bitboard & bit:
+                return self.piece_types[piece_type]
+        return self.NO_PLAYER
+
+    @changes_state
+    def set_piece(self, height: int, row: int, column: int, piece: int):
+        """ Put a piece in a space, or clear the space with NO_PLAYER.
+
+        This changes the state, so only call it on a new copy.
+        """
+        position_index = self.get_position_index(height, row, column)
+        bit = 1 << position_index
+        if piece == self.NO_PLAYER:
+            piece_type = -1
+        else:
+            piece_type = self.piece_types.index(piece)
+        topology = self.topology
+        zobrist_keys = topology.zobrist_keys
+        board_key = self.board_key
+        was_occupied = False
+        occupied = 0
+        new_bitboards = []
+        for i, bitboard in enumerate(self.bitboards):
+            if bitboard & bit:
+                board_key ^= zobrist_keys[i][position_index]
+                was_occupied = True
+            if i == piece_type:
+                board_key ^= zobrist_keys[i][position_index]
+                bitboard |= bit
+            else:
+                bitboard &= ~bit
+            new_bitboards.append(bitboard)
+            occupied |= bitboard
+        self.bitboards = tuple(new_bitboards)
+        self.board_key = board_key
+        if was_occupied != (piece_type >= 0):
+            self._update_open_positions(position_index, occupied)
+        self._occupancy = None
+
+    def _update_open_positions(self, position_index: int, occupied: int):
+        """ Update the open positions after one position was filled or emptied.
+
+        :param position_index: the position that changed
+        :param occupied: bitboard of the occupied spaces after the change
+        """
+        open_positions = self._open_positions
+        if open_positions is None:
+            return
+        # Only this position and the ones above it can change.
+        for update_bit, support_mask in self.topology.support_updates[
+                position_index]:
+            if (occupied & support_mask == support_mask and
+                    not occupied & update_bit):
+                open_positions |= update_bit
+            else:
+                open_positions &= ~update_bit
+        self._open_positions = open_positions
 
     @property
     def spaces(self) -> np.ndarray:
@@ -92,7 +347,153 @@ class ShibumiGameState(GameState, ABC):
     def __eq__(self, other):
         if not isinstance(other, ShibumiGameState):
             return False
-        return np.array_equal(self.levels, other.levels)
+        return (self.size == other.size and
+                self.bitboards == other.bitboards and
+                self.get_extra_state() == other.get_extra_state())
+
+    def __hash__(self):
+        return self.zobrist_key
+
+    def get_extra_state(self) -> typing.Tuple[int, ...]:
+        """ Game details that aren't on the board, but still affect play.
+
+        Games that track more than the active player should override this.
+        It's included in equality checks and the Zobrist key.
+        """
+        return int(self.get_active_player()),
+
+    def transform_extra_state(
+            self,
+            position_map: typing.Sequence[int]) -> typing.Tuple[int, ...]:
+        """ Find the extra state after moving all the pieces.
+
+        Games with positions in their extra state should override this to
+        move them the same way as the pieces.
+        :param position_map: the new position index for each position index
+        """
+        return self.get_extra_state()
+
+    def transform(self,
+                  position_map: typing.Sequence[int]) -> 'ShibumiGameState':
+        """ Move all the pieces, to rotate or reflect the board.
+
+        Games with positions in their other attributes should override this to
+        move them the same way as the pieces.
+        :param position_map: the new position index for each position index
+        :return: a new state
+        """
+        new_state = copy(self)
+        new_bitboards = []
+        for bitboard in self.bitboards:
+            new_bitboard = 0
+            while bitboard:
+                position_index = (bitboard & -bitboard).bit_length() - 1
+                bitboard &= bitboard - 1
+                new_bitboard |= 1 << position_map[position_index]
+            new_bitboards.append(new_bitboard)
+        new_state.bitboards = tuple(new_bitboards)
+        new_state.board_key = self.topology.calculate_board_key(
+            new_state.bitboards)
+        new_state._occupancy = None
+        new_state._open_positions = None
+        return new_state
+
+    def get_serial_state(self) -> typing.Tuple[int, ...]:
+        """ Values that to_bytes() stores along with the board.
+
+        Games with attributes that aren't in the extra state should override
+        this and set_serial_state().
+        """
+        return self.get_extra_state()
+
+    def set_serial_state(self, serial_state: typing.Sequence[int]):
+        """ Set the attributes from get_serial_state() on a new state.
+
+        The state was made without calling __init__(), so this must set all
+        the game's attributes.
+        """
+
+    def to_bytes(self) -> bytes:
+        """ Pack the state into a few bytes, for storage or other processes.
+
+        The header has the version, board size, and number of serial state
+        values. Then each bitboard takes enough bytes for one bit per
+        position, and each serial state value takes two bytes.
+        """
+        serial_state = self.get_serial_state()
+        byte_count = (self.topology.volume + 7) // 8
+        chunks = [self.SERIAL_HEADER.pack(self.SERIAL_VERSION,
+                                          self.size,
+                                          len(serial_state))]
+        chunks.extend(bitboard.to_bytes(byte_count, 'little')
+                      for bitboard in self.bitboards)
+        chunks.append(struct.pack(f'<{len(serial_state)}h', *serial_state))
+        return b''.join(chunks)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'ShibumiGameState':
+        """ Unpack a state from to_bytes(). """
+        state, end = cls.read_bytes(data)
+        if end != len(data):
+            raise ValueError(f'Expected {end} bytes, found {len(data)}.')
+        return state
+
+    @classmethod
+    def read_bytes(cls,
+                   data: bytes) -> typing.Tuple['ShibumiGameState', int]:
+        """ Unpack a state from the start of some bytes.
+
+        :return: (state, end), where end is the index after the state's bytes
+        """
+        header = cls.SERIAL_HEADER
+        version, size, serial_count = header.unpack_from(data)
+        if version != cls.SERIAL_VERSION:
+            raise ValueError(f'Unknown serial version: {version}.')
+        state = cls.__new__(cls)
+        ShibumiGameState.__init__(state, size=size)
+        byte_count = (state.topology.volume + 7) // 8
+        start = header.size
+        bitboards = []
+        for _ in state.bitboards:
+            end = start + byte_count
+            bitboards.append(int.from_bytes(data[start:end], 'little'))
+            start = end
+        end = start + 2*serial_count
+        serial_state = struct.unpack(f'<{serial_count}h', data[start:end])
+        state.bitboards = tuple(bitboards)
+        state.board_key = state.topology.calculate_board_key(state.bitboards)
+        state.set_serial_state(serial_state)
+        return state, end
+
+    def __reduce__(self):
+        """ Pickle states as their bytes, from to_bytes(). """
+        return type(self).from_bytes, (self.to_bytes(),)
+
+    @property
+    def zobrist_key(self) -> int:
+        """ 64-bit hash of the board and the extra state. """
+        return self.calculate_zobrist_key(self.board_key,
+                                          self.get_extra_state())
+
+    @property
+    def transposition_key(self) -> int:
+        """ Hash of everything that affects search results for this state.
+
+        Games with rules that depend on earlier positions should add them.
+        """
+        return self.zobrist_key
+
+    @staticmethod
+    def calculate_zobrist_key(board_key: int,
+                              extra_state: typing.Sequence[int]) -> int:
+        """ Combine a board's Zobrist key with the extra state.
+
+        Useful for finding a new state's key without making the new state.
+        """
+        key = board_key
+        for i, value in enumerate(extra_state):
+            key ^= mix_hash(i << 32 | (int(value) & 0xFFFFFFFF))
+        return key
 
     def load_text(self, text: str, levels: np.ndarray):
         character_players = {
@@ -124,6 +525,7 @@ class ShibumiGameState(GameState, ABC):
                         levels[piece_type, height, i, j] = 1
             lines = lines[level_size*2 + 1:]
 
+    @cached_result
     def get_valid_moves(self) -> np.ndarray:
         piece_count = self.calculate_volume(self.size)
         valid_moves = np.full(piece_count, False)
@@ -133,32 +535,70 @@ class ShibumiGameState(GameState, ABC):
         self.fill_supported_moves(valid_moves)
         return valid_moves
 
+    @cached_result
+    def is_ended(self) -> bool:
+        return super().is_ended()
+
+    @cached_result
+    def get_winner(self) -> int:
+        return super().get_winner()
+
     def fill_supported_moves(self, valid_moves: np.ndarray):
         """ Mark any moves that are supported by the board or other pieces.
 
         :param valid_moves: an array of boolean flags - will be set to True for
             each space that is supported
         """
-        levels = self.levels
-        piece_index = 0
-        for height in range(self.size):
-            level_size = self.size - height
+        volume = self.calculate_volume(self.size)
+        valid_moves[:volume] = self.unpack_bitboard(self.get_open_positions(),
+                                                    volume)
+
+    def get_open_positions(self) -> int:
+        """ Find the empty positions that are supported.
+
+        The first call calculates them from the whole board, then set_piece()
+        updates them for each change, and copies carry them forward.
+        :return: a bitboard of the positions where a piece could be added
+        """
+        open_positions = self._open_positions
+        if open_positions is None or self.check_open_positions:
+            expected_positions = self.get_supported_positions() & ~self.occupied
+            if open_positions is None:
+                open_positions = self._open_positions = expected_positions
+            elif open_positions != expected_positions:
+                raise RuntimeError(
+                    f'Open positions were {open_positions:#x}, but should be '
+                    f'{expected_positions:#x}:\n{self.display()}')
+        return open_positions
+
+    def get_supported_positions(self) -> int:
+        """ Find all the positions that are supported, whether empty or not.
+
+        :return: a bitboard with the whole bottom level, plus any spaces on
+            higher levels that have all four spaces below them filled.
+        """
+        size = self.size
+        occupied = self.occupied
+        level_starts = self.topology.level_starts
+        supported = (1 << (size * size)) - 1
+        for height in range(1, size):
+            level_size = size - height
+            below_size = level_size + 1
+            below = occupied >> level_starts[height - 1]
+            # Bit row*below_size + column is set when all four spaces under
+            # (row, column) are filled.
+            corners = (below &
+                       (below >> 1) &
+                       (below >> below_size) &
+                       (below >> (below_size + 1)))
+            row_mask = (1 << level_size) - 1
+            level_start = level_starts[height]
             for row in range(level_size):
-                for column in range(level_size):
-                    if height == 0:
-                        is_supported = True
-                    else:
-                        below_height = height - 1
-                        is_supported = all(
-                            levels[:, below_height, lower_row, lower_column].sum() != 0
-                            for lower_row in range(row, row + 2)
-                            for lower_column in range(column, column + 2))
-                    is_valid = is_supported and levels[:, height, row, column].sum() == 0
-                    valid_moves[piece_index] = is_valid
-                    piece_index += 1
+                row_supported = (corners >> (row * below_size)) & row_mask
+                supported |= row_supported << (level_start + row * level_size)
+        return supported
 
     @staticmethod
-    @functools.lru_cache(maxsize=None)
     def find_possible_neighbours(
             size: int,
             height: int,
@@ -166,29 +606,12 @@ class ShibumiGameState(GameState, ABC):
             column: int,
             dh_start: int = -1,
             dh_end: int = 2) -> typing.Tuple[typing.Tuple[int, int, int], ...]:
-        neighbours = []
-        for dh in range(dh_start, dh_end):
-            neighbour_height = height + dh
-            if not 0 <= neighbour_height < size:
-                continue
-            for dr in range(-1, 2):
-                neighbour_row = row + dr
-                if not 0 <= neighbour_row < size - neighbour_height:
-                    continue
-                for dc in range(-1, 2):
-                    neighbour_column = column + dc
-                    if not 0 <= neighbour_column < size - neighbour_height:
-                        continue
-                    if dh == 0:
-                        if abs(dr) == abs(dc):
-                            continue
-                    else:
-                        if dh in (dr, dc):
-                            continue
-                    neighbours.append((neighbour_height,
-                                       neighbour_row,
-                                       neighbour_column))
-        return tuple(neighbours)
+        return ShibumiTopology.find_possible_neighbours(size,
+                                                        height,
+                                                        row,
+                                                        column,
+                                                        dh_start,
+                                                        dh_end)
 
     def find_neighbours(self,
                         height: int,
@@ -215,61 +638,18 @@ class ShibumiGameState(GameState, ABC):
             starting position, and then stop.
         :return:
         """
-        size = self.size
-        possible_neighbours = self.find_possible_neighbours(size,
-                                                            height,
-                                                            row,
-                                                            column,
-                                                            dh_start,
-                                                            dh_end)
-        levels = self.levels
-        for (neighbour_height,
-             neighbour_row,
-             neighbour_column) in possible_neighbours:
-            cover_height = neighbour_height + 2
-            cover_row = neighbour_row - 1
-            cover_column = neighbour_column - 1
-            if (0 <= cover_height < size and
-                    0 <= cover_row < size - cover_height and
-                    0 <= cover_column < size - cover_height):
-                cover_piece = levels[:, cover_height, cover_row, cover_column]
-                if cover_piece.sum():
-                    continue
-            if neighbour_height == height:
-                overpass_height = neighbour_height + 1
-                if overpass_height < size:
-                    dr = neighbour_row - row
-                    dc = neighbour_column - column
-                    if dr:
-                        overpass_row1 = overpass_row2 = row + (dr-1) // 2
-                        overpass_col1 = column-1
-                        overpass_col2 = column
-                    else:
-                        overpass_row1 = row-1
-                        overpass_row2 = row
-                        overpass_col1 = overpass_col2 = column + (dc-1) // 2
-                    if not (0 <= overpass_col1 and
-                            overpass_col2 < size - overpass_height):
-                        pass  # Next to the edge, no possible overpass.
-                    elif not (0 <= overpass_row1 and
-                              overpass_row2 < size - overpass_height):
-                        pass  # Next to the edge, no possible overpass.
-                    else:
-                        overpass_piece1 = levels[:,
-                                                 overpass_height,
-                                                 overpass_row1,
-                                                 overpass_col1]
-                        overpass_piece2 = levels[:,
-                                                 overpass_height,
-                                                 overpass_row2,
-                                                 overpass_col2]
-                        if overpass_piece1.sum() and overpass_piece2.sum():
-                            continue
-            yield neighbour_height, neighbour_row, neighbour_column
+        topology = self.topology
+        position_index = self.get_position_index(height, row, column)
+        neighbours = topology.find_neighbours_by_mask(self.occupied,
+                                                      position_index,
+                                                      dh_start,
+                                                      dh_end)
+        for neighbour_index in neighbours:
+            yield topology.positions[neighbour_index]
 
     def calculate_volume(self, base_size: int | None = None):
-        if base_size is None:
-            base_size = self.size
+        if base_size is None or base_size == self.size:
+            return self.topology.volume
         return base_size * (base_size + 1) * (2 * base_size + 1) // 6
 
     def display(self, show_coordinates: bool = False) -> str:
@@ -318,11 +698,11 @@ class ShibumiGameState(GameState, ABC):
 
     def get_move_count(self) -> int:
         """ The number of moves that have already been made in the start_state. """
-        return self.levels.sum()
+        return sum(bitboard.bit_count() for bitboard in self.bitboards)
 
     def get_piece_count(self, player: int) -> int:
         piece_type = self.piece_types.index(player)
-        return self.levels[piece_type].sum()
+        return self.bitboards[piece_type].bit_count()
 
     def get_index(self, height: int,
                   row: int = 0,
@@ -340,19 +720,60 @@ class ShibumiGameState(GameState, ABC):
         """
         if move_type != MoveType.BLACK:
             raise ValueError(f'Unsupported move type: {move_type!s}.')
-        level_size = self.size - height
-        level_start = self.calculate_volume(self.size) - self.calculate_volume(level_size)
-        return level_start + row*level_size + column
+        return self.get_position_index(height, row, column)
+
+    def get_move_coordinates(self) -> np.ndarray:
+        """ Look up the coordinates for all the moves at once.
+
+        :return: a read only array of [section, height, row, column] for each
+            move index, shared by all states with the same size and sections.
+        """
+        return ShibumiTopology.find_move_coordinates(self.size,
+                                                     self.move_section_count)
+
+    def get_move_indexes(self) -> np.ndarray:
+        """ Look up the move index for all the coordinates at once.
+
+        :return: a read only array of move indexes at
+            [section, height, row, column], or -1 outside the pyramid.
+        """
+        return ShibumiTopology.find_move_indexes(self.size,
+                                                 self.move_section_count)
+
+    def find_move_targets(self) -> int:
+        """ Find the positions that a move in the first section could choose.
+
+        Most games only add pieces, so those are the open positions. Games
+        that also choose pieces on the board should override this.
+        :return: a bitboard of the positions
+        """
+        return self.get_open_positions()
+
+    def is_valid_move(self, move: int) -> bool:
+        """ Check if a move is allowed.
+
+        Games with a cheaper check for a single move should override this.
+        """
+        return bool(self.get_valid_moves()[move])
 
     def get_move_index(self,
                        row_name: str,
                        column_name: str) -> int:
-        valid_moves = self.get_valid_moves()
+        """ Find the move at a point on the display.
+
+        Higher levels show through the gaps in lower levels, so one point can
+        be several positions, stacked two levels apart. This chooses the
+        highest one in the stack that find_move_targets() includes, without
+        checking the game's other rules. Use is_valid_move() for that, or
+        parse_moves().
+        """
+        targets = self.find_move_targets()
         row = int(row_name) - 1
         row_index = row // 2
         column = ord(column_name.upper()) - self.FIRST_COLUMN_ORD
         column_index = column // 2
         height = row % 2
+        move_index = None
         while True:
             if height >= self.size:
                 break
@@ -360,83 +781,138 @@ class ShibumiGameState(GameState, ABC):
                 break
             if not 0 <= row_index < self.size - height:
                 break
-            piece_index = self.get_index(height, row_index, column_index)
-            if valid_moves[piece_index]:
-                return piece_index
+            position_index = self.get_position_index(height,
+                                                     row_index,
+                                                     column_index)
+            if targets >> position_index & 1:
+                move_index = self.get_index(height, row_index, column_index)
             height += 2
             row_index -= 1
             column_index -= 1
-        raise ValueError(f'Invalid move: {row_name}{column_name}.')
+        if move_index is None:
+            raise ValueError(f'Invalid move: {row_name}{column_name}.')
+        return move_index
 
     def parse_move(self, text: str) -> int:
-        assert len(text) == 2
-        row_name, column_name = text[0], text[1]
+        if len(text) < 2:
+            raise ValueError(f'Invalid move: {text}.')
+        # Rows past 9 take two digits on larger boards.
+        row_name, column_name = text[:-1], text[-1]
         return self.get_move_index(row_name, column_name)
 
+    def parse_moves(self,
+                    texts: typing.Iterable[str],
+                    is_checked: bool = True) -> typing.List[int]:
+        """ Parse a game record, playing each move from this state.
+
+        :param texts: the moves, in the same format as parse_move()
+        :param is_checked: True if each move should be checked with
+            is_valid_move() before it's played. Turn it off for records that
+            are known to be valid.
+        :return: the move indexes
+        :raise: ValueError if a move is invalid
+        """
+        moves = []
+        state: ShibumiGameState = self
+        for text in texts:
+            move = state.parse_move(text)
+            if is_checked and not state.is_valid_move(move):
+                raise ValueError(f'Invalid move: {text}.')
+            moves.append(move)
+            state = state.make_move(move)
+        return moves
+
     def get_coordinates(self, move_index: int):
-        level_index = move_index
-        for height in range(self.size):
-            level_size = self.size - height
-            level_area = level_size * level_size
-            if level_index < level_area:
-                row = level_index // level_size
-                column = level_index % level_size
-                return height, row, column
-            level_index -= level_area
-        raise ValueError(f'Invalid move index: {move_index}.')
+        if not 0 <= move_index < self.topology.volume:
+            raise ValueError(f'Invalid move index: {move_index}.')
+        return self.topology.positions[move_index]
 
     def make_move(self, move: int) -> 'ShibumiGameState':
         new_board = copy(self)
-        levels = new_board.levels
         height, row, column = self.get_coordinates(move)
         player = self.get_active_player()
-        piece_type = self.piece_types.index(player)
-        levels[piece_type, height, row, column] = 1
-        new_board.levels = levels
+        new_board.set_piece(height, row, column, player)
         return new_board
 
-    def remove(self, height: int, row: int, column: int):
-        upper_height = height+1
-        levels = self.levels
-        for upper_row in (row-1, row):
-            if not 0 <= upper_row < self.size - upper_height:
-                continue
-            for upper_column in (column-1, column):
-                if not 0 <= upper_column < self.size - upper_height:
-                    continue
-                upper_piece = levels[:, upper_height, upper_row, upper_column]
-                if upper_piece.sum() != 0:
-                    levels[:, height, row, column] = upper_piece
-                    self.levels = levels
-                    self.remove(upper_height, upper_row, upper_column)
-                    return
-        # No pieces above, just leave this space empty.
-        levels[:, height, row, column] = 0
-        self.levels = levels
+    @changes_state
+    def remove(self, height: int, row: int, column: int) -> typing.List[int]:
+        """ Remove a piece, and let the pieces above drop down to fill it.
+
+        If there are pieces above, the first one drops into the space, then
+        the first one above that drops into its space, and so on up the
+        pyramid. This changes the state, so only call it on a new copy.
+        :return: the position indexes that changed, starting with the
+            removed piece. Each one now holds the piece from the next one,
+            and the last one is left empty.
+        """
+        topology = self.topology
+        supported_masks = topology.supported_masks
+        occupied = self.occupied
+        position_index = self.get_position_index(height, row, column)
+        cascade = [position_index]
+        upper_bits = occupied & supported_masks[position_index]
+        while upper_bits:
+            # Upper positions are numbered in the order that remove() checks.
+            position_index = (upper_bits & -upper_bits).bit_length() - 1
+            cascade.append(position_index)
+            upper_bits = occupied & supported_masks[position_index]
+
+        zobrist_keys = topology.zobrist_keys
+        board_key = self.board_key
+        bitboards = list(self.bitboards)
+        for piece_type, bitboard in enumerate(self.bitboards):
+            piece_keys = zobrist_keys[piece_type]
+            new_bitboard = bitboard
+            for lower_index, upper_index in zip(cascade,
+                                                cascade[1:] + [-1]):
+                has_piece = upper_index >= 0 and bitboard >> upper_index & 1
+                if has_piece != bitboard >> lower_index & 1:
+                    new_bitboard ^= 1 << lower_index
+                    board_key ^= piece_keys[lower_index]
+            bitboards[piece_type] = new_bitboard
+        self.bitboards = tuple(bitboards)
+        self.board_key = board_key
+        top_index = cascade[-1]
+        if occupied >> top_index & 1:
+            # Only the top of the cascade is emptied.
+            self._update_open_positions(top_index,
+                                        occupied & ~(1 << top_index))
+        self._occupancy = None
+        return cascade
 
     def is_pinned(self, height: int, row: int, column: int) -> bool:
-        support_count = 0
-        levels = self.levels
-        for height2, row2, column2 in self.find_possible_neighbours(
-                self.size,
-                height,
-                row,
-                column,
-                dh_start=1):
-            if levels[:, height2, row2, column2].sum():
-                support_count += 1
-                if support_count > 1:
-                    return True  # Supporting more than one neighbour.
-        return False
+        """ Check if a piece is supporting more than one piece above it. """
+        position_index = self.get_position_index(height, row, column)
+        supported = self.topology.supported[position_index]
+        return self.get_occupancy()[supported].sum() > 1
 
     def is_free(self, height: int, row: int, column: int) -> bool:
-        levels = self.levels
-        for height2, row2, column2 in self.find_possible_neighbours(
-                self.size,
-                height,
-                row,
-                column,
-                dh_start=1):
-            if levels[:, height2, row2, column2].sum():
-                return False
-        return True
+        """ Check if a piece isn't supporting any pieces above it. """
+        position_index = self.get_position_index(height, row, column)
+        supported = self.topology.supported[position_index]
+        return not self.get_occupancy()[supported].any()
+
+    @cached_result
+    def count_supported(self) -> np.ndarray:
+        """ Count the pieces directly above each position.
+
+        :return: a read only array of counts, one for each position
+        """
+        return self.get_occupancy()[self.topology.supported].sum(axis=1)
+
+    def get_pinned_mask(self) -> np.ndarray:
+        """ Find all the positions that support more than one piece.
+
+        Same as calling is_pinned() on every position, but all at once.
+        :return: an array of flags, one for each position
+        """
+        return self.count_supported() > 1
+
+    def get_free_mask(self) -> np.ndarray:
+        """ Find all the positions that don't support any pieces.
+
+        Same as calling is_free() on every position, but all at once. Empty
+        positions are included.
+        :return: an array of flags, one for each position
+        """
+        return self.count_supported() == 0
@@ -0,0 +1,396 @@
+import functools
+import typing
+
+import numpy as np
+
+
+class ShibumiTopology:
+    """ Precalculated relationships between positions on one size of board.
+
+    Positions are numbered the same way as ShibumiGameState.get_index(), and
+    each table is a numpy array with one row per position. Rows that have
+    fewer entries than the table's width are padded with volume, which is one
+    past the last position. Index an occupancy vector that has an extra False
+    entry at the end, and the padding will look like empty spaces.
+    """
+    MAX_NEIGHBOURS = 12
+    MAX_PIECE_TYPES = 3
+
+    def __init__(self, size: int):
+        self.size = size
+        self.volume = volume = size * (size + 1) * (2 * size + 1) // 6
+
+        level_starts = []
+        level_start = 0
+        for height in range(size):
+            level_starts.append(level_start)
+            level_start += (size - height) * (size - height)
+        self.level_starts: typing.Tuple[int, ...] = tuple(level_starts)
+
+        # [(height, row, column)] for each position index
+        self.positions: typing.Tuple[typing.Tuple[int, int, int], ...] = tuple(
+            (height, row, column)
+            for height in range(size)
+            for row in range(size - height)
+            for column in range(size - height))
+
+        # [[height, row, column]] as an array, for looking up many at once
+        self.coordinates = np.array(self.positions)
+
+        # position index at [height, row, column], or -1 outside the pyramid
+        self.position_indexes = np.full((size, size, size), -1)
+        self.position_indexes[tuple(self.coordinates.T)] = np.arange(volume)
+
+        # index in a flattened (size, size, size) cube for each position
+        self.cube_indexes = np.array([height * size * size + row * size + column
+                                      for height, row, column in self.positions])
+
+        self.neighbours = np.full((volume, self.MAX_NEIGHBOURS), volume)
+        self.neighbour_heights = np.zeros((volume, self.MAX_NEIGHBOURS), int)
+        self.covers = np.full((volume, self.MAX_NEIGHBOURS), volume)
+        self.overpasses = np.full((volume, self.MAX_NEIGHBOURS, 2), volume)
+        self.supporting = np.full((volume, 4), volume)
+        self.supported = np.full((volume, 4), volume)
+        for position_index, (height, row, column) in enumerate(self.positions):
+            self.add_neighbours(position_index, height, row, column)
+            if height > 0:
+                self.supporting[position_index] = [
+                    self.get_position_index(height - 1, lower_row, lower_column)
+                    for lower_row in (row, row + 1)
+                    for lower_column in (column, column + 1)]
+            upper_positions = self.find_possible_neighbours(size,
+                                                            height,
+                                                            row,
+                                                            column,
+                                                            dh_start=1)
+            for i, upper_position in enumerate(upper_positions):
+                self.supported[position_index, i] = self.get_position_index(
+                    *upper_position)
+
+        # Bitboard of supporting spaces for each position, zero on the bottom.
+        padded_bits = [1 << i for i in range(volume)] + [0]
+        self.support_masks: typing.Tuple[int, ...] = tuple(
+            sum(padded_bits[i] for i in supporting_indexes)
+            for supporting_indexes in self.supporting.tolist())
+
+        # Positions whose support can change when one position is filled or
+        # emptied: itself and the ones above it, as [(bit, support_mask)].
+        self.support_updates: typing.Tuple[
+            typing.Tuple[typing.Tuple[int, int], ...], ...] = tuple(
+            tuple((padded_bits[i], self.support_masks[i])
+                  for i in [position_index] + supported_indexes
+                  if i != volume)
+            for position_index, supported_indexes in enumerate(
+                self.supported.tolist()))
+
+        # Bitboard of the positions directly above each position.
+        self.supported_masks: typing.Tuple[int, ...] = tuple(
+            sum(padded_bits[i] for i in supported_indexes)
+            for supported_indexes in self.supported.tolist())
+
+        # Bit for the position two levels up that covers each position, and
+        # the reverse: bit for the position that each position covers. Zero if
+        # there isn't one.
+        cover_bits = [0] * volume
+        covered_bits = [0] * volume
+        for position_index, (height, row, column) in enumerate(self.positions):
+            cover_height = height + 2
+            if (cover_height < size and
+                    0 < row <= size - cover_height and
+                    0 < column <= size - cover_height):
+                cover_index = self.get_position_index(cover_height,
+                                                      row - 1,
+                                                      column - 1)
+                cover_bits[position_index] = padded_bits[cover_index]
+                covered_bits[cover_index] = padded_bits[position_index]
+        self.cover_bits: typing.Tuple[int, ...] = tuple(cover_bits)
+        self.covered_bits: typing.Tuple[int, ...] = tuple(covered_bits)
+
+        # Links between neighbours that each position can help cut off as an
+        # overpass: [[(link_bits, other_overpass_bit)]]. The link is cut when
+        # both overpass positions are occupied.
+        overpass_cuts: typing.List[typing.List[typing.Tuple[int, int]]] = [
+            [] for _ in range(volume)]
+        for position_index, (neighbour_indexes, overpass_pairs) in enumerate(
+                zip(self.neighbours.tolist(), self.overpasses.tolist())):
+            for neighbour_index, (overpass1, overpass2) in zip(
+                    neighbour_indexes,
+                    overpass_pairs):
+                if overpass1 == volume or neighbour_index < position_index:
+                    continue  # No overpass, or already added from other end.
+                link_bits = (padded_bits[position_index] |
+                             padded_bits[neighbour_index])
+                overpass_cuts[overpass1].append((link_bits,
+                                                 padded_bits[overpass2]))
+                overpass_cuts[overpass2].append((link_bits,
+                                                 padded_bits[overpass1]))
+        self.overpass_cuts: typing.Tuple[
+            typing.Tuple[typing.Tuple[int, int], ...], ...] = tuple(
+            tuple(cuts) for cuts in overpass_cuts)
+
+        # Masks for shifting between neighbours on the bottom level.
+        first_column = sum(1 << (row * size) for row in range(size))
+        self.bottom_mask = (1 << (size * size)) - 1
+        self.first_column_mask = first_column
+        self.last_column_mask = first_column << (size - 1)
+
+        # Same neighbour tables as bitboards, for checking one position at a
+        # time: [[(neighbour_index, dh, cover_bit, overpass_bits)]], where
+        # overpass_bits is zero if no overpass can cut off that neighbour.
+        self.neighbour_masks: typing.Tuple[
+            typing.Tuple[typing.Tuple[int, int, int, int], ...], ...] = tuple(
+            tuple((neighbour_index,
+                   dh,
+                   padded_bits[cover_index],
+                   padded_bits[overpass_indexes[0]] |
+                   padded_bits[overpass_indexes[1]])
+                  for neighbour_index, dh, cover_index, overpass_indexes in zip(
+                      neighbour_indexes,
+                      heights,
+                      cover_indexes,
+                      overpass_pairs)
+                  if neighbour_index != volume)
+            for neighbour_indexes, heights, cover_indexes, overpass_pairs in zip(
+                self.neighbours.tolist(),
+                self.neighbour_heights.tolist(),
+                self.covers.tolist(),
+                self.overpasses.tolist()))
+
+        # Random 64-bit Zobrist key for each piece type in each position.
+        random = np.random.default_rng(size)
+        self.zobrist_keys: typing.List[typing.List[int]] = random.integers(
+            2**64,
+            size=(self.MAX_PIECE_TYPES, volume),
+            dtype=np.uint64).tolist()
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def get(size: int) -> 'ShibumiTopology':
+        """ Get the shared topology for a board size. """
+        return ShibumiTopology(size)
+
+    def get_position_index(self, height: int, row: int, column: int) -> int:
+        return self.level_starts[height] + row * (self.size - height) + column
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def find_move_coordinates(size: int, section_count: int) -> np.ndarray:
+        """ Find the coordinates for every move in a game.
+
+        Games with more than one type of move split the moves into sections,
+        with one move for each position in each section.
+        :param size: the size of the bottom level
+        :param section_count: the number of sections in the moves
+        :return: a read only array of [section, height, row, column] for each
+            move index
+        """
+        topology = ShibumiTopology.get(size)
+        sections = np.repeat(np.arange(section_count), topology.volume)
+        move_coordinates = np.column_stack(
+            (sections, np.tile(topology.coordinates, (section_count, 1))))
+        move_coordinates.flags.writeable = False
+        return move_coordinates
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def find_move_indexes(size: int, section_count: int) -> np.ndarray:
+        """ Find the move index for every section and position in a game.
+
+        This is the reverse of find_move_coordinates().
+        :return: a read only array of move indexes at
+            [section, height, row, column], or -1 outside the pyramid
+        """
+        topology = ShibumiTopology.get(size)
+        position_indexes = topology.position_indexes
+        offsets = np.arange(section_count).reshape(section_count, 1, 1, 1)
+        move_indexes = np.where(position_indexes < 0,
+                                -1,
+                                position_indexes + offsets * topology.volume)
+        move_indexes.flags.writeable = False
+        return move_indexes
+
+    def add_neighbours(self,
+                       position_index: int,
+                       height: int,
+                       row: int,
+                       column: int):
+        size = self.size
+        possible_neighbours = self.find_possible_neighbours(size,
+                                                            height,
+                                                            row,
+                                                            column)
+        for i, (neighbour_height,
+                neighbour_row,
+                neighbour_column) in enumerate(possible_neighbours):
+            self.neighbours[position_index, i] = self.get_position_index(
+                neighbour_height,
+                neighbour_row,
+                neighbour_column)
+            self.neighbour_heights[position_index, i] = neighbour_height - height
+            cover_height = neighbour_height + 2
+            cover_row = neighbour_row - 1
+            cover_column = neighbour_column - 1
+            if (0 <= cover_height < size and
+                    0 <= cover_row < size - cover_height and
+                    0 <= cover_column < size - cover_height):
+                self.covers[position_index, i] = self.get_position_index(
+                    cover_height,
+                    cover_row,
+                    cover_column)
+            if neighbour_height != height:
+                continue
+            overpass_height = neighbour_height + 1
+            if overpass_height >= size:
+                continue
+            dr = neighbour_row - row
+            dc = neighbour_column - column
+            if dr:
+                overpass_row1 = overpass_row2 = row + (dr-1) // 2
+                overpass_col1 = column-1
+                overpass_col2 = column
+            else:
+                overpass_row1 = row-1
+                overpass_row2 = row
+                overpass_col1 = overpass_col2 = column + (dc-1) // 2
+            if not (0 <= overpass_col1 and
+                    overpass_col2 < size - overpass_height):
+                continue  # Next to the edge, no possible overpass.
+            if not (0 <= overpass_row1 and
+                    overpass_row2 < size - overpass_height):
+                continue  # Next to the edge, no possible overpass.
+            self.overpasses[position_index, i] = [
+                self.get_position_index(overpass_height,
+                                        overpass_row1,
+                                        overpass_col1),
+                self.get_position_index(overpass_height,
+                                        overpass_row2,
+                                        overpass_col2)]
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def find_possible_neighbours(
+            size: int,
+            height: int,
+            row: int,
+            column: int,
+            dh_start: int = -1,
+            dh_end: int = 2) -> typing.Tuple[typing.Tuple[int, int, int], ...]:
+        neighbours = []
+        for dh in range(dh_start, dh_end):
+            neighbour_height = height + dh
+            if not 0 <= neighbour_height < size:
+                continue
+            for dr in range(-1, 2):
+                neighbour_row = row + dr
+                if not 0 <= neighbour_row < size - neighbour_height:
+                    continue
+                for dc in range(-1, 2):
+                    neighbour_column = column + dc
+                    if not 0 <= neighbour_column < size - neighbour_height:
+                        continue
+                    if dh == 0:
+                        if abs(dr) == abs(dc):
+                            continue
+                    else:
+                        if dh in (dr, dc):
+                            continue
+                    neighbours.append((neighbour_height,
+                                       neighbour_row,
+                                       neighbour_column))
+        return tuple(neighbours)
+
+    def calculate_board_key(self, bitboards: typing.Sequence[int]) -> int:
+        """ Calculate the Zobrist key for a board from scratch. """
+        board_key = 0
+        for piece_keys, bitboard in zip(self.zobrist_keys, bitboards):
+            while bitboard:
+                position_index = (bitboard & -bitboard).bit_length() - 1
+                board_key ^= piece_keys[position_index]
+                bitboard &= bitboard - 1
+        return board_key
+
+    def find_bottom_neighbours(self, bottom_positions: int) -> int:
+        """ Find positions beside any of the given ones on the bottom level.
+
+        :param bottom_positions: a bitboard of positions on the bottom level
+        :return: a bitboard of the bottom level positions that are directly
+            beside or in front of or behind any of them, including the given
+            positions themselves if they're beside each other.
+        """
+        size = self.size
+        return (((bottom_positions << 1) & ~self.first_column_mask) |
+                ((bottom_positions >> 1) & ~self.last_column_mask) |
+                (bottom_positions << size) |
+                (bottom_positions >> size)) & self.bottom_mask
+
+    def unpack_occupancy(self, occupied: int) -> np.ndarray:
+        """ Convert a bitboard to an occupancy vector.
+
+        :param occupied: bitboard of the occupied spaces
+        :return: an array of flags, one for each position plus a False entry
+            at the end that the padding in the other tables will point to.
+        """
+        volume = self.volume
+        byte_count = (volume + 8) // 8
+        packed = np.frombuffer(occupied.to_bytes(byte_count, 'little'),
+                               np.uint8)
+        return np.unpackbits(packed,
+                             count=volume + 1,
+                             bitorder='little').view(bool)
+
+    def find_blocked_neighbours(self, occupancy: np.ndarray) -> np.ndarray:
+        """ Find neighbours that are cut off by covers or overpasses.
+
+        :param occupancy: occupancy vector from unpack_occupancy()
+        :return: an array of flags with the same shape as self.neighbours
+        """
+        overpasses = occupancy[self.overpasses]
+        return occupancy[self.covers] | (overpasses[..., 0] &
+                                         overpasses[..., 1])
+
+    def find_neighbours_by_mask(
+            self,
+            occupied: int,
+            position_index: int,
+            dh_start: int = -1,
+            dh_end: int = 2) -> typing.Iterator[int]:
+        """ Find the neighbours of a position that aren't cut off.
+
+        Same as find_neighbours(), but faster for a single position, because
+        it uses a bitboard instead of an occupancy vector.
+        :param occupied: bitboard of the occupied spaces
+        """
+        for neighbour_index, dh, cover_bit, overpass_bits in (
+                self.neighbour_masks[position_index]):
+            if not dh_start <= dh < dh_end:
+                continue
+            if occupied & cover_bit:
+                continue
+            if overpass_bits and occupied & overpass_bits == overpass_bits:
+                continue
+            yield neighbour_index
+
+    def find_neighbours(self,
+                        occupancy: np.ndarray,
+                        position_index: int,
+                        dh_start: int = -1,
+                        dh_end: int = 2) -> np.ndarray:
+        """ Find the neighbours of a position that aren't cut off.
+
+        :param occupancy: occupancy vector from unpack_occupancy()
+        :param position_index: the position to start from
+        :param dh_start: difference from starting height to start searching
+        :param dh_end: difference from starting height to stop searching
+            (excluded)
+        :return: an array of neighbour position indexes
+        """
+        neighbours = self.neighbours[position_index]
+        covers = self.covers[position_index]
+        overpasses = occupancy[self.overpasses[position_index]]
+        heights = self.neighbour_heights[position_index]
+        is_visible = ~(occupancy[covers] |
+                       (overpasses[:, 0] & overpasses[:, 1]))
+        is_visible &= neighbours != self.volume
+        if dh_start > -1 or dh_end < 2:
+            is_visible &= (dh_start <= heights) & (heights < dh_end)
+        return neighbours[is_visible]
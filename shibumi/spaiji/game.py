@@ -1,13 +1,17 @@
-from collections import defaultdict
+import typing
 from copy import copy
+from types import MappingProxyType
 
 import numpy as np
 
-from shibumi.shibumi_game_state import ShibumiGameState, MoveType
+from shibumi.shibumi_game_state import (ShibumiGameState, MoveType,
+                                         cached_result)
 
 
 class SpaijiState(ShibumiGameState):
     game_name = 'Spaiji'
+    __slots__ = ('active_player', 'last_height', 'last_row', 'last_column')
+    move_section_count = 2
 
     def __init__(self,
                  text: str | None = None,
@@ -65,16 +69,53 @@ class SpaijiState(ShibumiGameState):
     def get_active_player(self) -> int:
         return self.active_player
 
+    def get_extra_state(self) -> typing.Tuple[int, ...]:
+        if self.last_column < 0:
+            # Last position is only kept during the turn.
+            return self.active_player, -1, -1, -1
+        return (self.active_player,
+                self.last_height,
+                self.last_row,
+                self.last_column)
+
+    def set_serial_state(self, serial_state: typing.Sequence[int]):
+        (self.active_player,
+         self.last_height,
+         self.last_row,
+         self.last_column) = serial_state
+
+    def find_last_position(
+            self,
+            position_map: typing.Sequence[int]) -> typing.Tuple[int, int, int]:
+        """ Find where the last move ends up after moving all the pieces. """
+        if self.last_column < 0:
+            return -1, -1, -1
+        last_index = self.get_position_index(self.last_height,
+                                             self.last_row,
+                                             self.last_column)
+        return self.topology.positions[position_map[last_index]]
+
+    def transform_extra_state(
+            self,
+            position_map: typing.Sequence[int]) -> typing.Tuple[int, ...]:
+        return (self.active_player,
+                *self.find_last_position(position_map))
+
+    def transform(self, position_map: typing.Sequence[int]) -> 'SpaijiState':
+        new_state = super().transform(position_map)
+        assert isinstance(new_state, SpaijiState)
+        (new_state.last_height,
+         new_state.last_row,
+         new_state.last_column) = self.find_last_position(position_map)
+        return new_state
+
     def make_move(self, move: int) -> 'ShibumiGameState':
         new_state = copy(self)
-        levels = new_state.levels
         volume = self.calculate_volume(self.size)
         player = [self.BLACK, self.WHITE][move // volume]
-        piece_type = self.piece_types.index(player)
         position_index = move % volume
         height, row, column = self.get_coordinates(position_index)
-        levels[piece_type, height, row, column] = 1
-        new_state.levels = levels
+        new_state.set_piece(height, row, column, player)
 
         if self.last_column < 0:
             new_state.last_height = height
@@ -85,39 +126,32 @@ class SpaijiState(ShibumiGameState):
             new_state.active_player *= -1
         return new_state
 
+    @cached_result
     def get_valid_moves(self) -> np.ndarray:
         volume = self.calculate_volume()
         valid_moves: np.ndarray = np.ndarray(2*volume, bool)
         valid_spaces = valid_moves[:volume]
         self.fill_supported_moves(valid_spaces)
-        levels = self.levels
         old_height = self.last_height
         old_row = self.last_row
         old_column = self.last_column
         if old_column < 0:
-            # This is the first move of the turn
-            for move, is_valid in enumerate(valid_spaces):
-                if is_valid:
-                    new_board = self.make_move(move)
-                    if not new_board.get_valid_moves().any():
-                        # Choosing this move would leave no neighbours to
-                        # complete the turn.
-                        valid_spaces[move] = False
+            # This is the first move of the turn, so it has to leave a
+            # neighbour to complete the turn.
+            valid_spaces &= self.find_follow_up_mask()
             # Now copy the same valid moves for white.
             valid_moves[volume:] = valid_spaces
         else:
-            old_move_type = levels[:, old_height, old_row, old_column]
+            old_move_type = self.get_piece(old_height, old_row, old_column)
             neighbour_moves = np.zeros(volume, bool)
             for height, row, column in self.find_neighbours(old_height,
                                                             old_row,
                                                             old_column):
-                piece = levels[:, height, row, column]
-                if piece.sum() == 0:
+                if not self.is_occupied(height, row, column):
                     move_index = self.get_index(height, row, column)
                     is_valid = valid_spaces[move_index]
                     neighbour_moves[move_index] = is_valid
-            white_piece_type = self.piece_types.index(self.WHITE)
-            if old_move_type[white_piece_type]:
+            if old_move_type == self.WHITE:
                 # Now black is valid
                 valid_moves[:volume] = neighbour_moves
                 valid_moves[volume:] = False
@@ -127,6 +161,29 @@ class SpaijiState(ShibumiGameState):
                 valid_moves[volume:] = neighbour_moves
         return valid_moves
 
+    def find_follow_up_mask(self) -> np.ndarray:
+        """ Find which positions would leave a move to complete the turn.
+
+        The second move of a turn has to be an empty, supported neighbour of
+        the first one, so check the neighbours of every position at once, as
+        if that position had been filled, without making the moves.
+        :return: an array of flags, one for each position
+        """
+        topology = self.topology
+        occupancy = topology.unpack_occupancy(self.occupied)
+        open_positions = topology.unpack_occupancy(self.get_open_positions())
+        # Filling a position supports the empty ones above it that were only
+        # missing that position.
+        support_counts = occupancy[topology.supporting].sum(axis=1)
+        newly_supported = np.append(
+            ~occupancy[:-1] & (support_counts == 3),
+            False)
+        neighbours = topology.neighbours
+        is_open = open_positions[neighbours] | (
+            (topology.neighbour_heights == 1) & newly_supported[neighbours])
+        is_open &= ~topology.find_blocked_neighbours(occupancy)
+        return is_open.any(axis=1)
+
     def get_index(self, height: int,
                   row: int = 0,
                   column: int = 0,
@@ -146,6 +203,7 @@ class SpaijiState(ShibumiGameState):
         base_move = super().display_move(move)
         return colour + base_move
 
+    @cached_result
     def is_ended(self) -> bool:
         valid_moves = self.get_valid_moves()
         return not valid_moves.any()
@@ -161,49 +219,79 @@ class SpaijiState(ShibumiGameState):
             return player == self.BLACK
         return score > opponent_score
 
-    def get_scores(self):
-        levels = self.levels
-        if levels[:, -1, 0, 0].sum() != 0:
-            unvisited = [(0, 0, 0)]
+    @cached_result
+    def get_scores(self) -> typing.Mapping[int, int]:
+        """ Find the size of each player's largest group.
+
+        The scores are cached, so they're read only.
+
+        Groups only count if they're connected through other balls to the
+        edge of the bottom level, or to the corner once the peak is filled.
+        """
+        topology = self.topology
+        volume = topology.volume
+        occupied = self.occupied
+        if occupied >> (volume - 1):
+            start_bits = 1
         else:
-            edges = (0, self.size-1)
-            unvisited = [(0, row, column)
-                         for row in range(self.size)
-                         for column in range(self.size)
-                         if row in edges or column in edges]
-
-        groups = defaultdict(set)
-        while unvisited:
-            position = unvisited.pop()
-            start_piece = levels[(..., *position)]
-            if start_piece.sum() == 0:
-                continue
-            group = groups[position]
-            group.add(position)
-            for neighbour_position in self.find_neighbours(*position):
-                if neighbour_position in groups:
-                    continue  # Already seen.
-                neighbour_piece = levels[(..., *neighbour_position)]
-                if neighbour_piece.sum() == 0:
-                    continue
-                if not np.array_equal(neighbour_piece, start_piece):
-                    # Visit opponent's groups after finishing the current group.
-                    unvisited.insert(0, neighbour_position)
-                else:
-                    group.add(neighbour_position)
-                    groups[neighbour_position] = group
-
-                    # Visit next.
-                    unvisited.append(neighbour_position)
+            size = self.size
+            row_mask = (1 << size) - 1
+            start_bits = (row_mask |
+                          row_mask << (size * (size - 1)) |
+                          topology.first_column_mask |
+                          topology.last_column_mask)
+        players = np.full(volume + 1, self.NO_PLAYER)
+        for player, bitboard in zip(self.piece_types, self.bitboards):
+            players[:-1][self.unpack_bitboard(bitboard, volume) != 0] = player
+
+        # Bitboards of the visible neighbours for each ball, of any colour and
+        # of the same colour.
+        occupancy = topology.unpack_occupancy(occupied)
+        neighbours = topology.neighbours
+        is_linked = (occupancy[:-1, None] &
+                     occupancy[neighbours] &
+                     ~topology.find_blocked_neighbours(occupancy))
+        link_positions, link_numbers = np.nonzero(is_linked)
+        link_neighbours = neighbours[link_positions, link_numbers]
+        is_same = players[link_positions] == players[link_neighbours]
+        linked_bits = [0] * volume
+        same_bits = [0] * volume
+        for position_index, neighbour_index, is_same_player in zip(
+                link_positions.tolist(),
+                link_neighbours.tolist(),
+                is_same.tolist()):
+            neighbour_bit = 1 << neighbour_index
+            linked_bits[position_index] |= neighbour_bit
+            if is_same_player:
+                same_bits[position_index] |= neighbour_bit
+
         scores = {self.WHITE: 0, self.BLACK: 0}
-        for position, group in groups.items():
-            piece = levels[(..., *position)]
-            piece_types = np.argwhere(piece)
-            piece_type = piece_types[0, 0]
-            piece = self.piece_types[piece_type]
-            group_size = len(group)
-            scores[piece] = max(group_size, scores[piece])
-        return scores
+        unscored = self.flood(start_bits & occupied, linked_bits)
+        while unscored:
+            group = self.flood(unscored & -unscored, same_bits)
+            unscored &= ~group
+            player = int(players[(group & -group).bit_length() - 1])
+            scores[player] = max(group.bit_count(), scores[player])
+        return MappingProxyType(scores)
+
+    @staticmethod
+    def flood(start_bits: int, link_bits: typing.Sequence[int]) -> int:
+        """ Find all the positions that links lead to from the start.
+
+        :param start_bits: bitboard of the positions to start from
+        :param link_bits: a bitboard for each position, of the positions it
+            links to
+        :return: a bitboard of the start positions and all the positions
+            reached through links
+        """
+        reached = frontier = start_bits
+        while frontier:
+            position_bit = frontier & -frontier
+            frontier ^= position_bit
+            new_bits = link_bits[position_bit.bit_length() - 1] & ~reached
+            reached |= new_bits
+            frontier |= new_bits
+        return reached
 
     def get_piece_count(self, player: int) -> int:
         scores = self.get_scores()
@@ -1,9 +1,13 @@
+import struct
+import typing
 from copy import copy
 
 import numpy as np
-import typing
 
-from shibumi.shibumi_game_state import ShibumiGameState
+from shibumi.shibumi_game_state import (ShibumiGameState, cached_result,
+                                         mix_hash)
+from shibumi.spargo.groups import BallGroups
+from shibumi.spargo.history import PositionHistory
 
 
 class IllegalMoveError(Exception):
@@ -12,6 +16,8 @@ class IllegalMoveError(Exception):
 
 
 class SpargoState(ShibumiGameState):
+    __slots__ = ('active_player', 'history', '_groups')
+
     def __init__(self,
                  text: str | None = None,
                  size: int = 4):
@@ -28,18 +34,15 @@ class SpargoState(ShibumiGameState):
         super().__init__(text, size=size)
         self.active_player = player
 
-        # {board.bytes + active_player} for all previous states
-        self.history = {self.create_snapshot()}
-
-    def create_snapshot(self):
-        snapshot = self.packed.tobytes()
-        snapshot += (b'W' if self.active_player == self.WHITE else b'B')
-        return snapshot
+        # Zobrist keys for this state and all previous states
+        self.history = PositionHistory(self.zobrist_key)
+        self._groups: BallGroups | None = None
 
     @property
     def game_name(self) -> str:
         return 'Spargo' if self.size == 4 else 'Margo'
 
+    @cached_result
     def is_ended(self) -> bool:
         valid_moves = self.get_valid_moves()
         return valid_moves.sum() == 0
@@ -61,65 +64,201 @@ class SpargoState(ShibumiGameState):
     def get_active_player(self) -> int:
         return self.active_player
 
+    @property
+    def transposition_key(self) -> int:
+        """ Include the history, because it can rule out repeated positions.
+
+        The same position can have different valid moves, after different
+        earlier positions.
+        """
+        return self.zobrist_key ^ mix_hash(self.history.chain_key)
+
+    def transform(self, position_map: typing.Sequence[int]) -> 'SpargoState':
+        """ Move all the pieces, to rotate or reflect the board.
+
+        The earlier positions can't be moved, because the history only has
+        their keys, so the new state's history starts with itself.
+        """
+        new_state = super().transform(position_map)
+        assert isinstance(new_state, SpargoState)
+        new_state.history = PositionHistory(new_state.zobrist_key)
+        return new_state
+
+    def set_serial_state(self, serial_state: typing.Sequence[int]):
+        self.active_player, = serial_state
+        self.history = PositionHistory(self.zobrist_key)
+        self._groups = None
+
+    def to_bytes(self) -> bytes:
+        """ Pack the state, followed by the keys in its history.
+
+        Repeated positions aren't allowed, so the history has to come along,
+        with a count and then eight bytes for each key, oldest first.
+        """
+        keys = list(self.history)
+        keys.reverse()
+        return (super().to_bytes() +
+                struct.pack(f'<H{len(keys)}Q', len(keys), *keys))
+
+    @classmethod
+    def read_bytes(cls, data: bytes) -> typing.Tuple['SpargoState', int]:
+        state, start = super().read_bytes(data)
+        assert isinstance(state, SpargoState)
+        key_count, = struct.unpack_from('<H', data, start)
+        start += 2
+        end = start + 8*key_count
+        history = None
+        for key in struct.unpack(f'<{key_count}Q', data[start:end]):
+            history = PositionHistory(key, history)
+        if history is not None:
+            state.history = history
+        return state, end
+
+    def get_groups(self) -> BallGroups:
+        """ Get the connected groups of balls.
+
+        They're found from scratch the first time, then make_move() updates a
+        copy for each new state. They're also found from scratch if the board
+        was changed some other way.
+        """
+        groups = self._groups
+        if groups is None or groups.board_key != self.board_key:
+            groups = self._groups = BallGroups.build(self)
+        return groups
+
     def make_move(self, move: int) -> 'SpargoState':
         new_state = copy(self)
-        new_state.history = self.history.copy()
-        levels = new_state.levels
+        groups = self.get_groups().copy()
         height, row, column = self.get_coordinates(move)
+        position_index = self.get_position_index(height, row, column)
+        topology = self.topology
         player = self.active_player
         other_player = -player
-        piece_type = self.piece_types.index(player)
-        other_piece_type = self.piece_types.index(other_player)
-        levels[piece_type, height, row, column] = 1
-        new_state.levels = levels
-        captured = set()  # {(height, row, column)}
-        for height2, row2, column2 in new_state.find_neighbours(height,
-                                                                row,
-                                                                column):
-            neighbour_piece = levels[:, height2, row2, column2]
-            group: typing.Set[typing.Tuple[int, int, int]] = set()
-            if (neighbour_piece[other_piece_type] and
-                    not new_state.has_freedom(levels,
-                                              height2,
-                                              row2,
-                                              column2,
-                                              group)):
-                captured |= group
-
-        sorted_capture = sorted(captured, reverse=True)  # Check from top down.
-        for height2, row2, column2 in sorted_capture:
-            for height3, row3, column3 in new_state.find_possible_neighbours(
-                    self.size,
-                    height2,
-                    row2,
-                    column2,
-                    dh_start=1):
-                piece_above = levels[:, height3, row3, column3]
-                if piece_above.sum():
-                    break
-            else:
+        new_state.set_piece(height, row, column, player)
+        if not groups.add_ball(new_state, position_index):
+            groups = BallGroups.build(new_state)
+        new_state._groups = groups
+        other_balls = new_state.bitboards[self.piece_types.index(other_player)]
+        captured = 0
+        for neighbour_index in topology.find_neighbours_by_mask(
+                new_state.occupied,
+                position_index):
+            if (other_balls >> neighbour_index & 1 and
+                    not groups.find_liberties(new_state, neighbour_index)):
+                captured |= groups.find_group(neighbour_index)
+
+        is_removed = False
+        while captured:
+            # Check from top down.
+            captured_index = captured.bit_length() - 1
+            captured ^= 1 << captured_index
+            if not new_state.occupied & topology.supported_masks[
+                    captured_index]:
                 # not supporting any pieces, can be removed.
-                levels[:, height2, row2, column2] = 0
-        new_state.levels = levels
-        if not new_state.has_freedom(levels, height, row, column, set()):
+                new_state.set_piece(*topology.positions[captured_index],
+                                    self.NO_PLAYER)
+                is_removed = True
+        if is_removed:
+            groups = new_state._groups = BallGroups.build(new_state)
+        if not groups.find_liberties(new_state, position_index):
             raise IllegalMoveError('Added piece has no freedom.')
         new_player = other_player
         new_state.active_player = new_player
-        new_snapshot = new_state.create_snapshot()
-        if new_snapshot in self.history:
+        new_key = new_state.zobrist_key
+        if new_key in self.history:
             raise IllegalMoveError('Cannot repeat a position.')
-        new_state.history.add(new_snapshot)
+        new_state.history = self.history.add(new_key)
         return new_state
 
+    def check_move(self, move: int) -> int | None:
+        """ Check if a move is legal, without making a new state.
+
+        Works on copies of the bitboards and the current groups, so it's much
+        cheaper than calling make_move() and catching IllegalMoveError.
+        :param move: the move to check, on a supported empty space
+        :return: the Zobrist key that the new state would have, or None if the
+            move is illegal because of suicide or repeating a position.
+        """
+        topology = self.topology
+        groups = self.get_groups()
+        position_index = int(move)  # Moves are the same as position indexes.
+        player = self.active_player
+        player_type = self.piece_types.index(player)
+        other_type = self.piece_types.index(-player)
+        player_balls = self.bitboards[player_type] | 1 << position_index
+        other_balls = self.bitboards[other_type]
+        occupied = player_balls | other_balls
+        zobrist_keys = topology.zobrist_keys
+        board_key = self.board_key ^ zobrist_keys[player_type][position_index]
+        split_balls = groups.find_split_balls(topology,
+                                              player_balls,
+                                              occupied,
+                                              position_index)
+        if split_balls & player_balls:
+            new_group = groups.search_group(topology,
+                                            player_balls,
+                                            occupied,
+                                            position_index)
+        else:
+            new_group = 1 << position_index
+        captured = 0
+        for neighbour_index in topology.find_neighbours_by_mask(occupied,
+                                                                position_index):
+            neighbour_bit = 1 << neighbour_index
+            if other_balls & neighbour_bit:
+                if captured & neighbour_bit:
+                    continue
+                if split_balls & neighbour_bit:
+                    group = groups.search_group(topology,
+                                                other_balls,
+                                                occupied,
+                                                neighbour_index)
+                else:
+                    group = groups.find_group(neighbour_index)
+                if not groups.find_group_liberties(topology, group, occupied):
+                    captured |= group
+            elif player_balls & neighbour_bit and not split_balls & player_balls:
+                new_group |= groups.find_group(neighbour_index)
+
+        is_removed = False
+        while captured:
+            # Check from top down.
+            captured_index = captured.bit_length() - 1
+            captured_bit = 1 << captured_index
+            captured ^= captured_bit
+            if not occupied & topology.supported_masks[captured_index]:
+                occupied ^= captured_bit
+                board_key ^= zobrist_keys[other_type][captured_index]
+                is_removed = True
+        if (not groups.find_group_liberties(topology, new_group, occupied) and
+                not (is_removed and groups.find_group_liberties(
+                    topology,
+                    # Removed balls might have joined more balls to the group.
+                    groups.search_group(topology,
+                                        player_balls,
+                                        occupied,
+                                        position_index),
+                    occupied))):
+            return None  # Added piece has no freedom.
+        new_key = self.calculate_zobrist_key(board_key, (-player,))
+        if new_key in self.history:
+            return None  # Cannot repeat a position.
+        return new_key
+
+    def is_valid_move(self, move: int) -> bool:
+        return bool(self.get_open_positions() >> move & 1 and
+                    self.check_move(move) is not None)
+
     def has_freedom(self,
-                    levels: np.ndarray,
                     height: int,
                     row: int,
                     column: int,
                     group: set) -> bool:
         """ Check if a ball is connected to a free space on the board.
 
-        :param levels: the board spaces to search
+        This searches the board from scratch, so make_move() uses the groups
+        from get_groups() instead, but this is still useful for checking them.
+
         :param height: the height of the ball to check
         :param row: the row of the ball to check
         :param column: the column of the ball to check
@@ -128,31 +267,28 @@ class SpargoState(ShibumiGameState):
             be added until a freedom is found, or no new neighbours can be found.
         :return: True if a freedom is found, otherwise False.
         """
-        player = levels[:, height, row, column]
+        player = self.get_piece(height, row, column)
         group.add((height, row, column))
         for neighbour_coordinates in self.find_neighbours(height, row, column):
             height2, row2, column2 = neighbour_coordinates
-            neighbour_piece = levels[:, height2, row2, column2]
-            if height2 == 0 and neighbour_piece.sum() == 0:
+            neighbour_piece = self.get_piece(height2, row2, column2)
+            if height2 == 0 and neighbour_piece == self.NO_PLAYER:
                 # Empty space on the board, connected to the group.
                 return True
-            if (np.array_equal(neighbour_piece, player) and
+            if (neighbour_piece == player and
                     neighbour_coordinates not in group):
-                if self.has_freedom(levels, height2, row2, column2, group):
+                if self.has_freedom(height2, row2, column2, group):
                     return True
 
         return False
 
+    @cached_result
     def get_valid_moves(self,) -> np.ndarray:
         piece_count = self.calculate_volume(self.size)
         valid_moves = np.full(piece_count, False)
         self.fill_supported_moves(valid_moves)
-        for move, is_valid in enumerate(valid_moves):
-            if not is_valid:
-                continue
-            try:
-                self.make_move(move)
-            except IllegalMoveError:
+        for move in np.flatnonzero(valid_moves).tolist():
+            if self.check_move(move) is None:
                 valid_moves[move] = False
 
         return valid_moves
@@ -0,0 +1,201 @@
+import typing
+
+from shibumi.shibumi_game_state import ShibumiGameState
+from shibumi.shibumi_topology import ShibumiTopology
+
+
+class BallGroups:
+    """ Connected groups of balls, tracked as a union-find structure.
+
+    Each ball in a group points at its group's root ball, and each root has a
+    bitboard of all the balls in its group. Placing a ball merges it with the
+    groups around it, but anything that can split a group rebuilds them all:
+    removing balls, covering a ball, or finishing an overpass between two of
+    the opponent's balls.
+
+    Balls that are covered by another ball two levels up can't be seen by
+    their neighbours, so they don't belong to any group.
+    """
+    NO_GROUP = -1
+
+    def __init__(self,
+                 roots: typing.List[int],
+                 members: typing.Dict[int, int],
+                 board_key: int):
+        """ Initialize an instance.
+
+        :param roots: the root position index for the group that each
+            position belongs to, or NO_GROUP
+        :param members: {root: bitboard} of all the balls in each group
+        :param board_key: Zobrist key of the board that these groups match
+        """
+        self.roots = roots
+        self.members = members
+        self.board_key = board_key
+
+    @classmethod
+    def build(cls, state: ShibumiGameState) -> 'BallGroups':
+        """ Find all the groups on a board from scratch. """
+        topology = state.topology
+        occupied = state.occupied
+        cover_bits = topology.cover_bits
+        roots = [cls.NO_GROUP] * topology.volume
+        members = {}
+        for player in (state.BLACK, state.WHITE):
+            player_balls = state.bitboards[state.piece_types.index(player)]
+            remaining = player_balls
+            while remaining:
+                start = (remaining & -remaining).bit_length() - 1
+                remaining &= remaining - 1
+                if roots[start] != cls.NO_GROUP or occupied & cover_bits[start]:
+                    continue  # Already grouped, or can't be seen.
+                group = members[start] = cls.search_group(topology,
+                                                          player_balls,
+                                                          occupied,
+                                                          start)
+                while group:
+                    member_index = (group & -group).bit_length() - 1
+                    group &= group - 1
+                    roots[member_index] = start
+        return cls(roots, members, state.board_key)
+
+    @staticmethod
+    def search_group(topology: ShibumiTopology,
+                     player_balls: int,
+                     occupied: int,
+                     start: int) -> int:
+        """ Search a board for all the balls connected to one ball.
+
+        :param topology: the board's topology tables
+        :param player_balls: bitboard of balls with the same colour as start
+        :param occupied: bitboard of all balls on the board
+        :param start: position index of the first ball
+        :return: a bitboard of the group
+        """
+        group = 1 << start
+        unchecked = [start]
+        while unchecked:
+            position_index = unchecked.pop()
+            for neighbour_index in topology.find_neighbours_by_mask(
+                    occupied,
+                    position_index):
+                neighbour_bit = 1 << neighbour_index
+                if player_balls & neighbour_bit and not group & neighbour_bit:
+                    group |= neighbour_bit
+                    unchecked.append(neighbour_index)
+        return group
+
+    def find_split_balls(self,
+                         topology: ShibumiTopology,
+                         player_balls: int,
+                         occupied: int,
+                         position_index: int) -> int:
+        """ Find the groups that a new ball might split.
+
+        A new ball can cover a ball two levels down, which drops it out of its
+        group, or finish an overpass between two of the opponent's balls. An
+        overpass between two of the player's balls doesn't matter, because
+        they're both under the new ball, and it connects them.
+        :param topology: the board's topology tables
+        :param player_balls: bitboard of balls with the new ball's colour,
+            including the new ball
+        :param occupied: bitboard of all balls, including the new ball
+        :param position_index: where the new ball was placed
+        :return: a bitboard of all the balls in groups that might be split
+        """
+        split_balls = 0
+        covered_bit = topology.covered_bits[position_index] & occupied
+        if covered_bit:
+            split_balls |= covered_bit | self.find_group(
+                covered_bit.bit_length() - 1)
+        other_balls = occupied & ~player_balls
+        for link_bits, other_overpass_bit in topology.overpass_cuts[
+                position_index]:
+            if (occupied & other_overpass_bit and
+                    other_balls & link_bits == link_bits):
+                split_balls |= self.find_group(link_bits.bit_length() - 1)
+        return split_balls
+
+    @staticmethod
+    def find_group_liberties(topology: ShibumiTopology,
+                             group: int,
+                             occupied: int) -> int:
+        """ Find the empty spaces that a group is connected to.
+
+        Only spaces on the bottom level count, and those are never cut off by
+        covers or overpasses, because anything above them needs them filled.
+        :return: a bitboard of the empty spaces
+        """
+        neighbours = topology.find_bottom_neighbours(group & topology.bottom_mask)
+        return neighbours & ~occupied
+
+    def copy(self) -> 'BallGroups':
+        return BallGroups(self.roots.copy(), self.members.copy(), self.board_key)
+
+    def add_ball(self, state: ShibumiGameState, position_index: int) -> bool:
+        """ Merge a ball that was just placed with the groups around it.
+
+        :param state: the state with the new ball on its board
+        :param position_index: where the new ball was placed
+        :return: True if the groups now match the board, or False if the new
+            ball might have split a group, so they need to be rebuilt.
+        """
+        topology = state.topology
+        occupied = state.occupied
+        player = state.get_piece(*topology.positions[position_index])
+        player_balls = state.bitboards[state.piece_types.index(player)]
+        if self.find_split_balls(topology,
+                                 player_balls,
+                                 occupied,
+                                 position_index):
+            return False
+
+        roots = self.roots
+        members = self.members
+        neighbour_roots = {
+            roots[neighbour_index]
+            for neighbour_index in topology.find_neighbours_by_mask(
+                occupied,
+                position_index)
+            if player_balls >> neighbour_index & 1}
+        if not neighbour_roots:
+            roots[position_index] = position_index
+            members[position_index] = 1 << position_index
+        else:
+            # Keep the biggest group's root, and relabel the others.
+            root = max(neighbour_roots,
+                       key=lambda neighbour_root: members[
+                           neighbour_root].bit_count())
+            group = members[root] | 1 << position_index
+            roots[position_index] = root
+            for other_root in neighbour_roots:
+                if other_root == root:
+                    continue
+                other_group = members.pop(other_root)
+                group |= other_group
+                while other_group:
+                    member_index = (other_group & -other_group).bit_length() - 1
+                    other_group &= other_group - 1
+                    roots[member_index] = root
+            members[root] = group
+        self.board_key = state.board_key
+        return True
+
+    def find_group(self, position_index: int) -> int:
+        """ Find all the balls in the same group as a ball.
+
+        :return: a bitboard of the group, or zero if the ball isn't in one
+        """
+        root = self.roots[position_index]
+        if root == self.NO_GROUP:
+            return 0
+        return self.members[root]
+
+    def find_liberties(self, state: ShibumiGameState, position_index: int) -> int:
+        """ Find the empty spaces that a ball's group is connected to.
+
+        :return: a bitboard of the empty spaces
+        """
+        return self.find_group_liberties(state.topology,
+                                         self.find_group(position_index),
+                                         state.occupied)
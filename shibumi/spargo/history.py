@@ -0,0 +1,50 @@
+import typing
+
+
+class PositionHistory:
+    """ Zobrist keys for a position and all the positions before it.
+
+    Each position links back to the history before it, so adding a position
+    is quick and doesn't copy the earlier ones, and all the states in a search
+    tree share their common history. A small bit filter of all the keys in
+    the chain answers most lookups without walking back through it, and
+    chain_key combines all the keys, so two histories with the same positions
+    have the same chain_key.
+    """
+    __slots__ = ('key', 'parent', 'length', 'key_filter', 'chain_key')
+    FILTER_BITS = 1024
+
+    def __init__(self, key: int, parent: typing.Optional['PositionHistory'] = None):
+        self.key = key
+        self.parent = parent
+        filter_bit = 1 << key % self.FILTER_BITS
+        if parent is None:
+            self.length = 1
+            self.key_filter = filter_bit
+            self.chain_key = key
+        else:
+            self.length = parent.length + 1
+            self.key_filter = parent.key_filter | filter_bit
+            self.chain_key = parent.chain_key ^ key
+
+    def __repr__(self):
+        return f'PositionHistory({self.length} positions)'
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self) -> typing.Iterator[int]:
+        """ Iterate through the keys, from the latest back to the first. """
+        history: PositionHistory | None = self
+        while history is not None:
+            yield history.key
+            history = history.parent
+
+    def __contains__(self, key: int) -> bool:
+        if not self.key_filter >> key % self.FILTER_BITS & 1:
+            return False
+        return any(old_key == key for old_key in self)
+
+    def add(self, key: int) -> 'PositionHistory':
+        """ Make a new history with another position after this one. """
+        return PositionHistory(key, self)
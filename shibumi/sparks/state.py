@@ -3,11 +3,21 @@ from copy import copy
 import numpy as np
 import typing
 
-from shibumi.shibumi_game_state import ShibumiGameState, MoveType
+from shibumi.shibumi_game_state import (ShibumiGameState, MoveType,
+                                         cached_result)
 
 
 class SparksState(ShibumiGameState):
     game_name = 'Sparks'
+    __slots__ = ('active_player',
+                 'move_count',
+                 'is_adding',
+                 'has_spark',
+                 'has_coal')
+    move_section_count = 2
+    # Pieces can be removed and added back, so random play can go in circles.
+    max_playout_moves = 200
+    is_playout_repetition_checked = True
 
     def __init__(self,
                  text: str | None = None,
@@ -40,11 +50,29 @@ class SparksState(ShibumiGameState):
             player = self.WHITE if player_text == 'W' else self.BLACK
 
         self.active_player = player
-        self.winner: typing.Optional[int] = None
 
     def get_active_player(self) -> int:
         return self.active_player
 
+    def get_extra_state(self) -> typing.Tuple[int, ...]:
+        return (self.active_player,
+                self.is_adding,
+                self.has_spark,
+                self.has_coal)
+
+    def get_serial_state(self) -> typing.Tuple[int, ...]:
+        return self.get_extra_state() + (self.move_count,)
+
+    def set_serial_state(self, serial_state: typing.Sequence[int]):
+        (self.active_player,
+         is_adding,
+         has_spark,
+         has_coal,
+         self.move_count) = serial_state
+        self.is_adding = bool(is_adding)
+        self.has_spark = bool(has_spark)
+        self.has_coal = bool(has_coal)
+
     def get_move_count(self) -> int:
         return self.move_count
 
@@ -65,12 +93,18 @@ class SparksState(ShibumiGameState):
         text += f'{prefix}{active_display}\n'
         return text
 
+    def find_move_targets(self) -> int:
+        if self.is_adding:
+            return super().find_move_targets()
+        # Take one of your own pieces.
+        return self.bitboards[self.piece_types.index(self.active_player)]
+
     def parse_move(self, text: str) -> int:
-        if len(text) != 3:
-            to_add = ''
-        else:
+        if text[:1].isalpha():
             to_add = text[0]
             text = text[1:]
+        else:
+            to_add = ''
         move_index = super().parse_move(text)
         if to_add == 'R':
             move_index += self.calculate_volume()
@@ -101,6 +135,7 @@ class SparksState(ShibumiGameState):
             base_move += self.calculate_volume()
         return base_move
 
+    @cached_result
     def get_valid_moves(self) -> np.ndarray:
         size = self.size
         volume = self.calculate_volume(size)
@@ -115,21 +150,14 @@ class SparksState(ShibumiGameState):
         else:
             player = self.get_active_player()
             piece_type = self.piece_types.index(player)
-            player_pieces = self.levels[piece_type]
-            for height, row, column in np.argwhere(player_pieces):
-                if height == size-1 and row > 0:
-                    # Outside valid spaces.
-                    continue
-                if self.is_pinned(height, row, column):
-                    continue
-                move = self.get_index(height, row, column)
-                valid_moves[move] = True
+            player_pieces = self.unpack_bitboard(self.bitboards[piece_type],
+                                                 volume).view(bool)
+            valid_moves[:volume] = player_pieces & ~self.get_pinned_mask()
 
         return valid_moves
 
     def make_move(self, move: int) -> 'ShibumiGameState':
         new_state = copy(self)
-        new_levels = new_state.levels
         new_state.move_count = self.move_count + 1
         volume = self.calculate_volume(self.size)
         position_index = move % volume
@@ -143,9 +171,7 @@ class SparksState(ShibumiGameState):
             else:
                 to_add = self.RED
                 new_state.has_spark = False
-            piece_type = self.piece_types.index(to_add)
-            new_levels[piece_type, height, row, column] = 1
-            new_state.levels = new_levels
+            new_state.set_piece(height, row, column, to_add)
             if new_state.has_spark or new_state.has_coal:
                 new_state.is_adding = True
             else:
@@ -153,27 +179,21 @@ class SparksState(ShibumiGameState):
                 new_state.is_adding = False
         else:
             new_state.remove(height, row, column)
-            new_levels = new_state.levels
-            red_piece_type = self.piece_types.index(self.RED)
-            replaced_by = new_levels[:, height, row, column]
-            if replaced_by.sum() == 0:
+            replaced_by = new_state.get_piece(height, row, column)
+            if replaced_by == self.NO_PLAYER:
                 # Space left empty.
-                new_levels[red_piece_type, height, row, column] = 1
-                new_state.levels = new_levels
+                new_state.set_piece(height, row, column, self.RED)
                 new_state.has_spark = False
             else:
-                new_state.has_spark = replaced_by[red_piece_type] == 0
+                new_state.has_spark = replaced_by != self.RED
             new_state.has_coal = True
             new_state.is_adding = True
         return new_state
 
     def is_win(self, player: int) -> bool:
-        peak = self.levels[:, 3, 0, 0]
-        black_piece_type = self.piece_types.index(self.BLACK)
-        white_piece_type = self.piece_types.index(self.WHITE)
-        player_piece_type = self.piece_types.index(player)
-        if peak[black_piece_type] or peak[white_piece_type]:
-            return bool(peak[player_piece_type])
+        peak = self.get_piece(self.size - 1, 0, 0)
+        if peak in (self.BLACK, self.WHITE):
+            return peak == player
         if not self.get_valid_moves().any():
             return player != self.active_player
         return False
@@ -0,0 +1,128 @@
+import functools
+
+import numpy as np
+
+from shibumi.shibumi_batch import ShibumiBatch
+from shibumi.shibumi_topology import ShibumiTopology
+from shibumi.spire.state import SpireState
+
+
+class SpireBatch(ShibumiBatch):
+    """ Batch of Spire boards, with a player and red move flag for each. """
+    state_class = SpireState
+
+    def __init__(self,
+                 pieces: np.ndarray,
+                 size: int = 4,
+                 active_players: np.ndarray | None = None,
+                 is_red_allowed: np.ndarray | None = None):
+        super().__init__(pieces, size)
+        if active_players is None:
+            active_players = np.full(len(pieces), SpireState.BLACK)
+        if is_red_allowed is None:
+            is_red_allowed = np.full(len(pieces), True)
+        self.active_players = active_players
+        self.is_red_allowed = is_red_allowed
+
+    @classmethod
+    def from_states(cls, states) -> 'SpireBatch':
+        batch = super().from_states(states)
+        assert isinstance(batch, SpireBatch)
+        batch.active_players[:] = [state.active_player for state in states]
+        batch.is_red_allowed[:] = [state.red_move == SpireState.RED
+                                   for state in states]
+        return batch
+
+    def create_state(self, board_index: int) -> SpireState:
+        state = SpireState()
+        state.active_player = int(self.active_players[board_index])
+        state.red_move = (SpireState.RED
+                          if self.is_red_allowed[board_index]
+                          else SpireState.NO_PLAYER)
+        return state
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def find_match_groups(size: int) -> np.ndarray:
+        """ Find the groups of positions that limit matching colours.
+
+        A piece can't match two others in any of the four squares on its
+        level that it's part of, or two of the pieces supporting it.
+        :return: an array of positions indexed by [position, group, member],
+            padded with volume.
+        """
+        topology = ShibumiTopology.get(size)
+        volume = topology.volume
+        match_groups = np.full((volume, 5, 4), volume)
+        for position_index, (height, row, column) in enumerate(
+                topology.positions):
+            level_size = size - height
+            group_index = 0
+            for dr in (-1, 1):
+                for dc in (-1, 1):
+                    square = [
+                        topology.get_position_index(height,
+                                                    other_row,
+                                                    other_column)
+                        for other_row, other_column in ((row + dr, column),
+                                                        (row, column + dc),
+                                                        (row + dr, column + dc))
+                        if (0 <= other_row < level_size and
+                            0 <= other_column < level_size)]
+                    match_groups[position_index,
+                                 group_index,
+                                 :len(square)] = square
+                    group_index += 1
+            match_groups[position_index, group_index] = topology.supporting[
+                position_index]
+        return match_groups
+
+    def find_matches(self, piece_types: np.ndarray) -> np.ndarray:
+        """ Find the positions where a piece would match too many others.
+
+        :param piece_types: the piece type to check on each board
+        :return: an array of flags indexed by [board, position]
+        """
+        colour_pieces = self.pad(self.pieces[np.arange(len(self)), piece_types])
+        match_counts = colour_pieces[:, self.find_match_groups(self.size)].sum(
+            axis=3)
+        return (match_counts >= 2).any(axis=2)
+
+    def get_valid_moves(self) -> np.ndarray:
+        volume = self.topology.volume
+        open_positions = self.find_open_positions()
+        valid_moves = np.zeros((len(self), volume * 2), bool)
+        player_types = self.find_piece_types(self.active_players)
+        valid_moves[:, :volume] = open_positions & ~self.find_matches(
+            player_types)
+        red_types = np.full(len(self), self.piece_types.index(SpireState.RED))
+        valid_moves[:, volume:] = (open_positions &
+                                   ~self.find_matches(red_types) &
+                                   self.is_red_allowed[:, np.newaxis])
+        return valid_moves
+
+    def get_winners(self) -> np.ndarray:
+        """ The player who can't move loses. """
+        has_moves = self.get_valid_moves().any(axis=1)
+        return np.where(has_moves, SpireState.NO_PLAYER, -self.active_players)
+
+    def make_moves(self, moves: np.ndarray) -> 'SpireBatch':
+        volume = self.topology.volume
+        pieces = self.pieces.copy()
+        active_players = self.active_players.copy()
+        is_red_allowed = self.is_red_allowed.copy()
+        board_indexes = np.flatnonzero(moves != self.NO_MOVE)
+        board_moves = moves[board_indexes]
+        is_red = board_moves >= volume
+        colours = np.where(is_red,
+                           SpireState.RED,
+                           active_players[board_indexes])
+        pieces[board_indexes,
+               self.find_piece_types(colours),
+               board_moves % volume] = True
+        active_players[board_indexes] = np.where(
+            is_red,
+            active_players[board_indexes],
+            -active_players[board_indexes])
+        is_red_allowed[board_indexes] = ~is_red
+        return SpireBatch(pieces, self.size, active_players, is_red_allowed)
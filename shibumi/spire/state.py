@@ -5,11 +5,14 @@ from itertools import product
 
 import numpy as np
 
-from shibumi.shibumi_game_state import ShibumiGameState, MoveType
+from shibumi.shibumi_game_state import (ShibumiGameState, MoveType,
+                                         cached_result)
 
 
 class SpireState(ShibumiGameState):
     game_name = 'Spire'
+    __slots__ = ('active_player', 'red_move')
+    move_section_count = 2
 
     def __init__(self, text: str | None = None):
         """ Initialize a board state.
@@ -37,8 +40,6 @@ class SpireState(ShibumiGameState):
                 red_move = self.NO_PLAYER
         self.active_player = player
         self.red_move = red_move
-        self.winner = self.NO_PLAYER
-        self.is_end_checked = False
 
     def display(self, show_coordinates: bool = False) -> str:
         text = super().display(show_coordinates)
@@ -63,6 +64,13 @@ class SpireState(ShibumiGameState):
     def get_active_player(self) -> int:
         return self.active_player
 
+    def get_extra_state(self) -> typing.Tuple[int, ...]:
+        return self.active_player, self.red_move
+
+    def set_serial_state(self, serial_state: typing.Sequence[int]):
+        self.active_player, self.red_move = serial_state
+
+    @cached_result
     def get_valid_moves(self) -> np.ndarray:
         volume = self.calculate_volume(self.size)
         valid_moves: np.ndarray = np.ndarray(volume * 2, bool)
@@ -77,9 +85,6 @@ class SpireState(ShibumiGameState):
             self.check_colour_matches(red_moves, self.RED)
 
         self.check_colour_matches(player_moves, self.active_player)
-        if not valid_moves.any():
-            self.winner = -self.active_player
-        self.is_end_checked = True
         return valid_moves
 
     def check_colour_matches(self, valid_moves: np.ndarray, colour: int):
@@ -128,9 +133,9 @@ class SpireState(ShibumiGameState):
         return indexes
 
     def is_win(self, player: int) -> bool:
-        if not self.is_end_checked:
-            self.get_valid_moves()
-        return player == self.winner
+        # You lose when you have no valid moves.
+        return (player == -self.active_player and
+                not self.get_valid_moves().any())
 
     def make_move(self, move: int) -> 'ShibumiGameState':
         volume = self.calculate_volume()
@@ -145,11 +150,8 @@ class SpireState(ShibumiGameState):
             next_red = self.RED
         move_space = move % volume
         new_state = copy(self)
-        levels = new_state.levels
         height, row, column = self.get_coordinates(move_space)
-        piece_type = self.piece_types.index(move_colour)
-        levels[piece_type, height, row, column] = 1
-        new_state.levels = levels
+        new_state.set_piece(height, row, column, move_colour)
         new_state.active_player = next_player
         new_state.red_move = next_red
         return new_state
@@ -0,0 +1,57 @@
+import functools
+import typing
+
+import numpy as np
+
+from shibumi.shibumi_batch import ShibumiBatch
+from shibumi.shibumi_topology import ShibumiTopology
+from shibumi.spline.game import SplineState
+
+
+class SplineBatch(ShibumiBatch):
+    state_class = SplineState
+    piece_types = SplineState.BLACK, SplineState.WHITE
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def find_lines(size: int) -> typing.Tuple[np.ndarray, np.ndarray]:
+        """ Find all the winning lines on a board.
+
+        :return: (line_positions, line_lengths), where line_positions is an
+            array of flags indexed by [line, position].
+        """
+        topology = ShibumiTopology.get(size)
+        lines = SplineState.find_lines(size)
+        line_positions = np.zeros((len(lines), topology.volume), bool)
+        for line_index, line_indexes in enumerate(lines):
+            line_positions[line_index, list(line_indexes)] = True
+        return line_positions, line_positions.sum(axis=1)
+
+    def get_active_players(self) -> np.ndarray:
+        black_counts, white_counts = self.pieces.sum(axis=2).T
+        return np.where(black_counts == white_counts,
+                        SplineState.BLACK,
+                        SplineState.WHITE)
+
+    def get_winners(self) -> np.ndarray:
+        line_positions, line_lengths = self.find_lines(self.size)
+        line_counts = self.pieces.astype(np.int16) @ line_positions.T
+        wins = (line_counts == line_lengths).any(axis=2)
+        winners = np.full(len(self), SplineState.NO_PLAYER)
+        # Black gets checked first, like SplineState.get_winner().
+        winners[wins[:, 1]] = SplineState.WHITE
+        winners[wins[:, 0]] = SplineState.BLACK
+        return winners
+
+    def get_valid_moves(self) -> np.ndarray:
+        valid_moves = self.find_open_positions()
+        valid_moves[self.get_winners() != SplineState.NO_PLAYER] = False
+        return valid_moves
+
+    def make_moves(self, moves: np.ndarray) -> 'SplineBatch':
+        pieces = self.pieces.copy()
+        board_indexes = np.flatnonzero(moves != self.NO_MOVE)
+        piece_types = self.find_piece_types(
+            self.get_active_players()[board_indexes])
+        pieces[board_indexes, piece_types, moves[board_indexes]] = True
+        return SplineBatch(pieces, self.size)
@@ -1,49 +1,87 @@
-from shibumi.shibumi_game_state import ShibumiGameState
+import functools
+import typing
+
+from shibumi.shibumi_game_state import ShibumiGameState, cached_result
+from shibumi.shibumi_topology import ShibumiTopology
 
 
 class SplineState(ShibumiGameState):
     """ Spline game class implementing the zero-play GameState interface. """
 
     game_name = 'Spline'
+    __slots__ = ()
 
     @property
     def piece_types(self):
         return self.BLACK, self.WHITE
 
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def find_lines(size: int) -> typing.Tuple[typing.Tuple[int, ...], ...]:
+        """ Find all the winning lines on a board.
+
+        Each line is a row, column, or diagonal that crosses a whole level.
+        :return: the position indexes in each line
+        """
+        topology = ShibumiTopology.get(size)
+        lines: typing.Dict[typing.Tuple[int, ...], None] = {}
+        for height in range(size):
+            level_size = size - height
+            rows = [[(row, column) for column in range(level_size)]
+                    for row in range(level_size)]
+            columns = [[(row, column) for row in range(level_size)]
+                       for column in range(level_size)]
+            diagonals = [[(i, i) for i in range(level_size)],
+                         [(level_size - 1 - i, i) for i in range(level_size)]]
+            for line in rows + columns + diagonals:
+                line_indexes = tuple(sorted(
+                    topology.get_position_index(height, row, column)
+                    for row, column in line))
+                lines[line_indexes] = None  # The peak is in several lines.
+        return tuple(lines)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def find_line_masks(size: int) -> typing.Tuple[
+            typing.Tuple[int, ...],
+            typing.Tuple[typing.Tuple[int, ...], ...]]:
+        """ Find the winning lines as bitboards.
+
+        :return: (line_masks, position_line_masks), where position_line_masks
+            has the masks of all the lines through each position.
+        """
+        volume = ShibumiTopology.get(size).volume
+        lines = SplineState.find_lines(size)
+        line_masks = tuple(sum(1 << position_index
+                               for position_index in line)
+                           for line in lines)
+        position_line_masks = tuple(
+            tuple(line_mask
+                  for line, line_mask in zip(lines, line_masks)
+                  if position_index in line)
+            for position_index in range(volume))
+        return line_masks, position_line_masks
+
+    @cached_result
     def is_win(self, player: int) -> bool:
-        levels = self.levels
         piece_type = self.piece_types.index(player)
-        player_pieces = levels[piece_type]
-        if self.is_straight_winner(player_pieces):
-            return True
-        if self.is_diagonal_winner(player_pieces):
-            return True
-        return False
-
-    def is_diagonal_winner(self, player_pieces):
-        """Checks if player_pieces contains a diagonal win."""
-        for height in range(self.size):
-            level_size = self.size - height
-            level_pieces = player_pieces[height, :level_size, :level_size]
-            diagonal_pieces = level_pieces.diagonal()
-            if diagonal_pieces.all():
-                return True
-            if level_size > 1:
-                diagonal_pieces = level_pieces[-1::-1].diagonal()
-                if diagonal_pieces.all():
-                    return True
-        return False
-
-    def is_straight_winner(self, player_pieces):
-        """Checks if player_pieces contains a vertical or horizontal win."""
-        for height in range(self.size):
-            level_size = self.size - height
-            for row in range(level_size):
-                row_pieces = player_pieces[height, row, :level_size]
-                if row_pieces.all():
-                    return True
-            for column in range(level_size):
-                row_pieces = player_pieces[height, :level_size, column]
-                if row_pieces.all():
-                    return True
-        return False
+        player_pieces = self.bitboards[piece_type]
+        line_masks, _ = self.find_line_masks(self.size)
+        return any(player_pieces & line_mask == line_mask
+                   for line_mask in line_masks)
+
+    def make_move(self, move: int) -> 'ShibumiGameState':
+        """ Add a piece, and only check the lines through it for a win. """
+        player = self.get_active_player()
+        new_state = super().make_move(move)
+        piece_type = self.piece_types.index(player)
+        player_pieces = new_state.bitboards[piece_type]
+        _, position_line_masks = self.find_line_masks(self.size)
+        is_win = self.is_win(player) or any(
+            player_pieces & line_mask == line_mask
+            for line_mask in position_line_masks[move])
+        new_state.set_cached_result(SplineState.is_win, is_win, player)
+        new_state.set_cached_result(SplineState.is_win,
+                                    self.is_win(-player),
+                                    -player)
+        return new_state
@@ -1,13 +1,20 @@
+import functools
 from copy import copy
 
 import numpy as np
 import typing
 
-from shibumi.shibumi_game_state import ShibumiGameState, MoveType
+from shibumi.shibumi_game_state import (ShibumiGameState, MoveType,
+                                         cached_result)
+from shibumi.shibumi_topology import ShibumiTopology
 
 
 class SploofState(ShibumiGameState):
     game_name = 'Sploof'
+    __slots__ = ('active_player', 'player_stock', 'opponent_stock')
+    move_section_count = 2
+    # Stocks can keep growing, so random play doesn't have to end.
+    max_playout_moves = 200
 
     def __init__(self,
                  text: str | None = None,
@@ -37,7 +44,6 @@ class SploofState(ShibumiGameState):
         self.active_player = player
         self.player_stock = player_stock
         self.opponent_stock = opponent_stock
-        self.winner: typing.Optional[int] = None
 
     def display(self, show_coordinates: bool = False) -> str:
         text = super().display(show_coordinates)
@@ -56,6 +62,7 @@ class SploofState(ShibumiGameState):
             player_display = 'B'
         return player_display + position_display
 
+    @cached_result
     def get_valid_moves(self) -> np.ndarray:
         size = self.size
         volume = self.calculate_volume(size)
@@ -63,37 +70,28 @@ class SploofState(ShibumiGameState):
         # if self.is_win(self.BLACK) or self.is_win(self.WHITE):
         #     return valid_moves
 
-        levels = self.levels
         player_stock = self.player_stock
         if 0 < player_stock:
             self.fill_supported_moves(valid_moves)
-        usable_positions = self.get_usable_positions()
-        filled_positions = np.logical_and(levels.sum(axis=0),
-                                          usable_positions)
         red_type = self.piece_types.index(self.RED)
-        red_positions = np.logical_and(levels[red_type],
-                                       filled_positions)
-        supporting_counts = np.zeros(levels.shape[1:], np.int8)
-        supporting_counts[:-1, :, :] += filled_positions[1:, :, :]
-        supporting_counts[:-1, 1:, :] += filled_positions[1:, :-1, :]
-        supporting_counts[:-1, :, 1:] += filled_positions[1:, :, :-1]
-        supporting_counts[:-1, 1:, 1:] += filled_positions[1:, :-1, :-1]
-        unpinned_positions = supporting_counts < 2
-        unpinned_red: np.ndarray = np.logical_and(red_positions,
-                                                  unpinned_positions)
-
-        combined_volume = size * size * size
-        usable_indexes = usable_positions.reshape(combined_volume)
-        unpinned_red_reshaped = unpinned_red.reshape(combined_volume)
-        valid_moves[volume:] = unpinned_red_reshaped[usable_indexes]
+        red_pieces = self.unpack_bitboard(self.bitboards[red_type],
+                                          volume).view(bool)
+        valid_moves[volume:] = red_pieces & ~self.get_pinned_mask()
         return valid_moves
 
     def get_active_player(self) -> int:
         return self.active_player
 
+    def get_extra_state(self) -> typing.Tuple[int, ...]:
+        return self.active_player, self.player_stock, self.opponent_stock
+
+    def set_serial_state(self, serial_state: typing.Sequence[int]):
+        (self.active_player,
+         self.player_stock,
+         self.opponent_stock) = serial_state
+
     def make_move(self, move: int) -> 'ShibumiGameState':
         new_state = copy(self)
-        new_levels = new_state.levels
         volume = self.calculate_volume(self.size)
         position_index = move % volume
         height, row, column = self.get_coordinates(position_index)
@@ -102,9 +100,7 @@ class SploofState(ShibumiGameState):
         old_player_stock = self.player_stock
         new_player_stock = self.opponent_stock
         if move < volume:
-            piece_type = self.piece_types.index(player)
-            new_levels[piece_type, height, row, column] = 1
-            new_state.levels = new_levels
+            new_state.set_piece(height, row, column, player)
             old_player_stock -= 1
         else:
             new_state.remove(height, row, column)
@@ -129,69 +125,120 @@ class SploofState(ShibumiGameState):
         return self.opponent_stock
 
     def is_win(self, player: int) -> bool:
-        if self.winner is not None:
-            pass
-        elif self.has_line(player):
-            self.winner = player
-        elif self.has_line(-player):
-            self.winner = -player
+        return self.get_winner() == player
+
+    @cached_result
+    def get_winner(self) -> int:
+        for player in self.get_players():
+            if self.has_line(player):
+                return player
+        if self.get_valid_moves().any():
+            return self.NO_PLAYER
+        # Active player has no valid moves, opponent wins.
+        return -self.get_active_player()
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def find_line_masks(size: int) -> typing.Tuple[
+            typing.Tuple[typing.Tuple[int, typing.Tuple[int, ...]], ...],
+            typing.Tuple[int, ...],
+            typing.Tuple[int, ...]]:
+        """ Find the lines that can win, as bitboards.
+
+        Rows and columns on the bottom level win, unless pieces on the second
+        level cross over them. Diagonals win if they show as many of a
+        player's pieces from above as the width of the board, on any level.
+        That uses a top view, with one bit in an expanded grid for each
+        column of positions stacked on top of each other.
+        :return: (straight_lines, diagonal_masks, view_bits), where
+            straight_lines has (line_mask, cut_masks) for each row and column,
+            and the line is cut off when both bits of any cut mask are
+            occupied. diagonal_masks are bitboards of the top view, and
+            view_bits has the top view bit for each position.
+        """
+        topology = ShibumiTopology.get(size)
+        position_index = topology.get_position_index
+
+        straight_lines = []
+        for is_row in (True, False):
+            for i in range(size):
+                line_mask = 0
+                for j in range(size):
+                    row, column = (i, j) if is_row else (j, i)
+                    line_mask |= 1 << position_index(0, row, column)
+                cut_masks = []
+                if 0 < i < size - 1:
+                    for j in range(size - 1):
+                        if is_row:
+                            crossing = ((i - 1, j), (i, j))
+                        else:
+                            crossing = ((j, i - 1), (j, i))
+                        cut_masks.append(sum(1 << position_index(1, row, column)
+                                             for row, column in crossing))
+                straight_lines.append((line_mask, tuple(cut_masks)))
+
+        expanded_size = 2 * size - 1
+        start_count = expanded_size - size + 1
+        view_bits = tuple(1 << ((height + 2 * row) * expanded_size +
+                                height + 2 * column)
+                          for height, row, column in topology.positions)
+        diagonal_masks = []
+        for row in range(start_count):
+            for column in range(start_count):
+                for start_row, row_step in ((row, 1), (row + size - 1, -1)):
+                    diagonal_masks.append(sum(
+                        1 << ((start_row + i * row_step) * expanded_size +
+                              column + i)
+                        for i in range(size)))
+        return tuple(straight_lines), tuple(diagonal_masks), view_bits
+
+    @cached_result
+    def get_straight_lines(self) -> typing.Tuple[int, ...]:
+        """ Find the rows and columns that aren't cut off, for both players. """
+        occupied = self.occupied
+        straight_lines, _, _ = self.find_line_masks(self.size)
+        return tuple(line_mask
+                     for line_mask, cut_masks in straight_lines
+                     if not any(occupied & cut_mask == cut_mask
+                                for cut_mask in cut_masks))
+
+    @cached_result
+    def get_top_views(self) -> typing.Tuple[int, ...]:
+        """ Find which pieces show from above, as top view bitboards.
+
+        :return: a top view for each piece type
+        """
+        topology = self.topology
+        _, _, view_bits = self.find_line_masks(self.size)
+        covered = 0
+        if self.size > 2:
+            # Only pieces from the third level up cover other pieces.
+            third_level = topology.level_starts[2]
+            upper_pieces = self.occupied >> third_level << third_level
         else:
-            # Not the active player, see if the active player has no valid moves.
-            valid_moves = self.get_valid_moves()
-            if valid_moves.any():
-                self.winner = self.NO_PLAYER
-            else:
-                # Active player has no valid moves, opponent wins.
-                self.winner = -self.get_active_player()
-        return self.winner == player
+            upper_pieces = 0
+        while upper_pieces:
+            position_bit = upper_pieces & -upper_pieces
+            upper_pieces ^= position_bit
+            covered |= topology.covered_bits[position_bit.bit_length() - 1]
+        top_views = []
+        for bitboard in self.bitboards:
+            top_view = 0
+            top_pieces = bitboard & ~covered
+            while top_pieces:
+                position_bit = top_pieces & -top_pieces
+                top_pieces ^= position_bit
+                top_view |= view_bits[position_bit.bit_length() - 1]
+            top_views.append(top_view)
+        return tuple(top_views)
 
     def has_line(self, player: int) -> bool:
-        usable_positions = self.get_usable_positions()
-        levels = self.levels
         piece_type = self.piece_types.index(player)
-        player_pieces = np.logical_and(levels[piece_type], usable_positions)
-        filled_positions = np.logical_and(levels.sum(axis=0),
-                                          usable_positions)
-        cutoff_pieces = levels[:, 1, :-1, :-1].sum(axis=0)  # Either colour.
-        # Count the number of the player's pieces in each row on the base level.
-        row_counts = player_pieces[0].sum(1)
-        # Zero out any rows that are cut off by pieces crossing over.
-        blocked_row_pieces = np.logical_and(cutoff_pieces[:-1, :],
-                                            cutoff_pieces[1:, :])
-        blocked_rows = blocked_row_pieces.any(1)
-        row_counts[1:-1] *= np.logical_not(blocked_rows)
-        if (row_counts == 4).any():
-            return True
-        # Count the number of the player's pieces in each column.
-        column_counts = player_pieces[0].sum(0)
-        # Zero out any columns that are cut off by pieces crossing over.
-        blocked_column_pieces = np.logical_and(cutoff_pieces[:, :-1],
-                                               cutoff_pieces[:, 1:])
-        blocked_columns = blocked_column_pieces.any(0)
-        column_counts[1:-1] *= np.logical_not(blocked_columns)
-        if (column_counts == 4).any():
-            return True
-
-        # Decide which colour is on top of each position.
-        size = self.size
-        expanded_size = size * 2 - 1
-        top_pieces = np.zeros((expanded_size, expanded_size), bool)
-        for height in range(size):
-            level_view = top_pieces[height:expanded_size-height:2,
-                                    height:expanded_size-height:2]
-            level_pieces = player_pieces[height, :size-height, :size-height]
-            level_filled = filled_positions[height, :size-height, :size-height]
-            level_view[level_filled] = level_pieces[level_filled]
-        line_counts1 = np.zeros((expanded_size-3, expanded_size-3), np.int8)
-        line_counts2 = np.zeros((expanded_size-3, expanded_size-3), np.int8)
-        for i in range(4):
-            line_counts1 += top_pieces[i:expanded_size-3+i, i:expanded_size-3+i]
-            line_counts2 += top_pieces[3-i:expanded_size-i, i:expanded_size-3+i]
-        # noinspection PyUnresolvedReferences
-        if (line_counts1 == 4).any():
-            return True
-        # noinspection PyUnresolvedReferences
-        if (line_counts2 == 4).any():
-            return True
-
-        return False
+        player_pieces = self.bitboards[piece_type]
+        for line_mask in self.get_straight_lines():
+            if player_pieces & line_mask == line_mask:
+                return True
+        top_view = self.get_top_views()[piece_type]
+        _, diagonal_masks, _ = self.find_line_masks(self.size)
+        return any(top_view & diagonal_mask == diagonal_mask
+                   for diagonal_mask in diagonal_masks)
@@ -1,14 +1,18 @@
+import functools
 from copy import copy
 
 import numpy as np
 import typing
 
-from shibumi.shibumi_game_state import ShibumiGameState, PlayerCode
+from shibumi.shibumi_game_state import (ShibumiGameState, PlayerCode,
+                                         cached_result)
+from shibumi.shibumi_topology import ShibumiTopology
 
 
 class SpookState(ShibumiGameState):
     game_name = 'Spook'
     players = (ShibumiGameState.RED, ShibumiGameState.BLACK)
+    __slots__ = ('active_player', 'move_count', 'restricted_colour')
 
     def __init__(self,
                  text: str | None = None,
@@ -66,6 +70,14 @@ class SpookState(ShibumiGameState):
     def get_active_player(self) -> int:
         return self.active_player
 
+    def get_extra_state(self) -> typing.Tuple[int, ...]:
+        return self.active_player, self.restricted_colour, self.move_count
+
+    def set_serial_state(self, serial_state: typing.Sequence[int]):
+        (self.active_player,
+         self.restricted_colour,
+         self.move_count) = serial_state
+
     def get_players(self) -> typing.Iterable[int]:
         return self.BLACK, self.RED
 
@@ -79,17 +91,15 @@ class SpookState(ShibumiGameState):
             # Add a piece.
             new_state = super().make_move(move)
             assert isinstance(new_state, SpookState)
-            new_levels = new_state.levels
             if move_count == volume - 2:
                 height = self.size - 2
                 for row in range(2):
                     for column in range(2):
-                        if new_levels[:, height, row, column].sum() == 0:
-                            new_piece_type = self.piece_types.index(new_player)
-                            new_levels[new_piece_type, height, row, column] = 1
+                        if not new_state.is_occupied(height, row, column):
+                            new_state.set_piece(height, row, column, new_player)
 
                             # Add ghost on top
-                            new_levels[1, height + 1, 0, 0] = 1
+                            new_state.set_piece(height + 1, 0, 0, self.WHITE)
 
                             # No restriction on colour to remove
                             restricted_colour = self.NO_PLAYER
@@ -97,27 +107,19 @@ class SpookState(ShibumiGameState):
         elif move == volume:
             # Pass the turn.
             new_state = copy(self)
-            new_levels = new_state.levels
             restricted_colour = self.NO_PLAYER
         else:
             # Remove a piece or move the ghost.
             new_state = copy(self)
-            new_levels = new_state.levels
             height, row, column = move_coordinates = self.get_coordinates(move)
-            removed_piece_types = np.argwhere(new_levels[:, height, row, column])
-            if removed_piece_types.size:
-                removed_piece_type = removed_piece_types[0, 0]
-                removed_piece = self.piece_types[removed_piece_type]
-            else:
-                removed_piece = self.NO_PLAYER
+            removed_piece = new_state.get_piece(height, row, column)
             new_state.remove(height, row, column)
-            new_levels = new_state.levels
             ghost_coordinates = new_state.find_ghost()
             restricted_colour = self.NO_PLAYER
             if ghost_coordinates != move_coordinates:
                 # This wasn't a ghost drop.
                 is_neighbour_captured = False
-                if new_levels[:, height, row, column].sum() == 0:
+                if not new_state.is_occupied(height, row, column):
                     if removed_piece == self.NO_PLAYER:
                         is_neighbour_captured = False
                     else:
@@ -127,34 +129,21 @@ class SpookState(ShibumiGameState):
                         is_neighbour_captured = ghost_distance == 1
                     if is_neighbour_captured or removed_piece == self.NO_PLAYER:
                         # Move ghost.
-                        ghost_height, ghost_row, ghost_column = ghost_coordinates
-                        new_levels[:, ghost_height, ghost_row, ghost_column] = 0
-                        new_levels[1, height, row, column] = 1
+                        new_state.set_piece(*ghost_coordinates,
+                                            self.NO_PLAYER)
+                        new_state.set_piece(height, row, column, self.WHITE)
 
                 if is_neighbour_captured:
                     # Check if more matching neighbours are available.
-                    height, row, column = move_coordinates
-                    for height2, row2, column2 in self.find_possible_neighbours(
-                            self.size,
-                            height,
-                            row,
-                            column,
-                            dh_start=0,
-                            dh_end=1):
-                        piece_types = np.argwhere(new_levels[:, height2, row2, column2])
-                        if piece_types.size:
-                            piece_type = piece_types[0, 0]
-                            piece = self.piece_types[piece_type]
-                        else:
-                            piece = self.NO_PLAYER
-                        if piece == removed_piece and self.is_free(height2,
-                                                                   row2,
-                                                                   column2):
-                            new_player = player
-                            restricted_colour = removed_piece
-                            break
+                    level_masks = self.find_level_neighbour_masks(self.size)
+                    removed_type = self.piece_types.index(removed_piece)
+                    matches = self.select_supporting(
+                        level_masks[move] & new_state.bitboards[removed_type],
+                        0)
+                    if matches:
+                        new_player = player
+                        restricted_colour = removed_piece
 
-        new_state.levels = new_levels
         new_state.active_player = new_player
         new_state.move_count = move_count
         new_state.restricted_colour = restricted_colour
@@ -163,6 +152,7 @@ class SpookState(ShibumiGameState):
     def get_move_count(self) -> int:
         return self.move_count
 
+    @cached_result
     def get_valid_moves(self) -> np.ndarray:
         volume = self.calculate_volume(self.size)
         valid_moves = np.full(volume+1, False)
@@ -175,81 +165,119 @@ class SpookState(ShibumiGameState):
         else:
             # If you've already moved this turn, you may pass.
             valid_moves[-1] = self.restricted_colour != self.NO_PLAYER
-
-            # Look to see if the ghost can capture one of its neighbours.
-            neighbour_count = 0
-            valid_neighbour_count = 0
-            levels = self.levels
-            ghost_height, ghost_row, ghost_column = self.find_ghost()
-            for height, row, column in self.find_possible_neighbours(
-                    self.size,
-                    ghost_height,
-                    ghost_row,
-                    ghost_column,
-                    dh_start=-1,
-                    dh_end=1):
-                piece_types = np.argwhere(levels[:, height, row, column])
-                if piece_types.size:
-                    piece_type = piece_types[0, 0]
-                    piece = self.piece_types[piece_type]
-                else:
-                    piece = self.NO_PLAYER
-                if piece == self.NO_PLAYER:
-                    continue
-                neighbour_count += 1
-                if self.restricted_colour not in (self.NO_PLAYER, piece):
-                    continue
-                if height == ghost_height:
-                    if not self.is_free(height, row, column):
-                        continue
-                else:
-                    if self.restricted_colour != self.NO_PLAYER:
-                        # Can't drop once you start moving horizontally.
-                        continue
-                    if self.is_pinned(height, row, column):
-                        continue
-                move = self.get_index(height, row, column)
-                valid_moves[move] = True
-                valid_neighbour_count += 1
-            if neighbour_count == 0:
-                # No neighbours, so see where the ghost can move.
-                self.fill_supported_moves(valid_moves)
-                for move, in np.argwhere(valid_moves):
-                    height, row, column = self.get_coordinates(move)
-                    if height > 0:
-                        # Any valid moves are supported, so stop checking.
-                        break
-                    for height2, row2, column2 in self.find_possible_neighbours(
-                            self.size,
-                            height,
-                            row,
-                            column,
-                            dh_start=0,
-                            dh_end=1):
-                        neighbour_black, neighbour_white, neighbour_red = \
-                            levels[:, height2, row2, column2]
-                        if neighbour_black or neighbour_red:
-                            break
-                    else:
-                        # No neighbours, so not allowed to move ghost there.
-                        valid_moves[move] = False
-            elif valid_neighbour_count == 0:
-                # No free neighbours, so see which opponents can be removed.
-                player = self.get_active_player()
-                opponent = self.RED if player == self.BLACK else self.BLACK
-                opponent_type = self.piece_types.index(opponent)
-                opponent_pieces = levels[opponent_type]
-                for height, row, column in np.argwhere(opponent_pieces):
-                    if opponent_pieces[height, row, column]:
-                        if self.is_pinned(height, row, column):
-                            continue
-                        move = self.get_index(height, row, column)
-                        valid_moves[move] = True
+            valid_moves[:volume] = self.unpack_bitboard(
+                self.find_ghost_moves(),
+                volume)
         return valid_moves
 
+    def find_move_targets(self) -> int:
+        open_positions = super().find_move_targets()
+        if self.restricted_colour == self.UNUSABLE:
+            return open_positions  # Still adding.
+        # Move the ghost, or capture a piece.
+        return open_positions | self.occupied
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def find_level_neighbour_masks(size: int) -> typing.Tuple[int, ...]:
+        """ Find the neighbours on the same level as each position.
+
+        :return: a bitboard for each position, whether or not any neighbours
+            are cut off.
+        """
+        topology = ShibumiTopology.get(size)
+        return tuple(
+            sum(1 << topology.get_position_index(*neighbour)
+                for neighbour in topology.find_possible_neighbours(size,
+                                                                   height,
+                                                                   row,
+                                                                   column,
+                                                                   dh_start=0,
+                                                                   dh_end=1))
+            for height, row, column in topology.positions)
+
+    def find_ghost_moves(self) -> int:
+        """ Find where the ghost can capture, drop, or move to.
+
+        The ghost captures a free neighbour on its own level, or drops into
+        the space below it by capturing an unpinned piece there. With no
+        neighbours at all, it moves to an open space next to a piece. If
+        none of its neighbours can be captured, an unpinned opponent piece
+        can be removed instead.
+        :return: a bitboard of the positions to move to or remove
+        """
+        topology = self.topology
+        piece_types = self.piece_types
+        black_pieces = self.bitboards[piece_types.index(self.BLACK)]
+        red_pieces = self.bitboards[piece_types.index(self.RED)]
+        pieces = black_pieces | red_pieces
+        ghost_index = self.find_ghost_index()
+        level_masks = self.find_level_neighbour_masks(self.size)
+        level_neighbours = level_masks[ghost_index] & pieces
+        lower_neighbours = topology.support_masks[ghost_index] & pieces
+        if not level_neighbours | lower_neighbours:
+            # Open spaces above the bottom level are next to the pieces that
+            # support them.
+            bottom_mask = topology.bottom_mask
+            piece_neighbours = topology.find_bottom_neighbours(
+                pieces & bottom_mask)
+            return self.get_open_positions() & (~bottom_mask |
+                                                piece_neighbours)
+
+        restricted_colour = self.restricted_colour
+        if restricted_colour == self.NO_PLAYER:
+            moves = (self.select_supporting(level_neighbours, 0) |
+                     self.select_supporting(lower_neighbours, 1))
+        else:
+            # Can't drop once you start moving horizontally.
+            allowed_pieces = self.bitboards[piece_types.index(
+                restricted_colour)]
+            moves = self.select_supporting(level_neighbours & allowed_pieces,
+                                           0)
+        if moves:
+            return moves
+
+        # No free neighbours, so see which opponents can be removed.
+        opponent = self.RED if self.active_player == self.BLACK else self.BLACK
+        opponent_pieces = self.bitboards[piece_types.index(opponent)]
+        return self.select_supporting(opponent_pieces, 1)
+
+    def select_supporting(self, positions: int, max_count: int) -> int:
+        """ Select positions that support no more than max_count pieces.
+
+        :param positions: a bitboard of the positions to check
+        :param max_count: the most pieces a selected position can support,
+            either 0 or 1
+        :return: a bitboard of the selected positions
+        """
+        return positions & self.find_supporting_bits(max_count)
+
+    @cached_result
+    def find_supporting_bits(self, max_count: int) -> int:
+        """ Pack get_free_mask() or the opposite of get_pinned_mask().
+
+        :param max_count: 0 for free positions, or 1 for unpinned positions
+        :return: a bitboard of all the positions that support no more than
+            max_count pieces
+        """
+        if max_count == 0:
+            mask = self.get_free_mask()
+        elif max_count == 1:
+            mask = ~self.get_pinned_mask()
+        else:
+            raise ValueError(f'Invalid max count: {max_count}.')
+        return self.pack_bitboard(mask)
+
+    def find_ghost_index(self) -> int:
+        """ Find the ghost's position index from its bitboard. """
+        ghost_type = self.piece_types.index(self.WHITE)
+        ghost_index = self.bitboards[ghost_type].bit_length() - 1
+        if ghost_index < 0:
+            raise ValueError('No ghost found.')
+        return ghost_index
+
     def find_ghost(self) -> typing.Tuple[int, int, int]:
-        ghost_locations: np.ndarray = np.argwhere(self.levels[1])
-        return tuple(ghost_locations[0])  # type: ignore
+        return self.get_coordinates(self.find_ghost_index())
 
     def is_win(self, player: int) -> bool:
         if self.restricted_colour:
@@ -257,6 +285,7 @@ class SpookState(ShibumiGameState):
         pieces = self.get_piece_count(player)
         return pieces == 0
 
+    @cached_result
     def get_winner(self) -> int:
         """ Decide which player has won, if any.
 
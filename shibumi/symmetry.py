@@ -0,0 +1,140 @@
+""" Rotations and reflections of Shibumi boards.
+
+Each level of the pyramid is a square, so the board has the same eight
+symmetries as a square: four rotations, and four reflections. Rotating or
+reflecting every level the same way keeps each ball on the four balls that
+support it, so a transformed position plays exactly the same as the
+original. Search results, opening books, and training data can be shared
+between all eight versions of a position by looking them up with the
+canonical key.
+"""
+
+import functools
+import typing
+
+import numpy as np
+
+from shibumi.shibumi_game_state import ShibumiGameState
+from shibumi.shibumi_topology import ShibumiTopology
+
+
+class BoardSymmetries:
+    """ Position and move maps for all the symmetries of one size of board.
+
+    Symmetries are numbered from 0 to 7 in the same order as NAMES, and 0 is
+    the identity. Each map is an array with the new index for each old index.
+    """
+    NAMES = ('identity',
+             'rotate 90',
+             'rotate 180',
+             'rotate 270',
+             'flip rows',
+             'flip columns',
+             'transpose',
+             'anti-transpose')
+    SYMMETRY_COUNT = len(NAMES)
+
+    def __init__(self, size: int):
+        self.size = size
+        self.topology = topology = ShibumiTopology.get(size)
+        heights, rows, columns = topology.coordinates.T
+        last = size - heights - 1  # last row or column on each level
+        transformed = ((rows, columns),
+                       (columns, last - rows),
+                       (last - rows, last - columns),
+                       (last - columns, rows),
+                       (last - rows, columns),
+                       (rows, last - columns),
+                       (columns, rows),
+                       (last - columns, last - rows))
+        self.position_maps = np.array(
+            [topology.position_indexes[heights, new_rows, new_columns]
+             for new_rows, new_columns in transformed])
+        self.position_maps.flags.writeable = False
+
+        identity = np.arange(topology.volume)
+        self.inverses: typing.Tuple[int, ...] = tuple(
+            next(inverse
+                 for inverse, inverse_map in enumerate(self.position_maps)
+                 if np.array_equal(inverse_map[position_map], identity))
+            for position_map in self.position_maps)
+
+        # Zobrist key for a piece that ends up in each position, indexed by
+        # [symmetry, piece_type, old_position].
+        zobrist_keys = np.array(topology.zobrist_keys, np.uint64)
+        self.zobrist_tables = zobrist_keys[:, self.position_maps].swapaxes(0, 1)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def get(size: int) -> 'BoardSymmetries':
+        """ Get the shared symmetries for a board size. """
+        return BoardSymmetries(size)
+
+    @functools.lru_cache(maxsize=None)
+    def find_move_maps(self, move_count: int) -> np.ndarray:
+        """ Find how the moves change for each symmetry.
+
+        Moves come in sections, with one move for each position in each
+        section. Any extra moves after the last full section, like passing in
+        Spook, don't change.
+        :param move_count: the number of moves in the game
+        :return: a read only array with the new move index for each
+            symmetry and old move index.
+        """
+        volume = self.topology.volume
+        section_count = move_count // volume
+        extra_moves = np.arange(section_count * volume, move_count)
+        move_maps = np.array([
+            np.concatenate([position_map + section * volume
+                            for section in range(section_count)] +
+                           [extra_moves])
+            for position_map in self.position_maps])
+        move_maps.flags.writeable = False
+        return move_maps
+
+    def transform_state(self,
+                        state: ShibumiGameState,
+                        symmetry: int) -> ShibumiGameState:
+        """ Rotate or reflect a game state. """
+        return state.transform(self.position_maps[symmetry].tolist())
+
+    def transform_moves(self, move_values: np.ndarray, symmetry: int) -> np.ndarray:
+        """ Rotate or reflect a set of valid moves or move probabilities.
+
+        :param move_values: an array with moves on the last axis
+        :param symmetry: which symmetry to apply
+        :return: a new array with each value moved to its new move index
+        """
+        move_map = self.find_move_maps(move_values.shape[-1])[symmetry]
+        new_values = np.empty_like(move_values)
+        new_values[..., move_map] = move_values
+        return new_values
+
+    def find_board_keys(self, state: ShibumiGameState) -> np.ndarray:
+        """ Find the board's Zobrist key after each symmetry. """
+        volume = self.topology.volume
+        flags = np.array([state.unpack_bitboard(bitboard, volume)
+                          for bitboard in state.bitboards], bool)
+        tables = self.zobrist_tables[:, :len(flags)]
+        return np.bitwise_xor.reduce(np.where(flags, tables, np.uint64(0)),
+                                     axis=(1, 2))
+
+    def find_canonical(self, state: ShibumiGameState) -> typing.Tuple[int, int]:
+        """ Choose one version of a position to represent all its symmetries.
+
+        All eight versions of a position choose the same canonical version.
+        :return: (symmetry, key), where symmetry transforms the state into
+            its canonical version, and key is the canonical version's Zobrist
+            key.
+        """
+        board_keys = self.find_board_keys(state).tolist()
+        best_key = best_symmetry = None
+        for symmetry, board_key in enumerate(board_keys):
+            extra_state = state.transform_extra_state(
+                self.position_maps[symmetry].tolist())
+            key = state.calculate_zobrist_key(board_key, extra_state)
+            if best_key is None or key < best_key:
+                best_key = key
+                best_symmetry = symmetry
+        assert best_key is not None and best_symmetry is not None
+        return best_symmetry, best_key
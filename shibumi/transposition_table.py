@@ -0,0 +1,223 @@
+""" Share search results between positions that different move orders reach.
+
+The zero_play search tree has a separate node for each move order, so the
+same position gets its valid moves and end of game checked over and over. A
+TranspositionTable remembers those results by the position's Zobrist hash,
+and the search classes here use it to expand nodes and to start new nodes
+with the statistics from earlier visits.
+"""
+
+import typing
+from collections import OrderedDict
+
+import numpy as np
+
+from shibumi.shibumi_game_state import ShibumiGameState
+from zero_play.game_state import GameState
+from zero_play.heuristic import Heuristic
+from zero_play.mcts_player import MctsPlayer, SearchManager, SearchNode
+
+
+class TranspositionEntry:
+    """ Everything the table knows about one position.
+
+    Results are filled in the first time they're asked for.
+    """
+    def __init__(self):
+        self.valid_moves: np.ndarray | None = None
+        self.is_ended: bool | None = None
+        self.winner: int | None = None
+
+        # Values are from the point of view of the position's active player.
+        self.value_count = 0
+        self.total_value = 0.0
+
+    @property
+    def average_value(self) -> float:
+        if self.value_count == 0:
+            return 0.0
+        return self.total_value / self.value_count
+
+
+class TranspositionTable:
+    """ Bounded cache of results for game states, keyed by their hashes.
+
+    Shibumi states use their transposition_key instead, so games like Spargo
+    can include their history. When the table is full, the least recently
+    used entry gets dropped. Two different positions with the same 64-bit
+    hash would share an entry, but that's rare enough to ignore.
+    """
+    DEFAULT_MAX_SIZE = 100_000
+
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE):
+        self.max_size = max_size
+        self.entries: typing.OrderedDict[int, TranspositionEntry] = (
+            OrderedDict())
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = 0
+
+    @staticmethod
+    def find_key(game_state: GameState) -> int:
+        if isinstance(game_state, ShibumiGameState):
+            return game_state.transposition_key
+        return hash(game_state)
+
+    def find_entry(self,
+                   game_state: GameState,
+                   is_counted: bool = False) -> TranspositionEntry:
+        """ Find the entry for a game state, adding it if it's new.
+
+        :param game_state: the position to look up
+        :param is_counted: True if this lookup is a search probe that should
+            be counted in the hits and misses. Lookups for recording values
+            aren't counted.
+        """
+        key = self.find_key(game_state)
+        entry = self.entries.get(key)
+        if entry is not None:
+            if is_counted:
+                self.hits += 1
+            self.entries.move_to_end(key)
+            return entry
+        if is_counted:
+            self.misses += 1
+        entry = self.entries[key] = TranspositionEntry()
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        return entry
+
+    def get_valid_moves(self, game_state: GameState) -> np.ndarray:
+        """ Cached version of game_state.get_valid_moves().
+
+        The array is shared, so it's marked read only.
+        """
+        entry = self.find_entry(game_state, is_counted=True)
+        if entry.valid_moves is None:
+            entry.valid_moves = game_state.get_valid_moves()
+            entry.valid_moves.flags.writeable = False
+        return entry.valid_moves
+
+    def is_ended(self, game_state: GameState) -> bool:
+        """ Cached version of game_state.is_ended(). """
+        entry = self.find_entry(game_state, is_counted=True)
+        if entry.is_ended is None:
+            entry.is_ended = game_state.is_ended()
+        return entry.is_ended
+
+    def get_winner(self, game_state: GameState) -> int:
+        """ Cached version of game_state.get_winner(). """
+        entry = self.find_entry(game_state, is_counted=True)
+        if entry.winner is None:
+            entry.winner = game_state.get_winner()
+        return entry.winner
+
+    def record_value(self, game_state: GameState, value: float):
+        """ Add a search result to a game state's statistics.
+
+        :param game_state: the position that was evaluated
+        :param value: the value for the position's active player
+        """
+        entry = self.find_entry(game_state)
+        entry.value_count += 1
+        entry.total_value += value
+
+    def get_summary(self) -> str:
+        lookup_count = self.hits + self.misses
+        hit_rate = self.hits / lookup_count if lookup_count else 0.0
+        return (f'{len(self)} positions, {self.hits} hits, '
+                f'{self.misses} misses ({hit_rate:.0%} hit rate)')
+
+
+class TranspositionSearchNode(SearchNode):
+    """ Search node that shares results with its transpositions.
+
+    A new node starts with any statistics that the table already has for its
+    position, so the search doesn't evaluate it again as a new leaf.
+    """
+    def __init__(self,
+                 game_state: GameState,
+                 table: TranspositionTable,
+                 parent: typing.Optional['TranspositionSearchNode'] = None,
+                 move: int | None = None):
+        super().__init__(game_state, parent, move)
+        self.children: typing.Optional[typing.List[SearchNode]] = None
+        self.table = table
+        entry = table.find_entry(game_state)
+        if entry.value_count:
+            self.value_count = entry.value_count
+            self.average_value = entry.average_value
+            if self.is_value_flipped():
+                self.average_value *= -1
+
+    def is_value_flipped(self) -> bool:
+        """ Check if this node's values are for the parent's player. """
+        return (not self.parent or
+                self.parent.game_state.get_active_player() !=
+                self.game_state.get_active_player())
+
+    def find_all_children(self) -> typing.List[SearchNode]:
+        if self.children is not None:
+            return self.children
+        children: typing.List[SearchNode] = []
+        if self.table.is_ended(self.game_state):
+            return children
+        valid_moves = self.table.get_valid_moves(self.game_state)
+        for move in np.flatnonzero(valid_moves).tolist():
+            child_state = self.game_state.make_move(move)
+            children.append(TranspositionSearchNode(child_state,
+                                                    self.table,
+                                                    self,
+                                                    move))
+        self.children = children
+        return children
+
+    def record_value(self,
+                     value: float,
+                     child_predictions: np.ndarray | None = None):
+        self.table.record_value(self.game_state, value)
+        super().record_value(value, child_predictions)
+
+
+class TranspositionSearchManager(SearchManager):
+    """ Search manager that builds its tree from TranspositionSearchNodes. """
+    def __init__(self,
+                 start_state: GameState,
+                 heuristic: Heuristic,
+                 table: TranspositionTable,
+                 process_count: int = 1):
+        self.table = table
+        super().__init__(start_state, heuristic, process_count)
+
+    @classmethod
+    def install(cls,
+                player: MctsPlayer,
+                table: TranspositionTable) -> 'TranspositionSearchManager':
+        """ Switch an existing player over to use a transposition table.
+
+        Keeps the old search manager's process pool, instead of starting a
+        new one.
+        """
+        old_manager = player.search_manager
+        new_manager = cls(old_manager.start_state, old_manager.heuristic, table)
+        new_manager.process_count = old_manager.process_count
+        new_manager.executor = old_manager.executor
+        player.search_manager = new_manager
+        return new_manager
+
+    def reset(self) -> SearchNode:
+        self.current_node = TranspositionSearchNode(self.start_state,
+                                                    self.table)
+        return self.current_node
+
+    def find_node(self, game_state: GameState):
+        super().find_node(game_state)
+        if not isinstance(self.current_node, TranspositionSearchNode):
+            # Parent class couldn't find it in the tree, so it started over.
+            self.current_node = TranspositionSearchNode(game_state, self.table)
@@ -0,0 +1,43 @@
+""" Compare random playouts with a batch against playouts with single states.
+
+Plays the same number of random games both ways, and reports the time per
+game for each.
+"""
+
+from timeit import default_timer
+
+import numpy as np
+
+from shibumi.shibumi_batch import ShibumiBatch
+from shibumi.spire.batch import SpireBatch
+from shibumi.spline.batch import SplineBatch
+
+
+def play_states(batch: ShibumiBatch, random: np.random.Generator):
+    for state in batch.to_states():
+        while not state.is_ended():
+            valid_moves = np.flatnonzero(state.get_valid_moves())
+            state = state.make_move(int(random.choice(valid_moves)))
+
+
+def main():
+    game_count = 1000
+    for batch_class in (SplineBatch, SpireBatch):
+        random = np.random.default_rng(0)
+        batch = batch_class.create(game_count)
+
+        start_time = default_timer()
+        batch.play_random_games(random)
+        batch_time = default_timer() - start_time
+
+        start_time = default_timer()
+        play_states(batch_class.create(game_count // 10), random)
+        state_time = (default_timer() - start_time) * 10
+
+        print(f'{batch_class.state_class.game_name}: '
+              f'{batch_time/game_count*1e6:.0f}us per game in a batch, '
+              f'{state_time/game_count*1e6:.0f}us per game with states.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+""" Measure the memory and copy time for game states in each game.
+
+Plays random games and keeps every state, like a search tree does, then
+reports the bytes allocated per stored state and the time to copy one. The
+board tables that states of the same size share aren't counted.
+"""
+
+import tracemalloc
+import typing
+from copy import copy
+from timeit import default_timer
+
+import numpy as np
+
+from shibumi.margo.state import MargoState
+from shibumi.sandbox.game import SandboxState
+from shibumi.shibumi_game_state import ShibumiGameState
+from shibumi.spaiji.game import SpaijiState
+from shibumi.spargo.game import SpargoState
+from shibumi.sparks.state import SparksState
+from shibumi.spire.state import SpireState
+from shibumi.spline.game import SplineState
+from shibumi.sploof.state import SploofState
+from shibumi.spook.state import SpookState
+
+
+def play_games(start_state: ShibumiGameState,
+               game_count: int,
+               max_moves: int = 100) -> typing.List[ShibumiGameState]:
+    random = np.random.default_rng(0)
+    states = []
+    for _ in range(game_count):
+        state = start_state
+        for _ in range(max_moves):
+            valid_moves = np.flatnonzero(state.get_valid_moves())
+            if valid_moves.size == 0:
+                break
+            state = state.make_move(int(random.choice(valid_moves)))
+            states.append(state)
+    return states
+
+
+def measure_state_bytes(start_state: ShibumiGameState,
+                        game_count: int) -> typing.Tuple[float, int]:
+    """ Find the average bytes allocated for each state that's kept.
+
+    :return: (bytes_per_state, state_count)
+    """
+    tracemalloc.start()
+    try:
+        start_bytes, _ = tracemalloc.get_traced_memory()
+        states = play_games(start_state, game_count)
+        end_bytes, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return (end_bytes - start_bytes) / len(states), len(states)
+
+
+def time_copies(states: typing.List[ShibumiGameState],
+                repeat_count: int = 5) -> float:
+    """ Find the average time to copy a state, in the fastest repetition. """
+    best_time = float('inf')
+    for _ in range(repeat_count):
+        start_time = default_timer()
+        for state in states:
+            copy(state)
+        best_time = min(best_time, default_timer() - start_time)
+    return best_time / len(states)
+
+
+def main():
+    start_states = (SplineState(),
+                    SpireState(),
+                    SpargoState(),
+                    MargoState(),
+                    SparksState(),
+                    SpaijiState(),
+                    SploofState(),
+                    SpookState(),
+                    SandboxState())
+    for start_state in start_states:
+        start_state.get_valid_moves()  # Build shared tables before measuring.
+        bytes_per_state, state_count = measure_state_bytes(start_state,
+                                                           game_count=5)
+        copy_time = time_copies(play_games(start_state, game_count=5))
+        print(f'{start_state.game_name} (size {start_state.size}), '
+              f'{state_count} states: '
+              f'{bytes_per_state:.0f} bytes per state, '
+              f'copy {copy_time*1e6:.2f}us.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+""" Compare fill_supported_moves() with the old loop over every space.
+
+Plays random moves in Spargo and Margo to collect positions at all stages of
+the game, checks that all versions find the same supported moves, then
+reports the average time per call. The whole board version recalculates from
+scratch, and the carried version uses the open positions that each state
+carries forward from its parent.
+"""
+
+import typing
+from timeit import default_timer
+
+import numpy as np
+
+from shibumi.margo.state import MargoState
+from shibumi.shibumi_game_state import ShibumiGameState
+from shibumi.spargo.game import SpargoState
+
+
+def fill_supported_moves_by_loop(state: ShibumiGameState,
+                                 valid_moves: np.ndarray):
+    """ The original version that checks each space separately. """
+    levels = state.levels
+    piece_index = 0
+    for height in range(state.size):
+        level_size = state.size - height
+        for row in range(level_size):
+            for column in range(level_size):
+                if height == 0:
+                    is_supported = True
+                else:
+                    below_height = height - 1
+                    is_supported = all(
+                        levels[:, below_height, lower_row, lower_column].sum() != 0
+                        for lower_row in range(row, row + 2)
+                        for lower_column in range(column, column + 2))
+                is_valid = is_supported and levels[:, height, row, column].sum() == 0
+                valid_moves[piece_index] = is_valid
+                piece_index += 1
+
+
+def fill_supported_moves_by_board(state: ShibumiGameState,
+                                  valid_moves: np.ndarray):
+    """ Recalculate the open positions from the whole board. """
+    volume = state.calculate_volume()
+    open_positions = state.get_supported_positions() & ~state.occupied
+    valid_moves[:volume] = state.unpack_bitboard(open_positions, volume)
+
+
+def collect_states(start_state: ShibumiGameState,
+                   game_count: int) -> typing.List[ShibumiGameState]:
+    random = np.random.default_rng(0)
+    states = []
+    for _ in range(game_count):
+        state = start_state
+        while not state.is_ended():
+            states.append(state)
+            valid_moves = np.flatnonzero(state.get_valid_moves())
+            state = state.make_move(int(random.choice(valid_moves)))
+    return states
+
+
+def time_calls(states: typing.List[ShibumiGameState], fill_moves) -> float:
+    valid_moves = np.zeros(states[0].calculate_volume(), bool)
+    start_time = default_timer()
+    for state in states:
+        fill_moves(state, valid_moves)
+    return (default_timer() - start_time) / len(states)
+
+
+def main():
+    for start_state in (SpargoState(), MargoState()):
+        states = collect_states(start_state, game_count=5)
+        volume = start_state.calculate_volume()
+        for state in states:
+            expected_moves = np.zeros(volume, bool)
+            board_moves = np.zeros(volume, bool)
+            carried_moves = np.zeros(volume, bool)
+            fill_supported_moves_by_loop(state, expected_moves)
+            fill_supported_moves_by_board(state, board_moves)
+            state.fill_supported_moves(carried_moves)
+            assert np.array_equal(board_moves, expected_moves), state.display()
+            assert np.array_equal(carried_moves, expected_moves), state.display()
+        loop_time = time_calls(states, fill_supported_moves_by_loop)
+        board_time = time_calls(states, fill_supported_moves_by_board)
+        carried_time = time_calls(states, ShibumiGameState.fill_supported_moves)
+        print(f'{start_state.game_name} (size {start_state.size}), '
+              f'{len(states)} positions: '
+              f'loop {loop_time*1e6:.1f}us, '
+              f'whole board {board_time*1e6:.1f}us '
+              f'({loop_time/board_time:.1f}x faster), '
+              f'carried {carried_time*1e6:.1f}us '
+              f'({loop_time/carried_time:.1f}x faster).')
+
+
+if __name__ == '__main__':
+    main()
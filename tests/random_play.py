@@ -0,0 +1,38 @@
+import itertools
+import typing
+
+import numpy as np
+
+from shibumi.shibumi_game_state import ShibumiGameState
+
+StateType = typing.TypeVar('StateType', bound=ShibumiGameState)
+
+
+def play_random_moves(
+        start_state: StateType,
+        max_moves: int | None = None,
+        move_limit: int | None = None,
+        seed: int = 0) -> typing.Iterator[StateType]:
+    """ Play random moves, for tests that compare two ways to find something.
+
+    :param start_state: the first state to yield
+    :param max_moves: the most moves to play, or None to play until the game
+        ends.
+    :param move_limit: only choose moves with indexes below this, or None to
+        choose from all valid moves.
+    :param seed: seeds the random choices, so each game is repeatable.
+    :return: start_state, then the state after each move
+    """
+    random = np.random.default_rng(seed)
+    state = start_state
+    yield state
+    move_counts = itertools.count() if max_moves is None else range(max_moves)
+    for _ in move_counts:
+        if state.is_ended():
+            return
+        valid_moves = state.get_valid_moves()[:move_limit]
+        if not valid_moves.any():
+            return
+        move = int(random.choice(np.flatnonzero(valid_moves)))
+        state = state.make_move(move)  # type: ignore
+        yield state
@@ -5,6 +5,8 @@ from PySide6.QtWidgets import QGraphicsScene, QApplication
 from shibumi.sandbox.display import SandboxDisplay
 from shibumi.sandbox.game import SandboxState
 from shibumi.shibumi_game_state import MoveType
+from shibumi.transposition_table import TranspositionSearchManager
+from zero_play.mcts_player import MctsPlayer
 from zero_play.pixmap_differ import PixmapDiffer, render_display
 
 
@@ -316,3 +318,26 @@ def test_hover_enter_leave(pixmap_differ: PixmapDiffer):
         display.on_hover_leave(piece_item)
 
         render_display(display, actual)
+
+
+def test_players_share_transposition_table(application):
+    display = SandboxDisplay()
+    players = [MctsPlayer(display.start_state, display.start_state.BLACK),
+               MctsPlayer(display.start_state, display.start_state.WHITE)]
+    table = display.transposition_table
+    start_state = display.start_state
+    table.record_value(start_state.make_move(0), 1.0)
+
+    display.mcts_players = players
+
+    # Installing the new players only adds their start position. They don't
+    # search until a move is needed, so nothing is recorded yet.
+    assert display.mcts_players == players
+    assert list(table.entries) == [start_state.transposition_key]
+    assert table.find_entry(start_state).value_count == 0
+    for player in players:
+        assert isinstance(player.search_manager, TranspositionSearchManager)
+        assert player.search_manager.table is display.transposition_table
+    worker_thread = display.worker_thread
+    display.close()
+    worker_thread.wait()
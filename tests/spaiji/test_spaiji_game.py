@@ -1,6 +1,8 @@
+import numpy as np
 import pytest
 
 from shibumi.spaiji.game import SpaijiState
+from tests.random_play import play_random_moves
 
 
 def test_start():
@@ -356,3 +358,57 @@ def test_early_end():
     # Tie goes to black
     assert not board.is_win(board.WHITE)
     assert board.is_win(board.BLACK)
+
+
+def test_follow_up_mask_matches_moves():
+    """ Compare the mask with making each move and looking for neighbours. """
+    volume = SpaijiState().calculate_volume()
+    for seed in range(5):
+        for state in play_random_moves(SpaijiState(), seed=seed):
+            if state.last_column < 0:
+                follow_up_mask = state.find_follow_up_mask()
+                open_moves = np.flatnonzero(state.unpack_bitboard(
+                    state.get_open_positions(),
+                    volume))
+                for move in open_moves.tolist():
+                    new_state = state.make_move(move)
+                    assert (follow_up_mask[move] ==
+                            new_state.get_valid_moves().any())
+
+
+def test_group_not_connected_to_edge():
+    board = SpaijiState('''\
+  A C E G
+7 . . . . 7
+
+5 . B B . 5
+
+3 . B . . 3
+
+1 W . . . 1
+  A C E G
+>W
+''')
+
+    assert board.get_scores() == {board.WHITE: 1, board.BLACK: 0}
+
+
+def test_cached_scores_read_only():
+    board = SpaijiState('''\
+  A C E G
+7 . . . . 7
+
+5 . . . . 5
+
+3 . . . . 3
+
+1 W . . . 1
+  A C E G
+>B
+''')
+    scores = board.get_scores()
+
+    with pytest.raises(TypeError):
+        scores[board.WHITE] = 10  # type: ignore
+
+    assert board.get_scores() == {board.WHITE: 1, board.BLACK: 0}
@@ -0,0 +1,132 @@
+import numpy as np
+import pytest
+
+from shibumi.margo.state import MargoState
+from shibumi.spargo.game import IllegalMoveError, SpargoState
+from shibumi.spargo.groups import BallGroups
+from tests.random_play import play_random_moves
+
+
+def test_merge_groups():
+    state1 = SpargoState("""\
+  A C E G
+7 . . . . 7
+
+5 . . . . 5
+
+3 B . B . 3
+
+1 . . . . 1
+  A C E G
+""")
+    expected_group = sum(1 << state1.get_position_index(0, 1, column)
+                         for column in range(3))
+    move = state1.get_index(0, 1, 1)
+
+    state2 = state1.make_move(move)
+    groups = state2.get_groups()
+
+    assert groups.find_group(state2.get_position_index(0, 1, 0)) == expected_group
+    assert groups.find_group(state2.get_position_index(0, 1, 2)) == expected_group
+
+
+def test_liberties():
+    state = SpargoState("""\
+  A C E G
+7 . . . . 7
+
+5 . . . . 5
+
+3 B W . . 3
+
+1 B . . . 1
+  A C E G
+""")
+    groups = state.get_groups()
+    expected_liberties = sum(1 << state.get_position_index(0, row, column)
+                             for row, column in ((0, 1), (2, 0)))
+
+    liberties = groups.find_liberties(state, state.get_position_index(0, 0, 0))
+
+    assert liberties == expected_liberties
+
+
+def test_covered_ball_not_grouped():
+    state = SpargoState("""\
+  A C E G
+7 . . . . 7
+
+5 W W W . 5
+
+3 W B W . 3
+
+1 W W W . 1
+  A C E G
+   B D F
+ 6 . . . 6
+
+ 4 W W . 4
+
+ 2 W W . 2
+   B D F
+    C E
+  5 . . 5
+
+  3 W . 3
+    C E
+""")
+    groups = state.get_groups()
+
+    assert groups.find_group(state.get_position_index(0, 1, 1)) == 0
+
+
+def test_groups_rebuilt_after_other_changes():
+    state = SpargoState()
+    groups = state.get_groups()
+
+    state.set_piece(0, 0, 0, state.BLACK)
+
+    assert state.get_groups() is not groups
+    assert state.get_groups().find_group(0) == 1
+
+
+@pytest.mark.parametrize('start_state', [SpargoState(), MargoState()])
+def test_groups_match_search(start_state: SpargoState):
+    """ Compare the tracked groups with a search from scratch. """
+    topology = start_state.topology
+    for seed in range(3):
+        for state in play_random_moves(start_state, seed=seed):
+            groups = state.get_groups()
+            expected_groups = BallGroups.build(state)
+            occupied = state.occupied
+            for position_index in range(topology.volume):
+                height, row, column = topology.positions[position_index]
+                if (not occupied >> position_index & 1 or
+                        occupied & topology.cover_bits[position_index]):
+                    continue
+                group: set = set()
+                has_freedom = state.has_freedom(height, row, column, group)
+                liberties = groups.find_liberties(state, position_index)
+
+                assert bool(liberties) == has_freedom
+                assert (groups.find_group(position_index) ==
+                        expected_groups.find_group(position_index))
+                if not has_freedom:
+                    expected_group = sum(1 << state.get_position_index(*ball)
+                                         for ball in group)
+                    assert groups.find_group(position_index) == expected_group
+
+
+@pytest.mark.parametrize('start_state', [SpargoState(), MargoState()])
+def test_check_move_matches_make_move(start_state: SpargoState):
+    for seed in range(3):
+        for state in play_random_moves(start_state, seed=seed):
+            supported_moves = np.full(state.topology.volume, False)
+            state.fill_supported_moves(supported_moves)
+            for move in np.flatnonzero(supported_moves).tolist():
+                try:
+                    expected_key = state.make_move(move).zobrist_key
+                except IllegalMoveError:
+                    expected_key = None
+
+                assert state.check_move(move) == expected_key
@@ -0,0 +1,42 @@
+from shibumi.spargo.game import SpargoState
+from shibumi.spargo.history import PositionHistory
+
+
+def test_add():
+    history1 = PositionHistory(10)
+
+    history2 = history1.add(20)
+
+    assert list(history2) == [20, 10]
+    assert len(history2) == 2
+    assert 10 in history2
+    assert 20 not in history1
+    assert 30 not in history2
+
+
+def test_chain_key():
+    history1 = PositionHistory(10).add(20).add(30)
+    history2 = PositionHistory(20).add(10).add(30)
+    history3 = PositionHistory(10).add(30)
+
+    assert history1.chain_key == history2.chain_key
+    assert history3.chain_key != history1.chain_key
+
+
+def test_filter_collision():
+    history = PositionHistory(5)
+
+    assert 5 + PositionHistory.FILTER_BITS not in history
+
+
+def test_moves_share_history():
+    state1 = SpargoState()
+    state2 = state1.make_move(0)
+
+    state3 = state2.make_move(1)
+
+    assert state3.history.parent is state2.history
+    assert state2.history.parent is state1.history
+    assert list(state3.history) == [state3.zobrist_key,
+                                    state2.zobrist_key,
+                                    state1.zobrist_key]
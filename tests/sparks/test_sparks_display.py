@@ -1,4 +1,7 @@
+from shibumi.capped_playout import CappedPlayout
 from shibumi.sparks.display import SparksDisplay
+from shibumi.sparks.state import SparksState
+from zero_play.mcts_player import MctsPlayer
 
 
 def test_start(application):
@@ -19,3 +22,21 @@ def test_second_move(application):
     assert display.ui.move_white.isVisibleTo(display)
     assert not display.ui.move_black.isVisibleTo(display)
     assert not display.ui.move_red.isVisibleTo(display)
+
+
+def test_players_use_capped_playout(application):
+    display = SparksDisplay()
+    players = [MctsPlayer(display.start_state, display.start_state.BLACK),
+               MctsPlayer(display.start_state, display.start_state.WHITE)]
+
+    display.mcts_players = players
+
+    for player in players:
+        heuristic = player.heuristic
+        assert isinstance(heuristic, CappedPlayout)
+        assert heuristic.max_moves == SparksState.max_playout_moves
+        assert heuristic.is_repetition_checked
+        assert player.search_manager.heuristic is heuristic
+    worker_thread = display.worker_thread
+    display.close()
+    worker_thread.wait()
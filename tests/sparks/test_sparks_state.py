@@ -497,3 +497,23 @@ def test_all_pinned():
     assert state.get_piece_count(state.BLACK) == 8
     assert state.is_win(state.WHITE)
     assert not state.is_win(state.BLACK)
+
+
+def test_peak_win_larger_board():
+    state = SparksState(size=5)
+    for height in range(1, 4):
+        for row in range(5 - height):
+            for column in range(5 - height):
+                state.set_piece(height, row, column, state.RED)
+    state.set_piece(4, 0, 0, state.WHITE)
+
+    assert state.is_win(state.WHITE)
+    assert not state.is_win(state.BLACK)
+
+
+def test_parse_move_two_digit_row():
+    state = SparksState(size=6)
+    move = state.get_index(0, 5, 0)
+
+    assert state.display_move(move) == '11A'
+    assert state.parse_move('11A') == move
@@ -2,6 +2,7 @@
 import pytest
 
 from shibumi.spline.game import SplineState
+from tests.random_play import play_random_moves
 
 
 def test_start_display():
@@ -299,6 +300,14 @@ def test_add_stone_bad_row():
         board1.parse_move('9C')
 
 
+@pytest.mark.parametrize('text', ['', 'C', '5'])
+def test_add_stone_too_short(text):
+    board1 = SplineState()
+
+    with pytest.raises(ValueError, match=f'Invalid move: {text}.'):
+        board1.parse_move(text)
+
+
 def test_full_spaces_valid_moves():
     board = SplineState("""\
   A C E G
@@ -541,3 +550,20 @@ def test_get_move_count():
     move_count = board.get_move_count()
 
     assert move_count == 5
+
+
+def test_move_win_matches_full_check():
+    for seed in range(20):
+        for state in play_random_moves(SplineState(), seed=seed):
+            fresh_state = SplineState.from_bytes(state.to_bytes())
+
+            assert state.is_win(state.BLACK) == fresh_state.is_win(state.BLACK)
+            assert state.is_win(state.WHITE) == fresh_state.is_win(state.WHITE)
+
+
+def test_line_masks():
+    line_masks, position_line_masks = SplineState.find_line_masks(4)
+
+    assert len(line_masks) == 25
+    assert position_line_masks[29] == (1 << 29,)  # Peak wins by itself.
+    assert len(position_line_masks[0]) == 3  # Row, column, and diagonal.
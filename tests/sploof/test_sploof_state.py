@@ -412,3 +412,144 @@ def test_let_opponent_win():
     state2 = state1.make_move(32)
 
     assert state2.get_winner() == state2.WHITE
+
+
+def test_win_after_parent_checked():
+    state1 = SploofState("""\
+  A C E G
+7 R R R . 7
+
+5 R B B R 5
+
+3 R B W R 3
+
+1 R R R W 1
+  A C E G
+   B D F
+ 6 . . . 6
+
+ 4 . . . 4
+
+ 2 . . W 2
+   B D F
+>W(1,0)
+""")
+    assert state1.get_winner() == state1.NO_PLAYER
+
+    state2 = state1.make_move(state1.get_index(height=1, row=1, column=1))
+
+    assert state2.get_winner() == state2.WHITE
+
+
+def test_covered_diagonal():
+    """ Black piece on the third level hides part of the white diagonal. """
+    state = SploofState("""\
+  A C E G
+7 R R R . 7
+
+5 R B B R 5
+
+3 R B W R 3
+
+1 R R R W 1
+  A C E G
+   B D F
+ 6 . . . 6
+
+ 4 . W R 4
+
+ 2 . R W 2
+   B D F
+    C E
+  5 . . 5
+
+  3 . B 3
+    C E
+>B(1,0)
+""")
+
+    assert state.get_winner() == state.NO_PLAYER
+
+
+def test_diagonal_win_larger_board():
+    state = SploofState(size=5)
+    for height, row, column in ((0, 0, 0), (0, 1, 1), (1, 0, 0)):
+        state.set_piece(height, row, column, state.WHITE)
+    for row, column in ((1, 2), (2, 1)):
+        state.set_piece(0, row, column, state.BLACK)
+    state.set_piece(1, 1, 1, state.WHITE)
+
+    # Four in a row isn't enough on a board that's five wide.
+    assert not state.has_line(state.WHITE)
+
+    state.set_piece(0, 2, 2, state.WHITE)
+
+    assert state.has_line(state.WHITE)
+
+
+def test_top_view_diagonal_win_larger_board():
+    """ White diagonal runs up and down the levels, hiding a black piece. """
+    state = SploofState("""\
+  A C E G I
+9 R R R R R 9
+
+7 R B B W R 7
+
+5 R B B B R 5
+
+3 R W B B R 3
+
+1 R R R R R 1
+  A C E G I
+   B D F H
+ 8 . . . . 8
+
+ 6 . B W . 6
+
+ 4 . W B . 4
+
+ 2 . . . . 2
+   B D F H
+    C E G
+  7 . . . 7
+
+  5 . W . 5
+
+  3 . . . 3
+    C E G
+>W(2,2)
+""", size=5)
+
+    assert state.get_winner() == state.WHITE
+
+
+def test_cutoff_row_larger_board():
+    state = SploofState("""\
+  A C E G I
+9 R R R R R 9
+
+7 R B B . R 7
+
+5 W W W W W 5
+
+3 R B B . R 3
+
+1 R R R R R 1
+  A C E G I
+   B D F H
+ 8 . . . . 8
+
+ 6 . B . . 6
+
+ 4 . B . . 4
+
+ 2 . . . . 2
+   B D F H
+>W(2,2)
+""", size=5)
+
+    assert state.get_winner() == state.NO_PLAYER
+
+    state.remove(1, 2, 1)
+
+    assert state.get_winner() == state.WHITE
@@ -928,3 +928,32 @@ def test_display_move():
     move_display = state.display_move(0)
 
     assert move_display == '1A'
+
+
+def test_select_supporting():
+    state = SpookState("""\
+  A C E G
+7 . . . . 7
+
+5 . . . . 5
+
+3 R B R . 3
+
+1 B R B . 1
+  A C E G
+   B D F
+ 6 . . . 6
+
+ 4 . . . 4
+
+ 2 B R . 2
+   B D F
+>R
+""")
+    bottom_pieces = 0b1110111  # 1A, 1C, 1E, 3A, 3C, 3E
+
+    free_pieces = state.select_supporting(bottom_pieces, 0)
+    unpinned_pieces = state.select_supporting(bottom_pieces, 1)
+
+    assert free_pieces == 0
+    assert unpinned_pieces == 0b1010101  # 1C and 3C support two pieces.
@@ -0,0 +1,97 @@
+import typing
+
+import numpy as np
+
+from shibumi.capped_playout import CappedPlayout, PlayoutEnd
+from shibumi.sandbox.game import SandboxState
+from shibumi.sparks.state import SparksState
+from shibumi.spline.game import SplineState
+from shibumi.sploof.state import SploofState
+from zero_play.game_state import GameState
+from zero_play.heuristic import Heuristic
+from zero_play.mcts_player import MctsPlayer
+from zero_play.playout import Playout
+
+
+class FixedHeuristic(Heuristic):
+    def __init__(self, value: float):
+        self.value = value
+
+    def get_summary(self) -> typing.Sequence[str]:
+        return f'fixed {self.value}',
+
+    def analyse(self, board: GameState) -> typing.Tuple[float, np.ndarray]:
+        return self.value, self.create_even_policy(board)
+
+
+def test_uncapped_matches_playout():
+    state = SploofState()
+    np.random.seed(0)
+    expected_values = [Playout().simulate(state) for _ in range(10)]
+    playout = CappedPlayout(max_moves=1000, is_repetition_checked=True)
+
+    np.random.seed(0)
+    results = [playout.simulate_with_end(state) for _ in range(10)]
+
+    assert results == [(value, PlayoutEnd.ENDED) for value in expected_values]
+
+
+def test_capped_draw():
+    playout = CappedPlayout(max_moves=3)
+
+    result = playout.simulate_with_end(SparksState())
+
+    assert result == (0, PlayoutEnd.CAPPED)
+
+
+def test_capped_heuristic():
+    playout = CappedPlayout(max_moves=2, capped_heuristic=FixedHeuristic(0.5))
+
+    value = playout.simulate(SplineState())
+
+    # Two moves later, the same player is active.
+    assert value == 0.5
+    assert playout.get_summary() == ['capped playout',
+                                     'max moves 2',
+                                     'fixed 0.5']
+
+
+def test_capped_heuristic_for_opponent():
+    playout = CappedPlayout(max_moves=1, capped_heuristic=FixedHeuristic(0.5))
+
+    value = playout.simulate(SplineState())
+
+    assert value == -0.5
+
+
+def test_repetition():
+    """ The sandbox never ends, but it soon repeats a position. """
+    np.random.seed(0)
+    playout = CappedPlayout(is_repetition_checked=True)
+
+    result = playout.simulate_with_end(SandboxState(size=2))
+
+    assert result == (0, PlayoutEnd.REPEATED)
+
+
+def test_from_state():
+    sparks_playout = CappedPlayout.from_state(SparksState())
+    sploof_playout = CappedPlayout.from_state(SploofState())
+
+    assert sparks_playout is not None
+    assert sparks_playout.get_summary() == ['capped playout',
+                                            'max moves 200',
+                                            'stop on repetition']
+    assert sploof_playout is not None
+    assert sploof_playout.get_summary() == ['capped playout', 'max moves 200']
+    assert CappedPlayout.from_state(SplineState()) is None
+
+
+def test_search_with_capped_playout():
+    start_state = SparksState()
+    playout = CappedPlayout.from_state(start_state)
+    player = MctsPlayer(start_state, iteration_count=20, heuristic=playout)
+
+    move = player.choose_move(start_state)
+
+    assert start_state.get_valid_moves()[move]
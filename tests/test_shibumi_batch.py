@@ -0,0 +1,144 @@
+import numpy as np
+import pytest
+
+from shibumi.sandbox.batch import SandboxBatch
+from shibumi.sandbox.game import SandboxState
+from shibumi.shibumi_game_state import MoveType
+from shibumi.spire.batch import SpireBatch
+from shibumi.spire.state import SpireState
+from shibumi.spline.batch import SplineBatch
+from shibumi.spline.game import SplineState
+from tests.random_play import play_random_moves
+
+BATCH_CLASSES = [SplineBatch, SpireBatch, SandboxBatch]
+
+
+def test_from_states():
+    state = SplineState("""\
+  A C E G
+7 . . . . 7
+
+5 . . . . 5
+
+3 . . W . 3
+
+1 B . . . 1
+  A C E G
+""")
+    batch = SplineBatch.from_states([SplineState(), state])
+
+    states = batch.to_states()
+
+    assert len(batch) == 2
+    assert states == [SplineState(), state]
+
+
+def test_spire_from_states():
+    state = SpireState("""\
+  A C E G
+7 . . . . 7
+
+5 . . . . 5
+
+3 . . R . 3
+
+1 B . . . 1
+  A C E G
+>W
+""")
+    batch = SpireBatch.from_states([state])
+
+    state2, = batch.to_states()
+
+    assert state2.display() == state.display()
+
+
+def test_spline_winner():
+    state = SplineState("""\
+  A C E G
+7 . . . . 7
+
+5 . . . . 5
+
+3 . . . . 3
+
+1 B B B B 1
+  A C E G
+""")
+    batch = SplineBatch.from_states([state, SplineState()])
+
+    assert batch.get_winners().tolist() == [state.BLACK, state.NO_PLAYER]
+    assert batch.is_ended().tolist() == [True, False]
+    assert not batch.get_valid_moves()[0].any()
+
+
+def test_no_move():
+    batch = SplineBatch.create(2)
+
+    batch2 = batch.make_moves(np.array([0, SplineBatch.NO_MOVE]))
+
+    assert batch2.pieces[0].sum() == 1
+    assert batch2.pieces[1].sum() == 0
+
+
+def test_sandbox_removal_drops_piece_above():
+    state = SandboxState("""\
+  A C E G
+7 . . . . 7
+
+5 . . . . 5
+
+3 W B . . 3
+
+1 B W . . 1
+  A C E G
+   B D F
+ 6 . . . 6
+
+ 4 . . . 4
+
+ 2 R . . 2
+   B D F
+""")
+    move = state.get_index(0, 0, 0, MoveType.REMOVE)
+    batch = SandboxBatch.from_states([state])
+
+    state2, = batch.make_moves(np.array([move])).to_states()
+
+    assert state2 == state.make_move(move)
+    assert state2.get_piece(0, 0, 0) == state.RED
+
+
+@pytest.mark.parametrize('batch_class', BATCH_CLASSES)
+def test_random_games_match_states(batch_class):
+    """ Put positions from random games in a batch, and compare with states. """
+    states = [state
+              for seed in range(3)
+              for state in play_random_moves(batch_class.state_class(),
+                                             max_moves=40,
+                                             seed=seed)]
+    batch = batch_class.from_states(states)
+    valid_moves = batch.get_valid_moves()
+    winners = batch.get_winners()
+    moves = np.array([np.flatnonzero(board_moves)[-1]
+                      if board_moves.any() else batch.NO_MOVE
+                      for board_moves in valid_moves])
+    expected_states = [state if move == batch.NO_MOVE
+                       else state.make_move(move)
+                       for state, move in zip(states, moves)]
+
+    for i, state in enumerate(states):
+        assert np.array_equal(valid_moves[i], state.get_valid_moves())
+        assert winners[i] == state.get_winner()
+    assert batch.make_moves(moves).to_states() == expected_states
+
+
+@pytest.mark.parametrize('batch_class', [SplineBatch, SpireBatch])
+def test_play_random_games(batch_class):
+    random = np.random.default_rng(0)
+    batch = batch_class.create(10)
+
+    end_batch = batch.play_random_games(random)
+
+    assert end_batch.is_ended().all()
+    assert (end_batch.get_winners() != SplineState.NO_PLAYER).any()
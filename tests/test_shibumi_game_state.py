@@ -0,0 +1,487 @@
+import pickle
+from copy import copy
+
+import numpy as np
+import pytest
+
+from shibumi.margo.state import MargoState
+from shibumi.sandbox.game import SandboxState
+from shibumi.shibumi_game_state import ShibumiGameState, MoveType
+from shibumi.spaiji.game import SpaijiState
+from shibumi.spargo.game import SpargoState
+from shibumi.sparks.state import SparksState
+from shibumi.spire.state import SpireState
+from shibumi.spline.game import SplineState
+from shibumi.sploof.state import SploofState
+from shibumi.spook.state import SpookState
+from tests.random_play import play_random_moves
+
+
+def test_bitboards():
+    board = SplineState("""\
+  A C E G
+7 . . . . 7
+
+5 . . . . 5
+
+3 W . . . 3
+
+1 . B . . 1
+  A C E G
+   B D F
+ 6 . . . 6
+
+ 4 . . . 4
+
+ 2 . . . 2
+   B D F
+""")
+    black_bitboard, white_bitboard = board.bitboards
+
+    assert black_bitboard == 1 << 1
+    assert white_bitboard == 1 << 4
+    assert board.occupied == black_bitboard | white_bitboard
+
+
+def test_levels_round_trip():
+    board = SandboxState("""\
+  A C E G
+7 . . . . 7
+
+5 . . . R 5
+
+3 W W B . 3
+
+1 B W B B 1
+  A C E G
+   B D F
+ 6 . . . 6
+
+ 4 . . . 4
+
+ 2 W R . 2
+   B D F
+""")
+    board2 = SandboxState()
+
+    board2.levels = board.levels
+
+    assert board2 == board
+    assert board2.display() == board.display()
+
+
+def test_set_piece():
+    board = SandboxState()
+    expected_display = """\
+  A C E G
+7 . . . . 7
+
+5 . . . . 5
+
+3 . . . R 3
+
+1 B . . . 1
+  A C E G
+"""
+
+    board.set_piece(0, 0, 0, board.BLACK)
+    board.set_piece(0, 1, 3, board.WHITE)
+    board.set_piece(0, 1, 3, board.RED)
+
+    assert board.display() == expected_display
+    assert board.get_piece(0, 1, 3) == board.RED
+    assert board.get_piece(0, 1, 2) == board.NO_PLAYER
+
+
+def test_clear_piece():
+    board = SandboxState("""\
+  A C E G
+7 . . . . 7
+
+5 . . . . 5
+
+3 . . . . 3
+
+1 B W . . 1
+  A C E G
+""")
+
+    board.set_piece(0, 0, 1, board.NO_PLAYER)
+
+    assert board.get_piece_count(board.WHITE) == 0
+    assert board.get_piece_count(board.BLACK) == 1
+    assert not board.is_occupied(0, 0, 1)
+
+
+def test_is_supported():
+    board = SandboxState("""\
+  A C E G
+7 . . . . 7
+
+5 . . . . 5
+
+3 B W . . 3
+
+1 B W B . 1
+  A C E G
+""")
+
+    assert board.is_supported(0, 3, 3)
+    assert board.is_supported(1, 0, 0)
+    assert not board.is_supported(1, 0, 1)
+
+
+@pytest.mark.parametrize('size', [4, 6])
+def test_fill_supported_moves_matches_each_space(size: int):
+    start_board = SandboxState(size=size)
+    volume = start_board.calculate_volume()
+    for board in play_random_moves(start_board, move_limit=volume):
+        valid_moves = np.zeros(volume, bool)
+        board.fill_supported_moves(valid_moves)
+        expected_moves = [board.is_supported(*board.get_coordinates(i)) and
+                          not board.is_occupied(*board.get_coordinates(i))
+                          for i in range(volume)]
+
+        assert valid_moves.tolist() == expected_moves
+
+
+def test_hash_same_position():
+    start_state = SplineState()
+    state1 = start_state.make_move(0).make_move(1).make_move(2)
+    state2 = start_state.make_move(2).make_move(1).make_move(0)
+    positions = {state1: 'first'}
+
+    assert state1 == state2
+    assert hash(state1) == hash(state2)
+    assert positions[state2] == 'first'
+
+
+def test_hash_different_player():
+    state1 = SpireState("""\
+  A C E G
+7 . . . . 7
+
+5 . . . . 5
+
+3 . . . . 3
+
+1 R B . . 1
+  A C E G
+>W
+""")
+    state2 = SpireState(state1.display().replace('>W', '>B'))
+    state3 = SpireState(state1.display().replace('>W', '>W,R'))
+
+    assert state1 != state2
+    assert state1.board_key == state2.board_key
+    assert hash(state1) != hash(state2)
+    assert hash(state1) != hash(state3)
+
+
+@pytest.mark.parametrize('start_state', [SparksState(),
+                                         SploofState(),
+                                         SpookState(),
+                                         SandboxState()])
+def test_board_key_updates(start_state: ShibumiGameState):
+    topology = start_state.topology
+    for state in play_random_moves(start_state, max_moves=60):
+        assert state.board_key == topology.calculate_board_key(state.bitboards)
+
+
+@pytest.mark.parametrize('start_state', [SpargoState(),
+                                         MargoState(),
+                                         SparksState(),
+                                         SpaijiState(),
+                                         SandboxState()])
+def test_open_positions_carried_forward(start_state: ShibumiGameState,
+                                        monkeypatch):
+    monkeypatch.setattr(ShibumiGameState, 'check_open_positions', True)
+    for state in play_random_moves(start_state, max_moves=80):
+        state.get_open_positions()  # Raises an error if it's out of date.
+
+
+def test_open_positions_checked(monkeypatch):
+    state = SandboxState()
+    state.get_open_positions()
+    state = state.make_move(0)
+    state._open_positions = 0
+
+    assert state.get_open_positions() == 0
+
+    monkeypatch.setattr(ShibumiGameState, 'check_open_positions', True)
+    with pytest.raises(RuntimeError, match='Open positions were 0x0'):
+        state.get_open_positions()
+
+
+@pytest.mark.parametrize('start_state', [SplineState(),
+                                         SpireState(),
+                                         SpargoState(),
+                                         MargoState(),
+                                         SparksState(),
+                                         SpaijiState(),
+                                         SploofState(),
+                                         SpookState(),
+                                         SandboxState()])
+def test_all_attributes_in_slots(start_state: ShibumiGameState):
+    state = start_state.make_move(int(np.argmax(start_state.get_valid_moves())))
+    state.is_ended()
+
+    assert vars(state) == {}
+
+
+def test_copy_shares_board():
+    state1 = SplineState().make_move(0)
+    state2 = copy(state1)
+
+    assert state2 == state1
+    assert state2.bitboards is state1.bitboards
+
+    state2.set_piece(0, 0, 1, state2.WHITE)
+
+    assert state2.bitboards is not state1.bitboards
+    assert state1.get_piece(0, 0, 1) == state1.NO_PLAYER
+
+
+@pytest.mark.parametrize('start_state', [SplineState(),
+                                         SpireState(),
+                                         MargoState(),
+                                         SparksState(),
+                                         SpaijiState(),
+                                         SploofState(),
+                                         SandboxState()])
+def test_move_tables(start_state: ShibumiGameState):
+    move_coordinates = start_state.get_move_coordinates()
+    move_indexes = start_state.get_move_indexes()
+    volume = start_state.calculate_volume()
+
+    assert len(move_coordinates) == len(start_state.get_valid_moves())
+    for move, (section, height, row, column) in enumerate(
+            move_coordinates.tolist()):
+        assert section == move // volume
+        assert start_state.get_coordinates(move % volume) == (height,
+                                                              row,
+                                                              column)
+        assert start_state.get_index(height, row, column) == move % volume
+        assert move_indexes[section, height, row, column] == move
+    assert (move_indexes >= 0).sum() == len(move_coordinates)
+
+
+def test_invalid_coordinates():
+    state = SplineState()
+
+    with pytest.raises(ValueError, match='Invalid move index: 30.'):
+        state.get_coordinates(30)
+
+
+def test_pinned_and_free_masks():
+    for state in play_random_moves(SandboxState(), max_moves=40):
+        pinned_mask = state.get_pinned_mask()
+        free_mask = state.get_free_mask()
+        for position_index, coordinates in enumerate(state.topology.positions):
+            assert pinned_mask[position_index] == state.is_pinned(*coordinates)
+            assert free_mask[position_index] == state.is_free(*coordinates)
+
+
+def test_remove_cascade():
+    state = SandboxState("""\
+  A C E G
+7 . . . . 7
+
+5 . . . . 5
+
+3 B W B . 3
+
+1 W B W . 1
+  A C E G
+   B D F
+ 6 . . . 6
+
+ 4 . . . 4
+
+ 2 . R W 2
+   B D F
+    C E
+  5 . . 5
+
+  3 B . 3
+    C E
+""")
+    expected_display = """\
+  A C E G
+7 . . . . 7
+
+5 . . . . 5
+
+3 B W B . 3
+
+1 W R W . 1
+  A C E G
+   B D F
+ 6 . . . 6
+
+ 4 . . . 4
+
+ 2 . B W 2
+   B D F
+"""
+    state.get_open_positions()
+    expected_cascade = [state.get_position_index(0, 0, 1),
+                        state.get_position_index(1, 0, 1),
+                        state.get_position_index(2, 0, 0)]
+
+    cascade = state.remove(0, 0, 1)
+
+    assert cascade == expected_cascade
+    assert state.display() == expected_display
+    assert state.board_key == state.topology.calculate_board_key(
+        state.bitboards)
+    assert state.get_open_positions() == (state.get_supported_positions() &
+                                          ~state.occupied)
+
+
+def test_remove_without_cascade():
+    state = SandboxState().make_move(0)
+
+    cascade = state.remove(0, 0, 0)
+
+    assert cascade == [0]
+    assert state.occupied == 0
+
+
+@pytest.mark.parametrize('start_state', [SplineState(),
+                                         SpireState(),
+                                         MargoState(),
+                                         SparksState(),
+                                         SpaijiState(),
+                                         SploofState(),
+                                         SpookState(),
+                                         SandboxState()])
+def test_parse_valid_moves(start_state: ShibumiGameState):
+    """ Every valid move in the first section can be parsed back. """
+    volume = start_state.calculate_volume()
+    for state in play_random_moves(start_state, max_moves=60):
+        valid_moves = state.get_valid_moves()
+        for move in np.flatnonzero(valid_moves[:volume]).tolist():
+            text = state.display_coordinates(*state.get_coordinates(move))
+
+            assert state.get_move_index(text[:-1], text[-1]) == move
+
+
+def test_parse_moves():
+    state = SpargoState()
+    expected_display = """\
+  A C E G
+7 . . . . 7
+
+5 . . . . 5
+
+3 B W . . 3
+
+1 B W W . 1
+  A C E G
+   B D F
+ 6 . . . 6
+
+ 4 . . . 4
+
+ 2 B . . 2
+   B D F
+>B
+"""
+
+    moves = state.parse_moves(['1A', '1C', '3A', '3C', '2B', '1E'])
+    for move in moves:
+        state = state.make_move(move)
+
+    assert moves == [0, 1, 4, 5, 16, 2]
+    assert state.display() == expected_display
+
+
+def test_parse_moves_checked():
+    state = SpireState()
+
+    # Can't match two of your own colour in a square.
+    with pytest.raises(ValueError, match='Invalid move: 3A.'):
+        state.parse_moves(['1A', '1E', '1C', '1G', '3A'])
+
+    assert len(state.parse_moves(['1A', '1E', '1C', '1G', '3A'],
+                                 is_checked=False)) == 5
+
+
+@pytest.mark.parametrize('start_state', [SplineState(),
+                                         SpireState(),
+                                         SpargoState(),
+                                         MargoState(),
+                                         SparksState(),
+                                         SpaijiState(),
+                                         SploofState(),
+                                         SpookState(),
+                                         SandboxState()])
+def test_bytes_round_trip(start_state: ShibumiGameState):
+    for state in play_random_moves(start_state, max_moves=40):
+        data = state.to_bytes()
+        state2 = type(state).from_bytes(data)
+        state3 = pickle.loads(pickle.dumps(state))
+
+        assert state2 == state
+        assert state3 == state
+        assert state2.display() == state.display()
+        assert state2.zobrist_key == state.zobrist_key
+        assert state2.get_move_count() == state.get_move_count()
+        assert np.array_equal(state2.get_valid_moves(),
+                              state.get_valid_moves())
+
+
+def test_bytes_fixed_size():
+    state = SpireState()
+    state2 = state.make_move(0).make_move(1)
+
+    assert len(state.to_bytes()) == len(state2.to_bytes()) == 19
+
+
+def test_bytes_keep_spargo_history():
+    state = SpargoState().make_move(0).make_move(1)
+
+    state2 = SpargoState.from_bytes(state.to_bytes())
+
+    assert list(state2.history) == list(state.history)
+
+
+def test_bytes_unknown_version():
+    data = bytearray(SplineState().to_bytes())
+    data[0] += 1
+
+    with pytest.raises(ValueError, match='Unknown serial version: 2.'):
+        SplineState.from_bytes(bytes(data))
+
+
+def test_cached_results():
+    state = SpireState().make_move(0)
+
+    valid_moves = state.get_valid_moves()
+
+    assert state.get_valid_moves() is valid_moves
+    assert not valid_moves.flags.writeable
+    assert not state.is_ended()
+    assert state.get_winner() == state.NO_PLAYER
+
+
+def test_cached_results_not_copied():
+    state1 = SplineState().make_move(0)
+    valid_moves1 = state1.get_valid_moves()
+
+    state2 = state1.make_move(1)
+    valid_moves2 = state2.get_valid_moves()
+
+    assert valid_moves1[1]
+    assert not valid_moves2[1]
+
+
+def test_changes_clear_cached_results():
+    state = SandboxState()
+    move = state.get_index(0, 0, 0, MoveType.REMOVE)
+    assert not state.get_valid_moves()[move]
+
+    state.set_piece(0, 0, 0, state.BLACK)
+
+    assert state.get_valid_moves()[move]
@@ -0,0 +1,106 @@
+import pytest
+
+from shibumi.sandbox.game import SandboxState
+from shibumi.shibumi_topology import ShibumiTopology
+from shibumi.spargo.game import SpargoState
+from shibumi.spline.game import SplineState
+from tests.random_play import play_random_moves
+
+
+def test_shared_by_size():
+    state1 = SpargoState()
+    state2 = SplineState()
+    state3 = SandboxState(size=6)
+
+    assert state1.topology is state2.topology
+    assert state1.topology is not state3.topology
+    assert state3.topology is ShibumiTopology.get(6)
+
+
+def test_supporting():
+    topology = ShibumiTopology.get(4)
+    position_index = topology.get_position_index(1, 2, 0)
+    expected_supporting = [topology.get_position_index(0, row, column)
+                           for row in (2, 3)
+                           for column in (0, 1)]
+
+    assert topology.supporting[position_index].tolist() == expected_supporting
+
+
+def test_supported_on_edge():
+    topology = ShibumiTopology.get(4)
+    position_index = topology.get_position_index(0, 0, 3)
+    expected_supported = [topology.get_position_index(1, 0, 2),
+                          topology.volume,
+                          topology.volume,
+                          topology.volume]
+
+    assert topology.supported[position_index].tolist() == expected_supported
+
+
+def test_neighbours_cut_off_by_overpass():
+    state = SandboxState("""\
+  A C E G
+7 . . . . 7
+
+5 B B B . 5
+
+3 B W W . 3
+
+1 B B B . 1
+  A C E G
+   B D F
+ 6 . . . 6
+
+ 4 . R . 4
+
+ 2 . R . 2
+   B D F
+""")
+    topology = state.topology
+    start = topology.get_position_index(0, 1, 1)
+    cut_off = topology.get_position_index(0, 1, 2)
+
+    neighbours = topology.find_neighbours(state.get_occupancy(), start)
+
+    assert cut_off in topology.neighbours[start]
+    assert cut_off not in neighbours
+    assert (0, 1, 2) not in set(state.find_neighbours(0, 1, 1))
+
+
+def test_neighbours_cut_off_by_cover():
+    state = SandboxState()
+    levels = state.levels
+    levels[0] = 1  # Fill the whole board with black.
+    state.levels = levels
+    topology = state.topology
+    start = topology.get_position_index(0, 1, 1)
+    covered = topology.get_position_index(1, 1, 1)
+    uncovered = topology.get_position_index(1, 0, 0)
+
+    neighbours = topology.find_neighbours(state.get_occupancy(), start)
+
+    assert covered in topology.neighbours[start]
+    assert covered not in neighbours
+    assert uncovered in neighbours
+
+
+@pytest.mark.parametrize('size', [4, 6])
+def test_vectorized_neighbours_match(size: int):
+    start_state = SandboxState(size=size)
+    topology = start_state.topology
+    volume = topology.volume
+    for state in play_random_moves(start_state, move_limit=volume):
+        occupancy = state.get_occupancy()
+        is_blocked = topology.find_blocked_neighbours(occupancy)
+        for position_index in range(volume):
+            neighbours = topology.neighbours[position_index]
+            expected_neighbours = neighbours[(neighbours != volume) &
+                                             ~is_blocked[position_index]]
+            mask_neighbours = topology.find_neighbours_by_mask(state.occupied,
+                                                               position_index)
+            vector_neighbours = topology.find_neighbours(occupancy,
+                                                         position_index)
+
+            assert list(mask_neighbours) == expected_neighbours.tolist()
+            assert vector_neighbours.tolist() == expected_neighbours.tolist()
@@ -0,0 +1,142 @@
+import numpy as np
+import pytest
+
+from shibumi.margo.state import MargoState
+from shibumi.sandbox.game import SandboxState
+from shibumi.shibumi_game_state import ShibumiGameState
+from shibumi.spaiji.game import SpaijiState
+from shibumi.spargo.game import SpargoState
+from shibumi.sparks.state import SparksState
+from shibumi.spire.state import SpireState
+from shibumi.spline.game import SplineState
+from shibumi.sploof.state import SploofState
+from shibumi.spook.state import SpookState
+from shibumi.symmetry import BoardSymmetries
+from tests.random_play import play_random_moves
+
+
+def test_rotate():
+    state = SplineState("""\
+  A C E G
+7 . . . . 7
+
+5 . . . . 5
+
+3 W . . . 3
+
+1 B B . . 1
+  A C E G
+   B D F
+ 6 . . . 6
+
+ 4 . . . 4
+
+ 2 W . . 2
+   B D F
+""")
+    expected_display = """\
+  A C E G
+7 . . . . 7
+
+5 . . . . 5
+
+3 . . . B 3
+
+1 . . W B 1
+  A C E G
+   B D F
+ 6 . . . 6
+
+ 4 . . . 4
+
+ 2 . . W 2
+   B D F
+"""
+    symmetries = BoardSymmetries.get(4)
+
+    state2 = symmetries.transform_state(state, symmetry=1)
+
+    assert state2.display() == expected_display
+    assert state2.board_key == state2.topology.calculate_board_key(
+        state2.bitboards)
+
+
+@pytest.mark.parametrize('size', [1, 4, 6])
+def test_maps_keep_support(size):
+    symmetries = BoardSymmetries.get(size)
+    topology = symmetries.topology
+    volume = topology.volume
+    for symmetry, position_map in enumerate(symmetries.position_maps):
+        padded_map = np.append(position_map, volume)
+        inverse_map = symmetries.position_maps[symmetries.inverses[symmetry]]
+
+        assert sorted(position_map) == list(range(volume))
+        assert (inverse_map[position_map] == np.arange(volume)).all()
+        for position_index in range(volume):
+            new_index = position_map[position_index]
+            assert (sorted(padded_map[topology.supporting[position_index]]) ==
+                    sorted(topology.supporting[new_index]))
+
+
+def test_canonical_key_shared():
+    state = SpireState().make_move(0).make_move(1).make_move(6)
+    symmetries = BoardSymmetries.get(state.size)
+    other_state = SpireState().make_move(0).make_move(1).make_move(7)
+
+    _, expected_key = symmetries.find_canonical(state)
+    for symmetry in range(symmetries.SYMMETRY_COUNT):
+        transformed_state = symmetries.transform_state(state, symmetry)
+        canonical_symmetry, key = symmetries.find_canonical(transformed_state)
+        canonical_state = symmetries.transform_state(transformed_state,
+                                                     canonical_symmetry)
+
+        assert key == expected_key
+        assert canonical_state.zobrist_key == key
+    assert symmetries.find_canonical(other_state)[1] != expected_key
+
+
+def test_transform_policy():
+    symmetries = BoardSymmetries.get(4)
+    policy = np.arange(60) / 60
+    move_maps = symmetries.find_move_maps(60)
+
+    new_policy = symmetries.transform_moves(policy, symmetry=2)
+
+    assert new_policy[move_maps[2, 0]] == policy[0]
+    assert new_policy[move_maps[2, 31]] == policy[31]
+    assert sorted(new_policy) == sorted(policy)
+
+
+def test_extra_moves_not_moved():
+    symmetries = BoardSymmetries.get(4)
+
+    move_maps = symmetries.find_move_maps(31)
+
+    assert (move_maps[:, 30] == 30).all()
+
+
+@pytest.mark.parametrize('start_state', [SplineState(),
+                                         SpireState(),
+                                         SpargoState(),
+                                         MargoState(),
+                                         SparksState(),
+                                         SpaijiState(),
+                                         SploofState(),
+                                         SpookState(),
+                                         SandboxState()])
+def test_transformed_states_play_the_same(start_state: ShibumiGameState):
+    symmetries = BoardSymmetries.get(start_state.size)
+    for state in play_random_moves(start_state, max_moves=30):
+        valid_moves = state.get_valid_moves()
+        for symmetry in range(symmetries.SYMMETRY_COUNT):
+            transformed_state = symmetries.transform_state(state, symmetry)
+            expected_moves = symmetries.transform_moves(valid_moves, symmetry)
+            transformed_moves = transformed_state.get_valid_moves()
+
+            if isinstance(state, SpargoState):
+                # History starts over, so repeated positions are allowed.
+                assert not (expected_moves & ~transformed_moves).any()
+            else:
+                assert np.array_equal(transformed_moves, expected_moves)
+            assert (transformed_state.transform_extra_state(range(100)) ==
+                    transformed_state.get_extra_state())
@@ -0,0 +1,177 @@
+import numpy as np
+import pytest
+
+from shibumi.spargo.game import SpargoState
+from shibumi.spire.state import SpireState
+from shibumi.spline.game import SplineState
+from shibumi.transposition_table import (TranspositionTable,
+                                         TranspositionSearchManager,
+                                         TranspositionSearchNode)
+from zero_play.mcts_player import MctsPlayer
+from zero_play.playout import Playout
+
+
+def test_cached_valid_moves():
+    table = TranspositionTable()
+    start_state = SplineState()
+    state1 = start_state.make_move(0).make_move(1).make_move(2)
+    state2 = start_state.make_move(2).make_move(1).make_move(0)
+
+    valid_moves1 = table.get_valid_moves(state1)
+    valid_moves2 = table.get_valid_moves(state2)
+
+    assert valid_moves2 is valid_moves1
+    assert np.array_equal(valid_moves1, state1.get_valid_moves())
+    assert not valid_moves1.flags.writeable
+    assert len(table) == 1
+    assert table.misses == 1
+    assert table.hits == 1
+
+
+def test_cached_winner():
+    table = TranspositionTable()
+    state = SplineState("""\
+  A C E G
+7 . . . . 7
+
+5 . . . . 5
+
+3 . . . . 3
+
+1 B B B B 1
+  A C E G
+""")
+
+    assert table.is_ended(state)
+    assert table.get_winner(state) == state.BLACK
+    assert table.hits == 1
+
+
+def test_only_probes_counted():
+    table = TranspositionTable()
+    start_state = SplineState()
+    state1 = start_state.make_move(0)
+    TranspositionSearchNode(start_state, table)
+    table.record_value(start_state, 1.0)
+
+    table.get_valid_moves(start_state)  # Hit: the entry was recorded.
+    table.is_ended(state1)  # Miss
+    table.get_winner(state1)  # Hit
+
+    assert table.hits == 2
+    assert table.misses == 1
+    assert table.get_summary() == '2 positions, 2 hits, 1 misses (67% hit rate)'
+
+
+def test_history_in_key():
+    """ After a capture, the ko rule stops black from capturing back. """
+    state1 = SpargoState("""\
+  A C E G
+7 . . . . 7
+
+5 . . . . 5
+
+3 . W B . 3
+
+1 W B . B 1
+  A C E G
+>W
+""")
+    state2 = state1.make_move(2)
+    fresh_state2 = SpargoState(state2.display())
+    table = TranspositionTable()
+    assert hash(fresh_state2) == hash(state2)
+    TranspositionSearchNode(fresh_state2, table).find_all_children()
+    node = TranspositionSearchNode(state2, table)
+
+    children = node.find_all_children()  # Would play the illegal move.
+
+    assert fresh_state2.get_valid_moves()[1]
+    assert 1 not in [child.move for child in children]
+
+
+def test_evicts_least_recently_used():
+    table = TranspositionTable(max_size=2)
+    start_state = SplineState()
+    state1 = start_state.make_move(0)
+    state2 = start_state.make_move(1)
+    state3 = start_state.make_move(2)
+    table.record_value(state1, 1.0)
+    table.record_value(state2, 1.0)
+    table.record_value(state1, 1.0)  # Now state2 is least recently used.
+
+    table.record_value(state3, 1.0)
+
+    assert len(table) == 2
+    assert table.find_entry(state1).value_count == 2
+    assert table.find_entry(state2).value_count == 0
+
+
+def test_clear():
+    table = TranspositionTable()
+    table.get_valid_moves(SplineState())
+
+    table.clear()
+
+    assert len(table) == 0
+    assert table.misses == 0
+
+
+def test_node_starts_with_transposed_values():
+    table = TranspositionTable()
+    start_state = SplineState()
+    node = TranspositionSearchNode(start_state, table)
+    for move in (0, 1, 2):
+        node = TranspositionSearchNode(node.game_state.make_move(move),
+                                       table,
+                                       node)
+    node.record_value(0.5)  # Good for white, who plays next.
+
+    transposed_node = TranspositionSearchNode(start_state, table)
+    for move in (2, 1, 0):
+        transposed_node = TranspositionSearchNode(
+            transposed_node.game_state.make_move(move),
+            table,
+            transposed_node)
+
+    assert transposed_node.value_count == 1
+    assert transposed_node.average_value == node.average_value == -0.5
+
+
+def test_children_use_table():
+    table = TranspositionTable()
+    start_state = SpireState()
+    start_node = TranspositionSearchNode(start_state, table)
+    expected_count = start_state.get_valid_moves().sum()
+
+    children = start_node.find_all_children()
+
+    assert len(children) == expected_count
+    assert all(isinstance(child, TranspositionSearchNode) for child in children)
+    assert len(table) == expected_count + 1
+
+
+@pytest.mark.parametrize('start_state', [SpireState(), SplineState()])
+def test_search(start_state):
+    table = TranspositionTable()
+    player = MctsPlayer(start_state, iteration_count=40, heuristic=Playout())
+    search_manager = TranspositionSearchManager.install(player, table)
+
+    move = player.choose_move(start_state)
+
+    assert player.search_manager is search_manager
+    assert start_state.get_valid_moves()[move]
+    assert table.hits > 0
+    assert isinstance(search_manager.current_node, TranspositionSearchNode)
+
+
+def test_find_unknown_node():
+    table = TranspositionTable()
+    start_state = SplineState()
+    search_manager = TranspositionSearchManager(start_state, Playout(), table)
+    later_state = start_state.make_move(0).make_move(1)
+
+    search_manager.find_node(later_state)
+
+    assert isinstance(search_manager.current_node, TranspositionSearchNode)
+    assert search_manager.current_node.game_state == later_state